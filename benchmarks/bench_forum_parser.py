@@ -0,0 +1,168 @@
+"""
+Микро-бенчмарк бэкендов разбора страниц форума (forum_parser.PARSERS).
+
+Для каждой страницы-фикстуры и каждого доступного бэкенда измеряются:
+  * время разбора (среднее и медиана по --rounds повторам)
+  * пик памяти Python-кучи (tracemalloc) — C-парсеры выделяют память мимо
+    tracemalloc, поэтому дополнительно выводится прирост ru_maxrss
+    (каждый бэкенд запускается в отдельном процессе)
+Результаты всех бэкендов сверяются с BeautifulSoup (ID и тексты сообщений).
+
+Фикстуры: *.html из каталога --fixtures (сохранённые страницы тем, см.
+--save-fixtures). Без --fixtures используются синтетические страницы в
+разметке XenForo 2 (20 сообщений, цитаты, подписи, навигация и тяжёлый <head>).
+
+Запуск:
+  python benchmarks/bench_forum_parser.py [--fixtures DIR] [--rounds 20]
+  python benchmarks/bench_forum_parser.py --save-fixtures DIR URL [URL ...]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import forum_parser  # noqa: E402
+
+
+def synthetic_page(page: int, total: int, posts: int = 20, words: int = 400) -> bytes:
+    """Страница темы в разметке XenForo 2"""
+    head = "<script>" + "var x = {'k': 'v'};" * 4000 + "</script>" + "<style>" + ".c{color:red}" * 4000 + "</style>"
+    nav = "<nav class='pageNavWrapper'><div class='pageNav'></div></nav><nav class='pageNav'>" + "".join(
+        f"<a href='/threads/t.1/page-{i}' class='pageNav-page'>{i}</a>" for i in range(2, total + 1)
+    ) + "</nav>"
+    articles = []
+    for n in range(posts):
+        pid = page * 1000 + n
+        text = " ".join(f"слово{i}" for i in range(words))
+        articles.append(
+            f"<article class='message message--post js-post' data-author='user{n}' data-content='post-{pid}' id='js-post-{pid}'>"
+            f"<div class='message-inner'><div class='message-cell message-cell--user'>"
+            f"<section class='message-user'><div class='message-avatar'><img src='/a/{n}.jpg' alt='u'></div>"
+            f"<h4 class='message-name'><a href='/members/user{n}.{n}/'>user{n}</a></h4></section></div>"
+            f"<div class='message-cell message-cell--main'><div class='message-main'>"
+            f"<header class='message-attribution'><a href='/threads/t.1/post-{pid}'>#{pid}</a></header>"
+            f"<div class='message-content js-messageContent'><div class='message-userContent lbContainer'>"
+            f"<article class='message-body js-selectToQuote'><div class='bbWrapper'>"
+            f"<blockquote class='bbCodeBlock bbCodeBlock--quote'><div class='bbCodeBlock-content'>"
+            f"<div class='bbCodeBlock-expandContent'>Цитата {n}</div></div></blockquote>"
+            f"<b>Постановление №{pid}</b><br>{text}<br><ul><li>пункт 1</li><li>пункт 2</li></ul></div>"
+            f"</article></div></div>"
+            f"<aside class='message-signature'><div class='bbWrapper'>Подпись {n}</div></aside>"
+            f"<footer class='message-footer'><div class='reactionsBar'>"
+            + "".join(f"<a href='/r/{i}'><img src='/e/{i}.png'></a>" for i in range(10))
+            + "</div></footer></div></div></div></article>"
+        )
+    html = (
+        f"<!DOCTYPE html><html data-csrf='1700000000,abc'><head><meta charset='utf-8'>{head}</head><body>"
+        f"<div class='p-body'>{nav}<div class='block-body js-replyNewMessageContainer'>{''.join(articles)}</div>"
+        f"{nav}</div><footer class='p-footer'>" + "<a href='/help'>x</a>" * 200 + "</footer></body></html>"
+    )
+    return html.encode("utf-8")
+
+
+def load_fixtures(directory: str | None) -> dict:
+    if not directory:
+        return {
+            "synthetic-p1 (1 стр.)": synthetic_page(1, 1),
+            "synthetic-p40 (40 стр.)": synthetic_page(40, 40),
+        }
+    fixtures = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".html"):
+            with open(os.path.join(directory, name), "rb") as f:
+                fixtures[name] = f.read()
+    return fixtures
+
+
+async def save_fixtures(directory: str, urls: list):
+    import handlers
+
+    os.makedirs(directory, exist_ok=True)
+    session = handlers.create_http_session()
+    try:
+        for i, url in enumerate(urls, 1):
+            async with session.get(url, headers=handlers.FORUM_HEADERS, timeout=handlers.FORUM_TIMEOUT) as resp:
+                body = await resp.read()
+            path = os.path.join(directory, f"page{i:02d}.html")
+            with open(path, "wb") as f:
+                f.write(body)
+            print(f"{url} -> {path} ({len(body) // 1024} KB)")
+    finally:
+        await session.close()
+
+
+def measure_backend(name: str, fixtures: dict, rounds: int) -> dict:
+    """Выполняется в отдельном процессе, чтобы ru_maxrss относился только к этому бэкенду"""
+    parse = forum_parser.PARSERS[name]
+    pages = {key: body.decode("utf-8", errors="replace") for key, body in fixtures.items()}
+    parse(next(iter(pages.values())))  # импорт модулей бэкенда и прогрев
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results = {}
+    for key, html in pages.items():
+        timings = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            info = parse(html)
+            timings.append(time.perf_counter() - start)
+        tracemalloc.start()
+        parse(html)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[key] = {
+            "mean": statistics.mean(timings),
+            "median": statistics.median(timings),
+            "peak": peak,
+            "posts": [(p["post_id"], p["text"]) for p in info["posts"]],
+            "last_page": info["last_page"],
+        }
+    rss_delta = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_rss
+    return {"pages": results, "rss_delta_kb": rss_delta}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", help="каталог с сохранёнными страницами *.html")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--save-fixtures", metavar="DIR", help="скачать страницы URL в каталог и выйти")
+    parser.add_argument("urls", nargs="*")
+    args = parser.parse_args()
+
+    if args.save_fixtures:
+        asyncio.run(save_fixtures(args.save_fixtures, args.urls))
+        return
+
+    fixtures = load_fixtures(args.fixtures)
+    backends = [name for name in forum_parser.PARSERS if forum_parser.is_available(name)]
+    print(f"rounds={args.rounds} бэкенды: {', '.join(backends)} (auto -> {forum_parser.resolve_parser('auto')})")
+
+    results = {}
+    ctx = multiprocessing.get_context("spawn")
+    for name in backends:
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            results[name] = pool.submit(measure_backend, name, fixtures, args.rounds).result()
+
+    for key, body in fixtures.items():
+        print(f"\n{key}: {len(body) // 1024} KB")
+        reference = results["bs4"]["pages"][key] if "bs4" in results else None
+        for name in backends:
+            r = results[name]["pages"][key]
+            same = "—" if reference is None else ("да" if (r["posts"], r["last_page"]) == (reference["posts"], reference["last_page"]) else "НЕТ")
+            print(f"  {name:<11} mean={r['mean'] * 1000:8.2f} ms  median={r['median'] * 1000:8.2f} ms  "
+                  f"peak_py={r['peak'] / 1024:8.0f} KB  posts={len(r['posts']):3d}  совпадает с bs4: {same}")
+
+    print("\nПрирост ru_maxrss по бэкендам (все фикстуры):")
+    for name in backends:
+        print(f"  {name:<11} {results[name]['rss_delta_kb']:8d} KB")
+
+
+if __name__ == "__main__":
+    main()
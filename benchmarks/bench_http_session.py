@@ -0,0 +1,108 @@
+"""
+Бенчмарк исходящих HTTP-запросов: новая сессия на каждый вызов против общей
+сессии с пулом соединений (handlers.create_http_session).
+
+Поднимает локальный stub-сервер (aiohttp.web) со страницей форума и JSON-ответом
+API и моделирует «тики» опроса: на каждом тике выполняется несколько запросов,
+как при проверке темы форума (2 страницы) и poll_twitch/poll_youtube (по одному API-запросу).
+
+По умолчанию сервер работает по HTTP, поэтому экономия на TLS-рукопожатиях
+и DNS здесь не видна — на реальных хостах разница будет больше.
+
+Запуск: python benchmarks/bench_http_session.py [--ticks 200] [--page-kb 300]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+import handlers  # noqa: E402
+
+
+async def start_stub_server(page_kb: int):
+    """Локальный сервер: /threads/... отдаёт HTML, /api отдаёт JSON"""
+    page = ("<html><body>" + "<article class='message'>x</article>" * (page_kb * 1024 // 36) + "</body></html>").encode()
+
+    async def thread(request):
+        return web.Response(body=page, content_type="text/html")
+
+    async def api(request):
+        return web.json_response({"data": [{"id": "1", "user_login": "stub", "title": "stub"}]})
+
+    app = web.Application()
+    app.router.add_get("/threads/{name}", thread)
+    app.router.add_get("/api", api)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def tick(session, base):
+    """Один тик: две страницы форума и два запроса к API"""
+    for path in ("/threads/t", "/threads/t/page-2"):
+        async with session.get(base + path) as resp:
+            await resp.read()
+    for _ in range(2):
+        async with session.get(base + "/api") as resp:
+            await resp.json()
+
+
+async def bench_per_call(base, ticks):
+    timings = []
+    for _ in range(ticks):
+        start = time.perf_counter()
+        # Прежнее поведение: новая сессия (и новые соединения) на каждый вызов
+        async with aiohttp.ClientSession() as session:
+            await tick(session, base)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def bench_shared(base, ticks):
+    timings = []
+    session = handlers.create_http_session()
+    try:
+        for _ in range(ticks):
+            start = time.perf_counter()
+            await tick(session, base)
+            timings.append(time.perf_counter() - start)
+    finally:
+        await session.close()
+    return timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{name:<22} mean={statistics.mean(timings) * 1000:7.2f} ms  "
+          f"median={statistics.median(timings) * 1000:7.2f} ms  p95={p95 * 1000:7.2f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ticks", type=int, default=200)
+    parser.add_argument("--page-kb", type=int, default=300)
+    args = parser.parse_args()
+
+    runner, base = await start_stub_server(args.page_kb)
+    try:
+        print(f"ticks={args.ticks} page={args.page_kb} KB server={base}")
+        report("session per call", await bench_per_call(base, args.ticks))
+        report("shared pooled session", await bench_shared(base, args.ticks))
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+"""
+Бенчмарк записи файлов состояния (notified.json) на 10k отслеживаемых записей.
+
+Сравнивает:
+  * legacy   — прежний save_json: open("w") + json.dump(indent=2) прямо в event loop
+  * atomic   — save_json: временный файл + fsync + rename (синхронно)
+  * offloop  — async_save_json: сериализация в loop, запись и fsync в пуле потоков
+
+Для каждого варианта выводится средняя/максимальная задержка записи и
+максимальная блокировка event loop, измеренная фоновым «тикером».
+
+Запуск: python benchmarks/bench_state_persistence.py [--entries 10000] [--rounds 20]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import handlers  # noqa: E402
+
+
+def make_state(entries: int) -> dict:
+    """Состояние с entries записями, похожее на реальный notified.json"""
+    return {
+        "twitch": {f"streamer_{i:05d}": str(40000000000 + i) for i in range(entries)},
+        "youtube": {f"UC{i:022d}": f"vid{i:08d}" for i in range(entries)},
+        "forum": {"last_post_id": "123456"},
+        "orders": {"last_order_id": "654321"},
+    }
+
+
+def legacy_save_json(file_path, data):
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+async def measure(name: str, write, rounds: int):
+    """Запускает write() rounds раз, параллельно измеряя задержку тиков event loop"""
+    interval = 0.001
+    max_lag = 0.0
+    stop = False
+
+    async def ticker():
+        nonlocal max_lag
+        while not stop:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            max_lag = max(max_lag, time.perf_counter() - start - interval)
+
+    tick_task = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    latencies = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await write()
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.005)
+    stop = True
+    await tick_task
+
+    print(f"{name:<22} mean={statistics.mean(latencies) * 1000:8.2f} ms  "
+          f"max={max(latencies) * 1000:8.2f} ms  loop_block_max={max_lag * 1000:8.2f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    data = make_state(args.entries)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "notified.json")
+
+        async def legacy():
+            legacy_save_json(path, data)
+
+        async def atomic_indent():
+            handlers.save_json(path, data, compact=False)
+
+        async def atomic_compact():
+            handlers.save_json(path, data, compact=True)
+
+        async def offloop_indent():
+            await handlers.async_save_json(path, data, compact=False)
+
+        async def offloop_compact():
+            await handlers.async_save_json(path, data, compact=True)
+
+        print(f"entries={args.entries} rounds={args.rounds}")
+        await measure("legacy (indent=2)", legacy, args.rounds)
+        print(f"  size: {os.path.getsize(path)} bytes")
+        await measure("atomic (indent=2)", atomic_indent, args.rounds)
+        await measure("atomic (compact)", atomic_compact, args.rounds)
+        print(f"  size: {os.path.getsize(path)} bytes")
+        await measure("offloop (indent=2)", offloop_indent, args.rounds)
+        await measure("offloop (compact)", offloop_compact, args.rounds)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,154 @@
+"""
+Бенчмарк опроса стримов Twitch против локального фейкового Helix.
+
+Сравнивает прежний последовательный обход пачек по 100 логинов с
+параллельным handlers._fetch_twitch_streams (TWITCH_CONCURRENCY запросов,
+token bucket по заголовкам Ratelimit-*).
+
+Фейковый сервер отвечает с задержкой --latency-ms, ведёт бакет на
+--bucket запросов в минуту и отдаёт заголовки Ratelimit-Limit/Remaining/Reset
+(при исчерпании — 429). С --fail-every N каждая N-я пачка один раз
+отвечает 500 — видно, что остальные результаты сохраняются.
+
+Запуск: python benchmarks/bench_twitch_streams.py [--logins 2000] [--latency-ms 150]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web  # noqa: E402
+
+os.environ.setdefault("TWITCH_CLIENT_ID", "bench")
+os.environ.setdefault("TWITCH_CLIENT_SECRET", "bench")
+
+import handlers  # noqa: E402
+
+
+class FakeHelix:
+    def __init__(self, latency: float, bucket: int, fail_every: int, live_ratio: float):
+        self.latency = latency
+        self.bucket = bucket
+        self.tokens = float(bucket)
+        self.updated = time.monotonic()
+        self.fail_every = fail_every
+        self.live_ratio = live_ratio
+        self.requests = 0
+        self.throttled = 0
+        self.failed_once = set()
+
+    def _take(self):
+        now = time.monotonic()
+        self.tokens = min(self.bucket, self.tokens + (now - self.updated) * self.bucket / 60)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def _headers(self):
+        missing = self.bucket - self.tokens
+        reset = int(time.time() + missing * 60 / self.bucket) + 1
+        return {
+            "Ratelimit-Limit": str(self.bucket),
+            "Ratelimit-Remaining": str(int(self.tokens)),
+            "Ratelimit-Reset": str(reset),
+        }
+
+    async def token(self, request):
+        return web.json_response({"access_token": "fake", "expires_in": 3600, "token_type": "bearer"})
+
+    async def streams(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        if not self._take():
+            self.throttled += 1
+            return web.json_response({"status": 429}, status=429, headers=self._headers())
+        logins = request.query.getall("user_login", [])
+        key = logins[0] if logins else ""
+        if self.fail_every and key not in self.failed_once:
+            index = int(key.split("_")[-1]) // 100 if "_" in key else 0
+            if index % self.fail_every == 0:
+                self.failed_once.add(key)
+                return web.json_response({"status": 500}, status=500, headers=self._headers())
+        step = max(1, int(1 / self.live_ratio)) if self.live_ratio else 0
+        data = [
+            {"id": f"s{login}", "user_login": login, "title": "stream"}
+            for i, login in enumerate(logins)
+            if step and i % step == 0
+        ]
+        return web.json_response({"data": data[:int(request.query.get("first", "20"))]}, headers=self._headers())
+
+
+async def start_server(fake: FakeHelix):
+    app = web.Application()
+    app.router.add_post("/oauth2/token", fake.token)
+    app.router.add_get("/helix/streams", fake.streams)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def legacy_fetch(session, logins):
+    """Прежний алгоритм: пачки строго по очереди, без учёта лимитов"""
+    headers = await handlers._twitch_headers(session)
+    streams = []
+    for i in range(0, len(logins), 100):
+        chunk = logins[i:i + 100]
+        params = "&".join(f"user_login={login}" for login in chunk)
+        async with session.get(f"{handlers.TWITCH_API_BASE}/streams?{params}", headers=headers) as resp:
+            if resp.status != 200:
+                continue
+            data = await resp.json()
+        streams.extend(data.get("data", []))
+    return streams
+
+
+async def run(name, fetch, session, logins, rounds):
+    timings = []
+    found = 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        found = len(await fetch(session, logins))
+        timings.append(time.perf_counter() - start)
+    print(f"{name:<12} mean={statistics.mean(timings) * 1000:8.1f} ms  max={max(timings) * 1000:8.1f} ms  стримов={found}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--bucket", type=int, default=800)
+    parser.add_argument("--fail-every", type=int, default=0)
+    parser.add_argument("--live-ratio", type=float, default=0.3)
+    args = parser.parse_args()
+
+    fake = FakeHelix(args.latency_ms / 1000, args.bucket, args.fail_every, args.live_ratio)
+    runner, base = await start_server(fake)
+    handlers.TWITCH_API_BASE = f"{base}/helix"
+    handlers.TWITCH_ID_BASE = base
+    session = handlers.create_http_session()
+    logins = [f"streamer_{i}" for i in range(args.logins)]
+    try:
+        print(f"logins={args.logins} latency={args.latency_ms} ms bucket={args.bucket}/мин "
+              f"concurrency={handlers.TWITCH_CONCURRENCY}")
+        await run("serial", legacy_fetch, session, logins, args.rounds)
+        fake.failed_once.clear()
+        await run("concurrent", handlers._fetch_twitch_streams, session, logins, args.rounds)
+        print(f"запросов к серверу: {fake.requests}, отклонено по лимиту: {fake.throttled}")
+    finally:
+        await session.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,171 @@
+"""
+Бенчмарк тика опроса YouTube (handlers._poll_youtube) против локального
+фейкового YouTube Data API.
+
+Сравнивает последовательный обход каналов (YOUTUBE_CONCURRENCY=1, как раньше)
+с параллельным (--concurrency). Сервер отвечает с задержкой --latency-ms и
+поддерживает channels.list / videos.list по 50 ID, playlistItems.list с ETag
+и Atom-ленту. На каждом тике у --new-ratio каналов появляется новое видео;
+«отправка» в Discord моделируется задержкой --send-ms.
+
+Выводится время тика по этапам (youtube_poll_stats), число запросов к
+каждому методу API и израсходованная квота.
+
+Запуск: python benchmarks/bench_youtube_poll.py [--channels 500] [--latency-ms 80] [--backend playlist]
+"""
+
+import argparse
+import asyncio
+import collections
+import os
+import statistics
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web  # noqa: E402
+
+
+class FakeYouTube:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = collections.Counter()
+        self.latest = {}
+
+    def _video(self, channel_id: str):
+        return self.latest.setdefault(channel_id, (f"{channel_id}-v0", "video"))
+
+    async def channels(self, request):
+        self.calls["channels"] += 1
+        await asyncio.sleep(self.latency)
+        ids = request.query["id"].split(",")[:50]
+        items = [
+            {"id": cid, "snippet": {"title": cid, "customUrl": f"@{cid.lower()}"}, "contentDetails": {"relatedPlaylists": {"uploads": "UU" + cid[2:]}}}
+            for cid in ids
+        ]
+        return web.json_response({"items": items})
+
+    async def playlist_items(self, request):
+        self.calls["playlistItems"] += 1
+        await asyncio.sleep(self.latency)
+        vid, title = self._video("UC" + request.query["playlistId"][2:])
+        if request.headers.get("If-None-Match") == vid:
+            return web.Response(status=304)
+        item = {"snippet": {"title": title}, "contentDetails": {"videoId": vid}}
+        return web.json_response({"items": [item]}, headers={"ETag": vid})
+
+    async def videos(self, request):
+        self.calls["videos"] += 1
+        await asyncio.sleep(self.latency)
+        ids = request.query["id"].split(",")[:50]
+        items = [{"id": vid, "snippet": {"title": "video", "channelTitle": "bench", "liveBroadcastContent": "none"}} for vid in ids]
+        return web.json_response({"items": items})
+
+    async def feed(self, request):
+        self.calls["feed"] += 1
+        await asyncio.sleep(self.latency)
+        cid = request.query["channel_id"]
+        vid, title = self._video(cid)
+        if request.headers.get("If-None-Match") == vid:
+            return web.Response(status=304)
+        body = (
+            "<feed xmlns='http://www.w3.org/2005/Atom' xmlns:yt='http://www.youtube.com/xml/schemas/2015'>"
+            f"<entry><yt:videoId>{vid}</yt:videoId><yt:channelId>{cid}</yt:channelId><title>{title}</title></entry></feed>"
+        )
+        return web.Response(text=body, content_type="application/atom+xml", headers={"ETag": vid})
+
+
+async def start_server(fake: FakeYouTube):
+    app = web.Application()
+    app.router.add_get("/yt/channels", fake.channels)
+    app.router.add_get("/yt/playlistItems", fake.playlist_items)
+    app.router.add_get("/yt/videos", fake.videos)
+    app.router.add_get("/feed", fake.feed)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def fake_bot(send_delay: float):
+    """Бот с одним каналом уведомлений: все права есть, send() ждёт send_delay"""
+    sent = []
+
+    async def send(text):
+        await asyncio.sleep(send_delay)
+        sent.append(text)
+
+    perms = types.SimpleNamespace(view_channel=True, send_messages=True, embed_links=True)
+    guild = types.SimpleNamespace(me=object())
+    channel = types.SimpleNamespace(guild=guild, send=send, permissions_for=lambda member: perms)
+    return types.SimpleNamespace(get_channel=lambda channel_id: channel), sent
+
+
+async def run(name, handlers, fake, bot, sent, channels, args):
+    handlers.YOUTUBE_CONCURRENCY = args.concurrency if name == "concurrent" else 1
+    handlers._youtube_cache.clear()
+    handlers.state_store.get("youtube_state").update({"uploads": {}, "channels": {}})
+    fake.calls.clear()
+    used_before = handlers.youtube_quota.used_today()
+    step = max(1, int(1 / args.new_ratio)) if args.new_ratio else 0
+    totals = []
+    for tick in range(args.rounds):
+        for i, cid in enumerate(channels):
+            if step and i % step == 0:
+                fake.latest[cid] = (f"{cid}-{name}-{tick}", "video")
+        await handlers._poll_youtube(bot, 0)
+        stats = handlers.youtube_poll_stats()
+        totals.append(stats["total_seconds"])
+        print(f"  {name:<10} тик {tick + 1}: всего {stats['total_seconds']:6.2f} с  "
+              f"запросы {stats['fetch_seconds']:6.2f} с  videos.list {stats['enrich_seconds']:5.2f} с  "
+              f"отправка {stats['send_seconds']:5.2f} с  новых {stats['new']}")
+    used = handlers.youtube_quota.used_today() - used_before
+    print(f"{name:<12} mean={statistics.mean(totals):6.2f} с  max={max(totals):6.2f} с  "
+          f"запросы: {dict(fake.calls)}  квота: {used}  сообщений: {len(sent)}")
+    sent.clear()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=80)
+    parser.add_argument("--send-ms", type=float, default=50)
+    parser.add_argument("--new-ratio", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--backend", default="playlist", choices=("playlist", "rss"))
+    args = parser.parse_args()
+
+    fake = FakeYouTube(args.latency_ms / 1000)
+    runner, base = await start_server(fake)
+    # Файлы состояния (notified.json, youtube_state.json) пишутся во временный каталог
+    os.chdir(tempfile.mkdtemp(prefix="bench_youtube_"))
+    os.environ["YOUTUBE_API_KEY"] = "bench"
+    os.environ["YOUTUBE_BACKEND"] = args.backend
+    os.environ["YOUTUBE_API_BASE"] = f"{base}/yt"
+    os.environ["YOUTUBE_FEED_URL"] = f"{base}/feed"
+    import handlers
+
+    channels = [f"UC{i:022d}" for i in range(args.channels)]
+    await handlers.async_save_tracking({"youtube": channels})
+    bot, sent = fake_bot(args.send_ms / 1000)
+    try:
+        print(f"channels={args.channels} latency={args.latency_ms} ms send={args.send_ms} ms "
+              f"backend={args.backend} concurrency={args.concurrency}")
+        start = time.perf_counter()
+        for name in ("serial", "concurrent"):
+            await run(name, handlers, fake, bot, sent, channels, args)
+        print(f"итого {time.perf_counter() - start:.1f} с")
+    finally:
+        await handlers.close_http_session()
+        await handlers.state_store.flush_async()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -229,9 +229,19 @@ class GenesisBot(commands.Bot):
             help_command=None  # Отключаем встроенную команду help
         )
         self.logger = logger
+        self.http_session = None
     
     async def setup_hook(self) -> None:
         """Инициализация бота при запуске"""
+        # Общая HTTP-сессия с пулом соединений для форума, Twitch и YouTube
+        self.http_session = handlers.open_http_session()
+
+        # Загружаем состояние один раз, дальше оно обслуживается из памяти
+        try:
+            handlers.state_store.load_all()
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка загрузки состояния: {e}")
+
         try:
             # Регистрируем команды глобально и копируем их в нужную гильдию
             await self.tree.sync()
@@ -250,6 +260,31 @@ class GenesisBot(commands.Bot):
         except Exception:
             pass
 
+    async def close(self) -> None:
+        """
+        Останавливает источники изменений состояния (веб-сервер push-уведомлений
+        и циклы опроса), затем закрывает HTTP-сессию и пул разбора и только
+        после этого сбрасывает и закрывает хранилище состояния.
+        """
+        try:
+            await handlers.stop_webhook_server()
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка остановки веб-сервера: {e}")
+        try:
+            await handlers.stop_background_tasks()
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка остановки фоновых задач: {e}")
+        try:
+            await handlers.close_http_session()
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка закрытия HTTP-сессии: {e}")
+        handlers.shutdown_parse_executor()
+        try:
+            await handlers.state_store.close()
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка сохранения состояния при остановке: {e}")
+        await super().close()
+
 # Создаем экземпляр бота
 bot = GenesisBot()
 
@@ -316,20 +351,29 @@ async def on_ready():
     except Exception as e:
         logger.error(f"❌ Ошибка при инициализации сообщения с ролями: {e}")
 
-    # Запускаем проверку форума, если она еще не запущена
-    if not handlers.check_forum.is_running():
-        handlers.check_forum.start(bot, FORUM_CHANNEL_ID)
-        logger.info("✅ Проверка форума запущена")
+    # Запускаем редкую сверку конфликтующих ролей (первый проход строит набор нарушений)
+    if not handlers.check_conflicting_roles.is_running():
+        handlers.check_conflicting_roles.start(bot)
+        logger.info("✅ Сверка конфликтующих ролей запущена")
 
-    # Запускаем проверку ордеров, если она еще не запущена
-    if not handlers.check_orders.is_running():
-        handlers.check_orders.start(bot, ORDERS_CHANNEL_ID)
-        logger.info("✅ Проверка ордеров запущена")
+    # Запускаем проверку тем форума (постановления, ордера и добавленные командами)
+    handlers.configure_builtin_forum_threads(FORUM_CHANNEL_ID, ORDERS_CHANNEL_ID)
+    if not handlers.check_forum_threads.is_running():
+        handlers.check_forum_threads.start(bot)
+        logger.info("✅ Проверка тем форума запущена")
+
+    # Push-уведомления YouTube (WebSub) и Twitch (EventSub), если заданы адреса колбэков
+    if handlers.YOUTUBE_WEBSUB_CALLBACK or handlers.TWITCH_EVENTSUB_CALLBACK:
+        try:
+            if await handlers.start_webhook_server(bot, NOTIFICATIONS_CHANNEL_ID):
+                logger.info(f"✅ Веб-сервер push-уведомлений запущен на порту {handlers.WEBHOOK_PORT}")
+        except Exception as e:
+            logger.error(f"❌ Не удалось запустить веб-сервер push-уведомлений: {e}")
 
     # Запускаем отслеживание стримов и видео
     handlers.start_tracking_tasks(bot, NOTIFICATIONS_CHANNEL_ID)
     logger.info("✅ Отслеживание Twitch и YouTube запущено")
-    logger.info("⏰ Интервал проверки: 2 минуты")
+    logger.info("⏰ Интервалы опроса адаптивные (см. /poll_schedule)")
 
 @bot.event
 async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
@@ -341,6 +385,41 @@ async def on_raw_reaction_remove(payload: discord.RawReactionActionEvent):
     """Обработка удаления реакции"""
     await handlers.handle_reaction_remove(payload, bot)
 
+@bot.event
+async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
+    """Удалённое объявление о посте форума убирается из индекса"""
+    handlers.forum_announcements.on_raw_message_delete(payload)
+
+@bot.event
+async def on_raw_bulk_message_delete(payload: discord.RawBulkMessageDeleteEvent):
+    """Массовое удаление сообщений (очистка канала)"""
+    handlers.forum_announcements.on_raw_bulk_message_delete(payload)
+
+@bot.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    """Инкрементальное отслеживание конфликтующих ролей по изменениям участника"""
+    handlers.conflict_tracker.on_member_update(before, after)
+
+@bot.event
+async def on_member_remove(member: discord.Member):
+    """Участник покинул сервер — убираем его из набора нарушений"""
+    handlers.conflict_tracker.on_member_remove(member)
+
+@bot.event
+async def on_guild_role_create(role: discord.Role):
+    """Сброс индекса ролей при создании роли"""
+    handlers.invalidate_role_index(role.guild)
+
+@bot.event
+async def on_guild_role_update(before: discord.Role, after: discord.Role):
+    """Сброс индекса ролей при изменении роли (например, переименовании)"""
+    handlers.invalidate_role_index(after.guild)
+
+@bot.event
+async def on_guild_role_delete(role: discord.Role):
+    """Сброс индекса ролей при удалении роли"""
+    handlers.invalidate_role_index(role.guild)
+
 # =============================================================================
 # КОМАНДЫ УПРАВЛЕНИЯ
 # =============================================================================
@@ -366,9 +445,22 @@ async def sync_cmd(interaction: discord.Interaction):
             ephemeral=True
         )
 
+def _format_sweep_progress(job) -> str:
+    """Текст прогресса обхода участников для /fix_roles"""
+    percent = int(job.position * 100 / job.total) if job.total else 100
+    text = f"🔍 Проверка ролей: {job.position}/{job.total} ({percent}%) | нарушений: {len(job.found)}"
+    if job.apply_fixes:
+        text += f" | исправлено: {job.fixed}, ошибок: {job.fix_failed}"
+    return text
+
 @bot.tree.command(name="fix_roles", description="Исправить конфликтующие роли на сервере")
+@app_commands.describe(
+    apply="Снять лишние конфликтующие роли (остаётся роль выше в иерархии)",
+    full_scan="Обойти всех участников, а не только известные нарушения",
+    resume="Продолжить отменённую проверку с места остановки",
+)
 @admin_only()
-async def fix_roles_cmd(interaction: discord.Interaction):
+async def fix_roles_cmd(interaction: discord.Interaction, apply: bool = False, full_scan: bool = False, resume: bool = False):
     """Проверяет и исправляет все конфликтующие роли на сервере"""
     await ensure_deferred(interaction, ephemeral=True)
     
@@ -377,10 +469,39 @@ async def fix_roles_cmd(interaction: discord.Interaction):
         if guild is None:
             await interaction.followup.send("❌ Не удалось получить информацию о сервере", ephemeral=True)
             return
+
+        job = handlers.role_sweep_jobs.get(guild.id)
+        if job is not None and job.status == "running":
+            await interaction.followup.send(
+                f"⏳ Проверка уже выполняется: {job.position}/{job.total}. Отменить: /fix_roles_cancel",
+                ephemeral=True
+            )
+            return
+        if not (resume and job is not None and job.status == "cancelled"):
+            job = handlers.create_role_sweep_job(guild, apply_fixes=apply, full_scan=full_scan)
             
-        await interaction.followup.send("🔍 Проверяю конфликтующие роли...", ephemeral=True)
-        
-        violation_count, messages = await handlers.fix_conflicting_roles(guild)
+        progress_message = await interaction.followup.send(_format_sweep_progress(job), ephemeral=True, wait=True)
+        last_edit = 0.0
+
+        async def on_progress(current_job):
+            # Редактируем сообщение не чаще раза в 2 секунды, чтобы не упираться в rate limit
+            nonlocal last_edit
+            now = asyncio.get_running_loop().time()
+            if now - last_edit >= 2.0 or current_job.position >= current_job.total:
+                last_edit = now
+                await progress_message.edit(content=_format_sweep_progress(current_job))
+
+        await job.run(on_progress=on_progress)
+
+        if job.status == "cancelled":
+            await progress_message.edit(
+                content=f"🛑 Проверка отменена на {job.position}/{job.total}. Продолжить: /fix_roles resume:True"
+            )
+            return
+
+        await progress_message.edit(content=_format_sweep_progress(job))
+        messages = job.messages()
+        violation_count = len(messages)
         
         if violation_count == 0:
             await interaction.followup.send("✅ Конфликтующих ролей не найдено!", ephemeral=True)
@@ -395,14 +516,64 @@ async def fix_roles_cmd(interaction: discord.Interaction):
             if len(messages) > 10:
                 result_message += f"\n... и еще {len(messages) - 10} нарушений"
             
-            result_message += "\n\n💡 Используйте команды администратора Discord для снятия лишних ролей."
+            if job.apply_fixes:
+                result_message += f"\n\n🔧 Исправлено участников: {job.fixed}, ошибок: {job.fix_failed}"
+            else:
+                result_message += "\n\n💡 Используйте /fix_roles apply:True, чтобы снять лишние роли."
             
             await interaction.followup.send(result_message, ephemeral=True)
             
     except Exception as e:
         await interaction.followup.send(f"❌ Ошибка при исправлении ролей: {e}", ephemeral=True)
 
+@bot.tree.command(name="fix_roles_cancel", description="Отменить выполняющуюся проверку ролей")
+@admin_only()
+async def fix_roles_cancel_cmd(interaction: discord.Interaction):
+    """Отменяет выполняющийся обход /fix_roles"""
+    await ensure_deferred(interaction, ephemeral=True)
+    
+    job = handlers.role_sweep_jobs.get(interaction.guild_id)
+    if job is None or job.status != "running":
+        await interaction.followup.send("ℹ️ Нет выполняющейся проверки ролей", ephemeral=True)
+        return
+    job.cancel()
+    await interaction.followup.send(f"🛑 Отмена запрошена ({job.position}/{job.total})", ephemeral=True)
+
+@bot.tree.command(name="reload_roles_config", description="Перечитать конфигурацию reaction-ролей")
+@admin_only()
+async def reload_roles_config_cmd(interaction: discord.Interaction):
+    """Сбрасывает кэш конфигурации reaction-ролей и перечитывает файлы"""
+    await ensure_deferred(interaction, ephemeral=True)
+    
+    try:
+        handlers.reaction_roles_config.reload()
+        await interaction.followup.send(
+            f"✅ Конфигурация перечитана: {len(handlers.reaction_roles_config.roles)} ролей, "
+            f"сообщение {handlers.reaction_roles_config.message_id}",
+            ephemeral=True
+        )
+    except Exception as e:
+        await interaction.followup.send(f"❌ Ошибка при перечитывании конфигурации: {e}", ephemeral=True)
 
+@bot.tree.command(name="role_queue_stats", description="Статистика очередей выдачи ролей")
+@admin_only()
+async def role_queue_stats_cmd(interaction: discord.Interaction):
+    """Показывает глубину очередей изменений ролей и время ожидания"""
+    await ensure_deferred(interaction, ephemeral=True)
+    
+    try:
+        stats = handlers.role_queue.stats()
+        await interaction.followup.send(
+            f"📊 Очереди ролей:\n"
+            f"• В очереди: {stats['depth']} (максимум: {stats['depth_max']})\n"
+            f"• Участников в обработке: {stats['active_members']}\n"
+            f"• Принято: {stats['enqueued']}, схлопнуто: {stats['coalesced']}\n"
+            f"• Выполнено: {stats['processed']}, ошибок: {stats['failed']}\n"
+            f"• Ожидание: среднее {stats['wait_avg_ms']} мс, максимум {stats['wait_max_ms']} мс",
+            ephemeral=True
+        )
+    except Exception as e:
+        await interaction.followup.send(f"❌ Ошибка: {e}", ephemeral=True)
 
 # =============================================================================
 # КОМАНДЫ ДЛЯ РАБОТЫ С ФОРУМОМ
@@ -415,7 +586,7 @@ async def force_forum_check(interaction: discord.Interaction):
     await ensure_deferred(interaction, ephemeral=True)
     
     try:
-        post = await handlers.parse_forum()
+        post = await handlers.parse_forum_thread("forum")
         if post and post.get("text"):
             await interaction.followup.send(
                 f"📋 Последний пост на форуме:\n{post['url']}", 
@@ -433,7 +604,7 @@ async def forum_diagnose(interaction: discord.Interaction):
     await ensure_deferred(interaction, ephemeral=True)
     
     try:
-        result = await handlers.diagnose_forum(bot, FORUM_CHANNEL_ID)
+        result = await handlers.diagnose_forum_thread(bot, "forum")
         await interaction.followup.send(f"🔍 {result}", ephemeral=True)
     except Exception as e:
         await interaction.followup.send(f"❌ Ошибка диагностики: {e}", ephemeral=True)
@@ -445,14 +616,8 @@ async def reset_forum_state(interaction: discord.Interaction):
     await ensure_deferred(interaction, ephemeral=True)
     
     try:
-        notified = handlers.load_notified()
-        forum_state = notified.get("forum", {})
-        old_post_id = forum_state.get("last_post_id")
-        
         # Сбрасываем ID последнего поста
-        forum_state["last_post_id"] = None
-        notified["forum"] = forum_state
-        handlers.save_notified(notified)
+        _, old_post_id = handlers.reset_forum_thread_state("forum")
         
         await interaction.followup.send(
             f"✅ Состояние форума сброшено!\n"
@@ -474,7 +639,7 @@ async def force_orders_check(interaction: discord.Interaction):
     await ensure_deferred(interaction, ephemeral=True)
     
     try:
-        order = await handlers.parse_orders()
+        order = await handlers.parse_forum_thread("orders")
         if order and order.get("text"):
             await interaction.followup.send(
                 f"📋 Последний ордер:\n{order['url']}", 
@@ -492,7 +657,7 @@ async def orders_diagnose(interaction: discord.Interaction):
     await ensure_deferred(interaction, ephemeral=True)
     
     try:
-        result = await handlers.diagnose_orders(bot, ORDERS_CHANNEL_ID)
+        result = await handlers.diagnose_forum_thread(bot, "orders")
         await interaction.followup.send(f"🔍 {result}", ephemeral=True)
     except Exception as e:
         await interaction.followup.send(f"❌ Ошибка диагностики: {e}", ephemeral=True)
@@ -504,14 +669,8 @@ async def reset_orders_state(interaction: discord.Interaction):
     await ensure_deferred(interaction, ephemeral=True)
     
     try:
-        notified = handlers.load_notified()
-        orders_state = notified.get("orders", {})
-        old_order_id = orders_state.get("last_order_id")
-        
         # Сбрасываем ID последнего ордера
-        orders_state["last_order_id"] = None
-        notified["orders"] = orders_state
-        handlers.save_notified(notified)
+        _, old_order_id = handlers.reset_forum_thread_state("orders")
         
         await interaction.followup.send(
             f"✅ Состояние ордеров сброшено!\n"
@@ -522,6 +681,138 @@ async def reset_orders_state(interaction: discord.Interaction):
     except Exception as e:
         await interaction.followup.send(f"❌ Ошибка при сбросе состояния: {e}", ephemeral=True)
 
+# =============================================================================
+# КОМАНДЫ ДЛЯ РАБОТЫ СО СПИСКОМ ТЕМ ФОРУМА
+# =============================================================================
+
+@bot.tree.command(name="forum_thread_add", description="Добавить тему форума для отслеживания")
+@admin_only()
+async def forum_thread_add(
+    interaction: discord.Interaction,
+    key: str,
+    url: str,
+    channel: discord.TextChannel,
+    prefix: str = "Новое сообщение:",
+):
+    """Добавляет тему форума: новые посты будут отправляться в указанный канал"""
+    await ensure_deferred(interaction, ephemeral=True)
+    
+    try:
+        success, message = handlers.add_forum_thread(key, url, channel.id, prefix)
+        await interaction.followup.send(f"{'✅' if success else '❌'} {message}", ephemeral=True)
+    except Exception as e:
+        await interaction.followup.send(f"❌ Ошибка: {e}", ephemeral=True)
+
+@bot.tree.command(name="forum_thread_remove", description="Удалить тему форума из отслеживания")
+@admin_only()
+async def forum_thread_remove(interaction: discord.Interaction, key: str):
+    """Удаляет тему форума из списка отслеживаемых"""
+    await ensure_deferred(interaction, ephemeral=True)
+    
+    try:
+        success, message = handlers.remove_forum_thread(key)
+        await interaction.followup.send(f"{'✅' if success else '❌'} {message}", ephemeral=True)
+    except Exception as e:
+        await interaction.followup.send(f"❌ Ошибка: {e}", ephemeral=True)
+
+@bot.tree.command(name="forum_thread_list", description="Показать список отслеживаемых тем форума")
+@admin_only()
+async def forum_thread_list(interaction: discord.Interaction):
+    """Показывает список всех отслеживаемых тем форума"""
+    await ensure_deferred(interaction, ephemeral=True)
+    
+    try:
+        threads = handlers.list_forum_threads()
+        if threads:
+            thread_list = "\n".join(
+                f"• {key}{' (встроенная)' if cfg['builtin'] else ''} → <#{cfg['channel_id']}>\n  {cfg['url']}"
+                for key, cfg in threads.items()
+            )
+            await interaction.followup.send(f"📋 Отслеживаемые темы форума:\n{thread_list}"[:2000], ephemeral=True)
+        else:
+            await interaction.followup.send("📋 Нет отслеживаемых тем форума", ephemeral=True)
+    except Exception as e:
+        await interaction.followup.send(f"❌ Ошибка: {e}", ephemeral=True)
+
+@bot.tree.command(name="forum_thread_check", description="Проверить тему форума вручную")
+@admin_only()
+async def forum_thread_check(interaction: discord.Interaction, key: str):
+    """Проверяет тему форума и показывает её последний пост"""
+    await ensure_deferred(interaction, ephemeral=True)
+    
+    try:
+        post = await handlers.parse_forum_thread(key.strip().lower())
+        if post and post.get("text"):
+            await interaction.followup.send(f"📋 Последний пост темы {key}:\n{post['url']}", ephemeral=True)
+        else:
+            await interaction.followup.send("❌ Не удалось получить пост (или тема не отслеживается).", ephemeral=True)
+    except Exception as e:
+        await interaction.followup.send(f"❌ Ошибка: {e}", ephemeral=True)
+
+@bot.tree.command(name="forum_thread_reset", description="Сбросить состояние темы форума (если удалили сообщение)")
+@admin_only()
+async def forum_thread_reset(interaction: discord.Interaction, key: str):
+    """Сбрасывает состояние темы, чтобы бот отправил последний пост заново"""
+    await ensure_deferred(interaction, ephemeral=True)
+    
+    try:
+        success, result = handlers.reset_forum_thread_state(key.strip().lower())
+        if success:
+            await interaction.followup.send(
+                f"✅ Состояние темы {key} сброшено!\n"
+                f"📝 Предыдущий ID поста: {result}\n"
+                f"🔄 Бот отправит последний пост при следующей проверке.",
+                ephemeral=True
+            )
+        else:
+            await interaction.followup.send(f"❌ {result}", ephemeral=True)
+    except Exception as e:
+        await interaction.followup.send(f"❌ Ошибка при сбросе состояния: {e}", ephemeral=True)
+
+@bot.tree.command(name="forum_parse_stats", description="Статистика разбора страниц форума")
+@admin_only()
+async def forum_parse_stats(interaction: discord.Interaction):
+    """Показывает, где и как быстро разбираются страницы форума"""
+    await ensure_deferred(interaction, ephemeral=True)
+    
+    try:
+        stats = handlers.forum_parse_stats()
+        await interaction.followup.send(
+            f"⏱️ Разбор страниц форума:\n"
+            f"• Исполнитель: {stats['executor']} (потоков/процессов: {stats['workers']})\n"
+            f"• Разобрано: {stats['count']}, ошибок: {stats['failed']}\n"
+            f"• Время разбора: среднее {stats['avg_ms']} мс, максимум {stats['max_ms']} мс, последнее {stats['last_ms']} мс\n"
+            f"• Ожидание пула: среднее {stats['wait_avg_ms']} мс, максимум {stats['wait_max_ms']} мс",
+            ephemeral=True
+        )
+    except Exception as e:
+        await interaction.followup.send(f"❌ Ошибка: {e}", ephemeral=True)
+
+@bot.tree.command(name="poll_schedule", description="Интервалы и время следующего опроса источников")
+@admin_only()
+async def poll_schedule(interaction: discord.Interaction):
+    """Показывает текущие интервалы опроса форума, Twitch и YouTube"""
+    await ensure_deferred(interaction, ephemeral=True)
+    
+    try:
+        rows = handlers.poll_scheduler.snapshot()
+        if not rows:
+            await interaction.followup.send("⏰ Источники ещё не опрашивались", ephemeral=True)
+            return
+        lines = []
+        for row in rows:
+            line = f"• **{row['name']}** — каждые {row['interval']} с (база {row['base']} с), следующий <t:{int(row['next_run'])}:R>"
+            if row["last_duration_ms"] is not None:
+                line += f", последний опрос {row['last_duration_ms']} мс"
+            if row["failures"]:
+                line += f"\n  ⚠️ ошибок подряд: {row['failures']} ({row['last_error']})"
+            if row["retry_after"]:
+                line += f", Retry-After {round(row['retry_after'])} с"
+            lines.append(line)
+        await interaction.followup.send(("⏰ Расписание опроса:\n" + "\n".join(lines))[:2000], ephemeral=True)
+    except Exception as e:
+        await interaction.followup.send(f"❌ Ошибка: {e}", ephemeral=True)
+
 # =============================================================================
 # КОМАНДЫ ДЛЯ РАБОТЫ С TWITCH
 # =============================================================================
@@ -566,6 +857,31 @@ async def twitch_list(interaction: discord.Interaction):
     except Exception as e:
         await interaction.followup.send(f"❌ Ошибка: {e}", ephemeral=True)
 
+@bot.tree.command(name="twitch_eventsub", description="Состояние push-уведомлений Twitch (EventSub)")
+@admin_only()
+async def twitch_eventsub(interaction: discord.Interaction):
+    """Показывает подписки EventSub stream.online и статистику полученных уведомлений"""
+    await ensure_deferred(interaction, ephemeral=True)
+    
+    try:
+        report = handlers.twitch_eventsub.report()
+        if not report["callback"]:
+            await interaction.followup.send("ℹ️ EventSub выключен (не задан TWITCH_EVENTSUB_CALLBACK), стримы только опрашиваются.", ephemeral=True)
+            return
+        last_reconcile = f"<t:{int(report['last_reconcile'])}:R>" if report["last_reconcile"] else "ещё не было"
+        await interaction.followup.send(
+            f"📡 EventSub Twitch: {'✅ работает' if report['active'] else '❌ веб-сервер не запущен'}\n"
+            f"• Колбэк: {report['callback']}\n"
+            f"• Подписок stream.online: {report['subscriptions']} из {len(handlers.list_twitch_channels())}, "
+            f"последняя сверка: {last_reconcile}\n"
+            f"• Подтверждений: {report['verified']}, отозвано: {report['revoked']}\n"
+            f"• Уведомлений: {report['notifications']} (повторов {report['duplicates']}), "
+            f"с неверной подписью: {report['rejected']}, объявлено эфиров: {report['announced']}",
+            ephemeral=True
+        )
+    except Exception as e:
+        await interaction.followup.send(f"❌ Ошибка: {e}", ephemeral=True)
+
 @bot.tree.command(name="twitch_check", description="Проверить Twitch-канал вручную")
 @admin_only()
 async def twitch_check(interaction: discord.Interaction, login: str):
@@ -622,6 +938,60 @@ async def youtube_list(interaction: discord.Interaction):
     except Exception as e:
         await interaction.followup.send(f"❌ Ошибка: {e}", ephemeral=True)
 
+@bot.tree.command(name="youtube_quota", description="Расход квоты YouTube API и прогноз на сутки")
+@admin_only()
+async def youtube_quota(interaction: discord.Interaction):
+    """Показывает расход квоты YouTube Data API за сегодня и прогноз для текущего списка каналов"""
+    await ensure_deferred(interaction, ephemeral=True)
+    
+    try:
+        report = handlers.youtube_quota.report(len(handlers.list_youtube_channels()))
+        by_backend = ", ".join(f"{name}: {units}" for name, units in report["projected_by_backend"].items())
+        used = ", ".join(f"{name}: {units}" for name, units in report["used_by_endpoint"].items()) or "—"
+        cache = handlers.youtube_resolver.stats()
+        stats = handlers.youtube_poll_stats()
+        last_poll = (
+            f"{stats['total_seconds']} с на {stats['channels']} каналов "
+            f"(запросы {stats['fetch_seconds']} с, videos.list {stats['enrich_seconds']} с, отправка {stats['send_seconds']} с; "
+            f"ошибок {stats['errors']}, новых {stats['new']}) <t:{int(stats['at'])}:R>"
+        ) if stats else "ещё не было"
+        await interaction.followup.send(
+            f"📊 Квота YouTube API:\n"
+            f"• Бэкенд опроса: {report['backend']}, каналов: {report['channels']}, интервал: {report['interval']} с\n"
+            f"• Израсходовано сегодня: {report['used_today']} из {report['daily_limit']} ({used})\n"
+            f"• Прогноз на сутки: {report['projected_daily']} {'✅' if report['fits'] else '⚠️ больше лимита'}\n"
+            f"• Прогноз по бэкендам: {by_backend}\n"
+            f"• Кэш channelId: {cache['handles']} handle, {cache['negative']} «не найдено», сведений о каналах: {cache['channels']}\n"
+            f"• Последний опрос: {last_poll}",
+            ephemeral=True
+        )
+    except Exception as e:
+        await interaction.followup.send(f"❌ Ошибка: {e}", ephemeral=True)
+
+@bot.tree.command(name="youtube_websub", description="Состояние push-уведомлений YouTube (WebSub)")
+@admin_only()
+async def youtube_websub(interaction: discord.Interaction):
+    """Показывает подписки WebSub и статистику полученных push-уведомлений"""
+    await ensure_deferred(interaction, ephemeral=True)
+    
+    try:
+        report = handlers.youtube_websub.report()
+        if not report["callback"]:
+            await interaction.followup.send("ℹ️ WebSub выключен (не задан YOUTUBE_WEBSUB_CALLBACK), YouTube только опрашивается.", ephemeral=True)
+            return
+        next_expiry = f"<t:{int(report['next_expiry'])}:R>" if report["next_expiry"] else "—"
+        await interaction.followup.send(
+            f"📡 WebSub YouTube: {'✅ работает' if report['active'] else '❌ веб-сервер не запущен'}\n"
+            f"• Колбэк: {report['callback']}\n"
+            f"• Активных подписок: {report['subscribed']} из {len(handlers.list_youtube_channels())}, "
+            f"ожидают подтверждения: {report['pending']}, ближайшее истечение: {next_expiry}\n"
+            f"• Подтверждений: {report['verified']}, отказов хаба: {report['denied']}\n"
+            f"• Push-уведомлений: {report['pushes']}, с неверной подписью: {report['rejected']}, объявлено видео: {report['announced']}",
+            ephemeral=True
+        )
+    except Exception as e:
+        await interaction.followup.send(f"❌ Ошибка: {e}", ephemeral=True)
+
 @bot.tree.command(name="youtube_check", description="Проверить YouTube-канал вручную")
 @admin_only()
 async def youtube_check(interaction: discord.Interaction, channel: str):
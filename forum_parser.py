@@ -0,0 +1,383 @@
+"""
+Разбор страниц тем форума (XenForo) для бота Genesis.
+
+Со страницы нужны только ссылки навигации (номер последней страницы) и
+сообщения темы (ID и текст). Поддерживается несколько бэкендов:
+
+  * selectolax — C-парсер (lexbor), если установлен пакет selectolax
+  * lxml       — C-парсер libxml2, если установлен пакет lxml
+  * stream     — потоковый извлекатель на html.parser из стандартной библиотеки:
+                 не строит дерево и прекращает разбор после последнего сообщения
+  * bs4        — прежний путь через BeautifulSoup (запасной вариант)
+
+Бэкенд выбирается переменной окружения FORUM_PARSER (auto по умолчанию:
+первый доступный из selectolax, lxml, stream). Если быстрый бэкенд упал на
+странице, она разбирается через BeautifulSoup.
+"""
+
+import logging
+import os
+import re
+import time
+from html.parser import HTMLParser
+
+logger = logging.getLogger("genesis_bot")
+
+FORUM_PARSER = os.getenv("FORUM_PARSER", "auto").lower()
+
+_PAGE_RE = re.compile(r"page-(\d+)")
+_POST_ID_RE = re.compile(r"post-(\d+)")
+_POST_LINK_RE = re.compile(r"#post-(\d+)")
+
+
+def _clean_text(text: str) -> str:
+    text = re.sub(r"\s+\n", "\n", text)
+    return re.sub(r"\n{3,}", "\n\n", text)
+
+
+def _post_id_from_attrs(attrs: dict):
+    for attr_name in ("id", "data-content"):
+        m = _POST_ID_RE.search(attrs.get(attr_name) or "")
+        if m:
+            return m.group(1)
+    return None
+
+
+def _last_page(hrefs) -> tuple:
+    """(номер последней страницы, ссылка на неё) по ссылкам навигации"""
+    last_page_href = None
+    last_page = None
+    for href in hrefs:
+        m = _PAGE_RE.search(href or "")
+        if m and (last_page is None or int(m.group(1)) >= last_page):
+            last_page = int(m.group(1))
+            last_page_href = href
+    return last_page, last_page_href
+
+
+def _page_info(last_page, last_page_href, posts: list) -> dict:
+    last_post = posts[-1] if posts else {"post_id": None, "text": ""}
+    return {
+        "last_page_href": last_page_href,
+        "last_page": last_page,
+        "post_count": len(posts),
+        "post_id": last_post["post_id"],
+        "text": last_post["text"],
+        "posts": posts,
+    }
+
+
+# ---------- BeautifulSoup ----------
+
+def _bs4_post(article) -> dict:
+    post_id = _post_id_from_attrs({k: article.get(k) for k in ("id", "data-content")})
+    if not post_id:
+        link = article.select_one("a[href*='#post-']")
+        if link and link.has_attr("href"):
+            m = _POST_LINK_RE.search(link["href"])
+            if m:
+                post_id = m.group(1)
+
+    body = article.select_one(".message-content .bbWrapper") or article.select_one(".bbWrapper")
+    if body:
+        text = body.get_text("\n", strip=True)
+    else:
+        text = article.get_text(" ", strip=True)
+    return {"post_id": post_id, "text": _clean_text(text)}
+
+
+def parse_page_bs4(html: str) -> dict:
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    nav = soup.select_one("nav.pageNav") or soup
+    last_page, last_page_href = _last_page(a.get("href", "") for a in nav.select("a[href*='page-']"))
+    posts = [_bs4_post(article) for article in soup.select("article.message")]
+    return _page_info(last_page, last_page_href, posts)
+
+
+# ---------- selectolax ----------
+
+def _selectolax_text(node, separator: str) -> str:
+    # Как у bs4 и lxml: непустые текстовые узлы без содержимого script/style
+    parts = (n.text(deep=False).strip() for n in node.traverse(include_text=True) if n.tag == "-text")
+    return separator.join(s for s in parts if s)
+
+
+def parse_page_selectolax(html: str) -> dict:
+    from selectolax.lexbor import LexborHTMLParser
+
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(["script", "style"])
+    nav = tree.css_first("nav.pageNav") or tree
+    last_page, last_page_href = _last_page(a.attributes.get("href") for a in nav.css("a[href*='page-']"))
+
+    posts = []
+    for article in tree.css("article.message"):
+        post_id = _post_id_from_attrs(article.attributes)
+        if not post_id:
+            link = article.css_first("a[href*='#post-']")
+            m = _POST_LINK_RE.search(link.attributes.get("href") or "") if link else None
+            if m:
+                post_id = m.group(1)
+
+        body = article.css_first(".message-content .bbWrapper") or article.css_first(".bbWrapper")
+        if body:
+            text = _selectolax_text(body, "\n")
+        else:
+            text = _selectolax_text(article, " ")
+        posts.append({"post_id": post_id, "text": _clean_text(text)})
+    return _page_info(last_page, last_page_href, posts)
+
+
+# ---------- lxml ----------
+
+def _xp_class(name: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+_XP_NAV = f"//nav[{_xp_class('pageNav')}]"
+_XP_ARTICLES = f"//article[{_xp_class('message')}]"
+_XP_CONTENT_BODY = f".//*[{_xp_class('message-content')}]//*[{_xp_class('bbWrapper')}]"
+_XP_BODY = f".//*[{_xp_class('bbWrapper')}]"
+_XP_TEXT = ".//text()[not(ancestor::script) and not(ancestor::style)]"
+
+
+def _lxml_text(element, separator: str) -> str:
+    return separator.join(s.strip() for s in element.xpath(_XP_TEXT) if s.strip())
+
+
+def parse_page_lxml(html: str) -> dict:
+    import lxml.html
+
+    root = lxml.html.document_fromstring(html)
+    navs = root.xpath(_XP_NAV)
+    nav = navs[0] if navs else root
+    last_page, last_page_href = _last_page(nav.xpath(".//a[contains(@href, 'page-')]/@href"))
+
+    posts = []
+    for article in root.xpath(_XP_ARTICLES):
+        post_id = _post_id_from_attrs(article.attrib)
+        if not post_id:
+            for href in article.xpath(".//a[contains(@href, '#post-')]/@href")[:1]:
+                m = _POST_LINK_RE.search(href)
+                if m:
+                    post_id = m.group(1)
+
+        bodies = article.xpath(_XP_CONTENT_BODY) or article.xpath(_XP_BODY)
+        if bodies:
+            text = _lxml_text(bodies[0], "\n")
+        else:
+            text = _lxml_text(article, " ")
+        posts.append({"post_id": post_id, "text": _clean_text(text)})
+    return _page_info(last_page, last_page_href, posts)
+
+
+# ---------- потоковый извлекатель ----------
+
+# Элементы без закрывающего тега не участвуют в подсчёте вложенности
+_VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+}
+
+
+class _ForumPageExtractor(HTMLParser):
+    """
+    Потоковый разбор без построения дерева: отслеживаются только навигация,
+    статьи article.message и их .bbWrapper. Конец сообщения определяется по
+    вложенности тегов article, границы .message-content и .bbWrapper — по
+    вложенности тегов того же имени (обычно div): незакрытые <p>/<li> внутри
+    сообщения не сдвигают счётчик, и подпись не попадает в текст.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.nav_hrefs = []
+        self.all_hrefs = []
+        self.seen_nav = False
+        self.posts = []
+        self._in_nav = 0
+        self._skip = 0
+        self._post = None
+        self._articles = 0
+        self._content = None
+        self._body = None
+        self._body_in_content = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get("class") or "").split()
+        href = attrs.get("href")
+
+        if tag == "nav" and "pageNav" in classes:
+            self._in_nav += 1
+            self.seen_nav = True
+        elif tag == "nav" and self._in_nav:
+            self._in_nav += 1
+        if tag == "a" and href and "page-" in href:
+            self.all_hrefs.append(href)
+            if self._in_nav:
+                self.nav_hrefs.append(href)
+
+        if self._post is None:
+            if tag == "article" and "message" in classes:
+                self._post = {"attrs": attrs, "link_id": None, "body": None, "content_body": None, "all": []}
+                self._articles = 1
+            return
+
+        if tag in ("script", "style"):
+            self._skip += 1
+        if tag == "a" and href and self._post["link_id"] is None:
+            m = _POST_LINK_RE.search(href)
+            if m:
+                self._post["link_id"] = m.group(1)
+        if tag in _VOID_TAGS:
+            return
+        if tag == "article":
+            self._articles += 1
+        # [имя тега, вложенность] открытых .message-content и .bbWrapper
+        for region in (self._content, self._body):
+            if region is not None and region[0] == tag:
+                region[1] += 1
+        if "message-content" in classes and self._content is None:
+            self._content = [tag, 1]
+        if "bbWrapper" in classes and self._body is None:
+            in_content = self._content is not None
+            # Нужен первый .bbWrapper внутри .message-content, иначе — первый в сообщении
+            if self._post["content_body"] is None and (in_content or self._post["body"] is None):
+                self._body = [tag, 1]
+                self._body_in_content = in_content
+                self._post["content_body" if in_content else "body"] = []
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if self._post is not None and tag not in _VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag == "nav" and self._in_nav:
+            self._in_nav -= 1
+        if self._post is None or tag in _VOID_TAGS:
+            return
+        if tag in ("script", "style") and self._skip:
+            self._skip -= 1
+        if self._body is not None and self._body[0] == tag:
+            self._body[1] -= 1
+            if self._body[1] == 0:
+                self._body = None
+        if self._content is not None and self._content[0] == tag:
+            self._content[1] -= 1
+            if self._content[1] == 0:
+                self._content = None
+        if tag == "article":
+            self._articles -= 1
+            if self._articles == 0:
+                self._finish_post()
+
+    def handle_data(self, data):
+        if self._post is None or self._skip:
+            return
+        text = data.strip()
+        if not text:
+            return
+        self._post["all"].append(text)
+        if self._body is not None:
+            self._post["content_body" if self._body_in_content else "body"].append(text)
+
+    def _finish_post(self):
+        post = self._post
+        self._post = None
+        self._content = None
+        self._body = None
+        post_id = _post_id_from_attrs(post["attrs"]) or post["link_id"]
+        body = post["content_body"] if post["content_body"] is not None else post["body"]
+        text = "\n".join(body) if body is not None else " ".join(post["all"])
+        self.posts.append({"post_id": post_id, "text": _clean_text(text)})
+
+
+def parse_page_stream(html: str) -> dict:
+    extractor = _ForumPageExtractor()
+    start = html.find("<body")
+    html = html[start:] if start != -1 else html
+    # Навигация XenForo есть и над сообщениями: если она уже встретилась,
+    # всё после последнего </article> можно не разбирать
+    end = html.rfind("</article>")
+    if end != -1:
+        end += len("</article>")
+        extractor.feed(html[:end])
+        if not extractor.seen_nav:
+            extractor.feed(html[end:])
+    else:
+        extractor.feed(html)
+    extractor.close()
+    hrefs = extractor.nav_hrefs if extractor.seen_nav else extractor.all_hrefs
+    last_page, last_page_href = _last_page(hrefs)
+    return _page_info(last_page, last_page_href, extractor.posts)
+
+
+# ---------- выбор бэкенда ----------
+
+PARSERS = {
+    "selectolax": parse_page_selectolax,
+    "lxml": parse_page_lxml,
+    "stream": parse_page_stream,
+    "bs4": parse_page_bs4,
+}
+
+_AUTO_ORDER = ("selectolax", "lxml", "stream")
+_MODULES = {"selectolax": "selectolax.lexbor", "lxml": "lxml.html", "bs4": "bs4"}
+
+
+def is_available(name: str) -> bool:
+    module = _MODULES.get(name)
+    if module is None:
+        return name in PARSERS
+    try:
+        __import__(module)
+    except ImportError:
+        return False
+    return True
+
+
+def resolve_parser(name: str | None = None) -> str:
+    """Имя бэкенда для FORUM_PARSER (auto — первый доступный быстрый)"""
+    name = (name or FORUM_PARSER).lower()
+    if name in PARSERS and is_available(name):
+        return name
+    if name not in ("auto", ""):
+        logger.warning(f"⚠️ Парсер форума {name} недоступен, выбираем автоматически")
+    return next(n for n in _AUTO_ORDER if is_available(n))
+
+
+_active_parser = None
+
+
+def parse_forum_page(body: bytes, encoding: str = "utf-8", parser: str | None = None) -> dict:
+    """
+    Разбирает страницу темы: номер последней страницы и все сообщения по порядку.
+    При ошибке быстрого бэкенда страница разбирается через BeautifulSoup.
+    """
+    global _active_parser
+    if parser is None:
+        if _active_parser is None:
+            _active_parser = resolve_parser()
+        parser = _active_parser
+    html = body.decode(encoding or "utf-8", errors="replace")
+    try:
+        return PARSERS[parser](html)
+    except Exception as e:
+        if parser == "bs4":
+            raise
+        logger.warning(f"⚠️ Парсер {parser} не справился со страницей ({e}), используем BeautifulSoup")
+        return parse_page_bs4(html)
+
+
+def timed_parse_forum_page(body: bytes, encoding: str = "utf-8") -> tuple:
+    """
+    parse_forum_page с замером времени разбора (в секундах).
+    Чистая функция верхнего уровня — пригодна для ProcessPoolExecutor.
+    """
+    start = time.perf_counter()
+    info = parse_forum_page(body, encoding)
+    return info, time.perf_counter() - start
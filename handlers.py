@@ -4,17 +4,27 @@
 """
 
 import discord
+import hashlib
+import hmac
 import json
 import os
 import re
+import secrets
 import time
 import logging
-from urllib.parse import urljoin, urlparse
+from urllib.parse import parse_qs, urlparse
 import aiohttp
+from aiohttp import web
 import asyncio
+import contextvars
+import random
+import tempfile
 import traceback
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from xml.etree import ElementTree
 from discord.ext import tasks
-from bs4 import BeautifulSoup
+from forum_parser import timed_parse_forum_page
 
 # Основной логгер и отдельный для парсинга форума
 logger = logging.getLogger("genesis_bot")
@@ -28,9 +38,6 @@ json_lock = asyncio.Lock()
 user_reaction_locks = {}
 user_locks_lock = asyncio.Lock()
 
-# Глобальная блокировка для всех операций с ролями
-global_roles_lock = asyncio.Lock()
-
 # =============================================================================
 # КОНСТАНТЫ И НАСТРОЙКИ
 # =============================================================================
@@ -40,6 +47,30 @@ REACTION_ROLES_FILE = "reaction_roles.json"      # Роли для реакци
 REACTION_MESSAGE_FILE = "reaction_message.json"  # ID сообщения с ролями
 TRACKING_FILE = "channels.json"                  # Отслеживаемые каналы
 NOTIFIED_FILE = "notified.json"                  # Уже отправленные уведомления
+FORUM_STATE_FILE = "forum_state.json"            # Служебное состояние опроса форума (номера страниц)
+FORUM_THREADS_FILE = "forum_threads.json"        # Дополнительные отслеживаемые темы форума
+TWITCH_TOKEN_FILE = "twitch_token.json"          # Токен приложения Twitch (при TWITCH_TOKEN_PERSIST)
+YOUTUBE_STATE_FILE = "youtube_state.json"        # Плейлисты загрузок и кэш channelId YouTube, расход квоты
+TWITCH_STATE_FILE = "twitch_state.json"          # ID пользователей Twitch и секрет подписок EventSub
+
+# Секции StateStore и их JSON-файлы: JSON-бэкенд и перенос в SQLite (в том числе
+# ручной, python state_sqlite.py) используют один и тот же список
+STATE_JSON_FILES = {
+    "tracking": TRACKING_FILE,
+    "notified": NOTIFIED_FILE,
+    "forum_state": FORUM_STATE_FILE,
+    "forum_threads": FORUM_THREADS_FILE,
+    "twitch_token": TWITCH_TOKEN_FILE,
+    "youtube_state": YOUTUBE_STATE_FILE,
+    "twitch_state": TWITCH_STATE_FILE,
+}
+
+# Бэкенд хранения состояния: "json" (по умолчанию) или "sqlite"
+STATE_BACKEND = os.getenv("STATE_BACKEND", "json").lower()
+STATE_DB_FILE = os.getenv("STATE_DB_FILE", "state.db")
+
+# Компактная (без отступов) сериализация файлов состояния
+STATE_JSON_COMPACT = os.getenv("STATE_JSON_COMPACT", "").lower() in ("1", "true", "yes")
 
 # URL форума для мониторинга
 FORUM_URL = os.getenv(
@@ -52,15 +83,79 @@ ORDERS_URL = os.getenv(
 )
 FORUM_BASE = os.getenv("FORUM_BASE", "https://forum.gta5rp.com")
 
+# Число сообщений на странице темы (XenForo по умолчанию — 20)
+FORUM_POSTS_PER_PAGE = int(os.getenv("FORUM_POSTS_PER_PAGE", "20"))
+
+# Где разбирать страницы форума: "thread" (по умолчанию), "process" или "inline" (в event loop)
+FORUM_PARSE_EXECUTOR = os.getenv("FORUM_PARSE_EXECUTOR", "thread").lower()
+FORUM_PARSE_WORKERS = int(os.getenv("FORUM_PARSE_WORKERS", "2"))
+
+# Адреса Twitch API (переопределяются для тестов с локальным сервером)
+TWITCH_API_BASE = os.getenv("TWITCH_API_BASE", "https://api.twitch.tv/helix")
+TWITCH_ID_BASE = os.getenv("TWITCH_ID_BASE", "https://id.twitch.tv")
+
+# Сохранять токен приложения Twitch в состоянии между перезапусками (twitch_token.json / state.db)
+TWITCH_TOKEN_PERSIST = os.getenv("TWITCH_TOKEN_PERSIST", "").lower() in ("1", "true", "yes")
+
+# Одновременных запросов к Helix при опросе стримов (по 100 логинов в запросе)
+TWITCH_CONCURRENCY = int(os.getenv("TWITCH_CONCURRENCY", "4"))
+
+# Twitch EventSub (webhook): публичный HTTPS-адрес колбэка встроенного веб-сервера,
+# например https://bot.example.com/eventsub/twitch (пусто — выключено, стримы только опрашиваются)
+TWITCH_EVENTSUB_CALLBACK = os.getenv("TWITCH_EVENTSUB_CALLBACK", "").strip()
+TWITCH_EVENTSUB_SECRET = os.getenv("TWITCH_EVENTSUB_SECRET", "")   # 10–100 символов; пусто — генерируется и хранится в twitch_state (в .gitignore)
+# Базовый интервал опроса Helix /streams, пока работает EventSub (опрос только сверяет пропущенное)
+TWITCH_EVENTSUB_POLL_SECONDS = float(os.getenv("TWITCH_EVENTSUB_POLL_SECONDS", "900"))
+
 # API ключ для YouTube
 YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
 
+# Как опрашивать YouTube: "playlist" (playlistItems.list по плейлисту загрузок, 1 единица квоты),
+# "rss" (публичная Atom-лента, без ключа и квоты) или "search" (search.list, 100 единиц — прежний способ)
+YOUTUBE_BACKEND = os.getenv("YOUTUBE_BACKEND", "playlist" if YOUTUBE_API_KEY else "rss").lower()
+YOUTUBE_DAILY_QUOTA = int(os.getenv("YOUTUBE_DAILY_QUOTA", "10000"))
+YOUTUBE_API_BASE = os.getenv("YOUTUBE_API_BASE", "https://www.googleapis.com/youtube/v3")
+YOUTUBE_FEED_URL = os.getenv("YOUTUBE_FEED_URL", "https://www.youtube.com/feeds/videos.xml")
+
+# Одновременных запросов последнего видео при опросе YouTube (по одному на канал)
+YOUTUBE_CONCURRENCY = int(os.getenv("YOUTUBE_CONCURRENCY", "8"))
+
+# Сколько хранить ответы handle/ссылка -> channelId: найденные каналы и «не найдено»
+YOUTUBE_RESOLVE_TTL = float(os.getenv("YOUTUBE_RESOLVE_TTL_DAYS", "30")) * 86400
+YOUTUBE_RESOLVE_NEGATIVE_TTL = float(os.getenv("YOUTUBE_RESOLVE_NEGATIVE_TTL_HOURS", "6")) * 3600
+
+# Push-уведомления YouTube через WebSub (PubSubHubbub): публичный адрес колбэка
+# встроенного веб-сервера, например https://bot.example.com/websub/youtube (пусто — выключено)
+YOUTUBE_WEBSUB_CALLBACK = os.getenv("YOUTUBE_WEBSUB_CALLBACK", "").strip()
+YOUTUBE_WEBSUB_HUB = os.getenv("YOUTUBE_WEBSUB_HUB", "https://pubsubhubbub.appspot.com/subscribe")
+YOUTUBE_WEBSUB_SECRET = os.getenv("YOUTUBE_WEBSUB_SECRET", "")   # пусто — генерируется и хранится в youtube_state (в .gitignore)
+YOUTUBE_WEBSUB_LEASE_SECONDS = int(os.getenv("YOUTUBE_WEBSUB_LEASE_SECONDS", "432000"))
+# Базовый интервал опроса YouTube, пока работает WebSub (опрос только сверяет пропущенное)
+YOUTUBE_WEBSUB_POLL_SECONDS = float(os.getenv("YOUTUBE_WEBSUB_POLL_SECONDS", "1800"))
+
+# Встроенный веб-сервер для push-уведомлений (на Railway порт задаётся переменной PORT)
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", os.getenv("PORT", "8080")))
+
 # Конфликтующие роли (нельзя иметь одновременно)
 CONFLICTING_ROLES = {
     "GOS": ["Crime"],
     "Crime": ["GOS"]
 }
 
+# Интервал полной сверки конфликтующих ролей (часы); между сверками нарушения отслеживаются по событиям
+ROLE_RECONCILE_HOURS = float(os.getenv("ROLE_RECONCILE_HOURS", "6"))
+
+# Адаптивный опрос источников: (базовый, минимальный, максимальный) интервал в секундах.
+# После новых публикаций источник опрашивается чаще, при ошибках и 429/5xx — реже.
+POLL_INTERVALS = {
+    "forum": (float(os.getenv("FORUM_POLL_SECONDS", "300")), 60.0, 3600.0),
+    "twitch": (float(os.getenv("TWITCH_POLL_SECONDS", "120")), 60.0, 1800.0),
+    "youtube": (float(os.getenv("YOUTUBE_POLL_SECONDS", "120")), 60.0, 3600.0),
+}
+POLL_TICK_SECONDS = 15     # Как часто циклы проверяют, какие источники пора опрашивать
+POLL_JITTER = 0.1          # Случайный разброс интервала (±10%), чтобы циклы не срабатывали одновременно
+
 # =============================================================================
 # УТИЛИТЫ ДЛЯ РАБОТЫ С JSON
 # =============================================================================
@@ -68,16 +163,253 @@ CONFLICTING_ROLES = {
 def load_json(file_path, default_data):
     """Загружает данные из JSON файла или создает новый с данными по умолчанию"""
     if not os.path.exists(file_path):
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(default_data, f, ensure_ascii=False, indent=2)
+        save_json(file_path, default_data)
         return default_data
-    with open(file_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except json.JSONDecodeError as e:
+        # Повреждённый файл не должен ронять цикл опроса: откладываем его в сторону
+        corrupt_path = f"{file_path}.corrupt"
+        logger.error(f"❌ Повреждён JSON {file_path}: {e}. Копия сохранена в {corrupt_path}")
+        try:
+            os.replace(file_path, corrupt_path)
+        except OSError:
+            pass
+        save_json(file_path, default_data)
+        return default_data
+
+def dump_json_bytes(data, compact: bool | None = None) -> bytes:
+    """Сериализует данные в JSON; compact=True убирает отступы и пробелы"""
+    if compact is None:
+        compact = STATE_JSON_COMPACT
+    if compact:
+        text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    else:
+        text = json.dumps(data, ensure_ascii=False, indent=2)
+    return text.encode("utf-8")
+
+def write_file_atomic(file_path, payload: bytes):
+    """
+    Атомарно записывает файл: временный файл в той же папке, fsync, rename.
+    При падении посреди записи на диске остаётся либо старая, либо новая версия.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(file_path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    # fsync каталога, чтобы сам rename пережил сбой питания (не везде поддерживается)
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+def save_json(file_path, data, compact: bool | None = None):
+    """Атомарно сохраняет данные в JSON файл"""
+    write_file_atomic(file_path, dump_json_bytes(data, compact))
+
+def _snapshot(data):
+    """Быстрая копия вложенных dict/list, чтобы сериализовать её вне event loop"""
+    if isinstance(data, dict):
+        return {k: _snapshot(v) if isinstance(v, (dict, list)) else v for k, v in data.items()}
+    if isinstance(data, list):
+        return [_snapshot(v) if isinstance(v, (dict, list)) else v for v in data]
+    return data
+
+async def async_save_json(file_path, data, compact: bool | None = None):
+    """
+    Сохраняет JSON, не блокируя event loop: в loop снимается только копия данных,
+    а сериализация, запись и fsync выполняются в пуле потоков.
+    """
+    snapshot = _snapshot(data)
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, save_json, file_path, snapshot, compact)
+
+class JsonStateBackend:
+    """Бэкенд StateStore: каждая секция — отдельный JSON-файл, запись атомарная"""
 
-def save_json(file_path, data):
-    """Сохраняет данные в JSON файл"""
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    def __init__(self, files: dict):
+        # files: секция -> путь к файлу
+        self._files = files
+
+    def load(self, section: str, default_data):
+        return load_json(self._files[section], default_data)
+
+    def save(self, section: str, data):
+        save_json(self._files[section], data)
+
+    def close(self):
+        pass
+
+class StateStore:
+    """
+    Хранилище состояния в памяти процесса.
+    Данные читаются из бэкенда один раз, чтения обслуживаются из памяти,
+    а изменённые секции сбрасываются в бэкенд с задержкой (write-behind).
+    """
+
+    def __init__(self, defaults: dict, backend_factory, flush_delay: float = 5.0):
+        # defaults: секция -> фабрика данных по умолчанию
+        # backend_factory вызывается при первом обращении к данным, а не при импорте модуля,
+        # поэтому импорт handlers (бенчмарки, утилиты) не создаёт и не мигрирует state.db
+        self._defaults = defaults
+        self._backend_factory = backend_factory
+        self._backend = None
+        self._data = {}
+        self._dirty = set()
+        self._flush_task = None
+        self._writing = False
+        self.flush_delay = flush_delay
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = self._backend_factory()
+        return self._backend
+
+    def load_all(self):
+        """Создаёт бэкенд и загружает все секции (вызывается из setup_hook бота)"""
+        for section in self._defaults:
+            self.get(section)
+
+    def get(self, section: str):
+        """Возвращает данные секции, загружая их только при первом обращении"""
+        if section not in self._data:
+            # Копия: бэкенд хранит загруженные объекты как последний сохранённый снимок
+            self._data[section] = _snapshot(self.backend.load(section, self._defaults[section]()))
+        return self._data[section]
+
+    def set(self, section: str, data):
+        """Заменяет данные секции и планирует отложенную запись"""
+        self._data[section] = data
+        self.mark_dirty(section)
+
+    def mark_dirty(self, section: str):
+        """Помечает секцию изменённой; запись выполняется не чаще раза в flush_delay"""
+        self._dirty.add(section)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Вне event loop (скрипты, тесты) — пишем сразу
+            self.flush()
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        # Секции, изменённые во время записи, подхватываются следующей итерацией
+        while self._dirty:
+            await asyncio.sleep(self.flush_delay)
+            await self.flush_async()
+
+    async def flush_async(self):
+        """Записывает изменённые секции в пуле потоков, не блокируя event loop"""
+        loop = asyncio.get_running_loop()
+        while self._dirty:
+            section = self._dirty.pop()
+            self._writing = True
+            try:
+                # В поток уходит снимок, чтобы loop мог продолжать менять данные
+                snapshot = _snapshot(self._data[section])
+                await loop.run_in_executor(None, self.backend.save, section, snapshot)
+            except Exception as e:
+                logger.error(f"❌ Ошибка записи состояния ({section}): {e}")
+                self._dirty.add(section)
+                return
+            finally:
+                self._writing = False
+
+    def flush(self):
+        """Немедленно (синхронно) записывает все изменённые секции"""
+        while self._dirty:
+            section = self._dirty.pop()
+            self.backend.save(section, _snapshot(self._data[section]))
+
+    async def close(self):
+        """Дожидается текущей записи и сбрасывает всё в бэкенд (вызывается при остановке)"""
+        task = self._flush_task
+        if task is not None and not task.done():
+            if self._writing:
+                # Запись уже идёт в потоке — дожидаемся её, чтобы не перезаписать новые данные старыми
+                await asyncio.gather(task, return_exceptions=True)
+            else:
+                task.cancel()
+        await self.flush_async()
+        if self._backend is not None:
+            self._backend.close()
+
+def _default_tracking():
+    return {"twitch": [], "youtube": []}
+
+def _default_notified():
+    return {"twitch": {}, "youtube": {}, "forum": {}}
+
+def _default_forum_state():
+    return {"last_pages": {}}
+
+def _default_forum_threads():
+    return {}
+
+def _default_twitch_token():
+    return {}
+
+def _default_youtube_state():
+    return {"uploads": {}, "quota": {}, "resolved": {}, "channels": {}, "seen": {}, "websub": {}}
+
+def _default_twitch_state():
+    return {"users": {}, "eventsub": {}}
+
+def _create_state_backend():
+    """Создаёт бэкенд состояния согласно STATE_BACKEND (json по умолчанию)"""
+    if STATE_BACKEND == "sqlite":
+        from state_sqlite import SqliteStateBackend
+
+        backend = SqliteStateBackend(STATE_DB_FILE)
+        # Переносятся только ещё не перенесённые секции (в том числе добавленные позже)
+        if set(STATE_JSON_FILES) - backend.migrated_sections():
+            counts = backend.migrate_from_json(STATE_JSON_FILES)
+            logger.info(f"✅ Состояние перенесено из JSON в {STATE_DB_FILE}: {counts}")
+        return backend
+    return JsonStateBackend(STATE_JSON_FILES)
+
+# Единое хранилище состояния отслеживания и уведомлений
+state_store = StateStore(
+    {
+        "tracking": _default_tracking,
+        "notified": _default_notified,
+        "forum_state": _default_forum_state,
+        "forum_threads": _default_forum_threads,
+        "twitch_token": _default_twitch_token,
+        "youtube_state": _default_youtube_state,
+        "twitch_state": _default_twitch_state,
+    },
+    _create_state_backend,
+)
+
+def was_notified_before(kind: str, key: str, value) -> bool:
+    """
+    Уведомляли ли когда-либо об этом значении (ID стрима/видео). История есть
+    только у SQLite-бэкенда (проверка по множеству в памяти, без запроса к базе);
+    с JSON дубли отсекаются лишь по notified.
+    """
+    check = getattr(state_store.backend, "was_notified", None)
+    return bool(check and check(kind, key, value))
 
 def load_reaction_roles():
     """Загружает роли для реакций из файла"""
@@ -88,16 +420,83 @@ def load_reaction_message_id():
     data = load_json(REACTION_MESSAGE_FILE, {})
     return data.get("message_id")
 
-def load_tracking():
-    """Загружает список отслеживаемых каналов, убирая дубликаты"""
-    data = load_json(TRACKING_FILE, {"twitch": [], "youtube": []})
+class ReactionRolesConfig:
+    """
+    Кэш конфигурации reaction-ролей и ID сообщения с ролями.
+    Файлы перечитываются только при изменении mtime (проверка не чаще раза
+    в CHECK_INTERVAL секунд) или явно через reload(), поэтому реакции на
+    посторонние сообщения отсеиваются без обращения к диску.
+    """
+
+    CHECK_INTERVAL = 30.0
+
+    def __init__(self, roles_file: str, message_file: str):
+        self._roles_file = roles_file
+        self._message_file = message_file
+        self.roles = {}          # эмодзи -> название роли
+        self.message_id = None
+        self._mtimes = {}
+        self._checked_at = 0.0
+        self._loaded = False
+
+    @staticmethod
+    def _mtime(path: str):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _current_mtimes(self):
+        return {path: self._mtime(path) for path in (self._roles_file, self._message_file)}
+
+    def reload(self):
+        """Перечитывает оба файла конфигурации"""
+        self.roles = load_reaction_roles()
+        self.message_id = load_reaction_message_id()
+        self._mtimes = self._current_mtimes()
+        self._checked_at = time.monotonic()
+        self._loaded = True
+
+    def refresh_if_changed(self):
+        """Перечитывает конфигурацию, если файлы изменились (не чаще CHECK_INTERVAL)"""
+        if not self._loaded:
+            self.reload()
+            return
+        now = time.monotonic()
+        if now - self._checked_at < self.CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        if self._current_mtimes() != self._mtimes:
+            logger.info("🔄 Конфигурация reaction-ролей изменилась, перечитываем")
+            self.reload()
+
+    def set_message_id(self, message_id: int):
+        """Обновляет ID сообщения после его записи в файл"""
+        self.message_id = message_id
+        self._mtimes = self._current_mtimes()
+
+    def role_for(self, message_id: int, emoji: str) -> str | None:
+        """O(1): название роли для реакции или None, если реакция не относится к сообщению с ролями"""
+        self.refresh_if_changed()
+        if self.message_id is None or message_id != self.message_id:
+            return None
+        return self.roles.get(emoji)
+
+reaction_roles_config = ReactionRolesConfig(REACTION_ROLES_FILE, REACTION_MESSAGE_FILE)
+
+def _normalize_tracking(data):
+    """Убирает дубликаты и приводит Twitch-логины к нижнему регистру"""
     data["twitch"] = list(dict.fromkeys([s.lower() for s in data.get("twitch", [])]))
     data["youtube"] = list(dict.fromkeys(data.get("youtube", [])))
     return data
 
+def load_tracking():
+    """Загружает список отслеживаемых каналов, убирая дубликаты"""
+    return _normalize_tracking(state_store.get("tracking"))
+
 def save_tracking(data):
     """Сохраняет список отслеживаемых каналов"""
-    save_json(TRACKING_FILE, data)
+    state_store.set("tracking", data)
 
 # Асинхронные, защищенные версии доступа к JSON-состоянию
 async def async_load_notified():
@@ -118,11 +517,11 @@ async def async_save_tracking(data):
 
 def load_notified():
     """Загружает список уже отправленных уведомлений"""
-    return load_json(NOTIFIED_FILE, {"twitch": {}, "youtube": {}, "forum": {}})
+    return state_store.get("notified")
 
 def save_notified(data):
     """Сохраняет список уже отправленных уведомлений"""
-    save_json(NOTIFIED_FILE, data)
+    state_store.set("notified", data)
 
 async def get_user_reaction_lock(user_id: int) -> asyncio.Lock:
     """Получает блокировку для обработки реакций конкретного пользователя"""
@@ -142,31 +541,314 @@ async def cleanup_old_user_locks():
         user_reaction_locks.clear()
         user_reaction_locks.update(active_locks)
 
+# =============================================================================
+# ОБЩАЯ HTTP-СЕССИЯ
+# =============================================================================
+
+# Заголовки и таймаут для загрузки страниц форума
+FORUM_HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"}
+FORUM_TIMEOUT = aiohttp.ClientTimeout(total=30)
+
+# Таймаут по умолчанию для запросов к API (Twitch, YouTube)
+API_TIMEOUT = aiohttp.ClientTimeout(total=8)
+
+_http_session = None
+_http_session_closed = False   # Сессия закрыта при остановке бота и не открывается заново
+
+def create_http_session() -> aiohttp.ClientSession:
+    """
+    Создаёт долгоживущую сессию с пулом соединений: keep-alive между тиками,
+    ограничение соединений на хост и кэш DNS, чтобы не платить за TCP/TLS
+    рукопожатия и DNS-запросы на каждом опросе.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=100,
+        limit_per_host=10,
+        ttl_dns_cache=300,
+        keepalive_timeout=60,
+        enable_cleanup_closed=True,
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=API_TIMEOUT)
+
+def open_http_session() -> aiohttp.ClientSession:
+    """Открывает общую сессию (вызывается из setup_hook бота)"""
+    global _http_session, _http_session_closed
+    _http_session_closed = False
+    if _http_session is None or _http_session.closed:
+        _http_session = create_http_session()
+    return _http_session
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Возвращает общую сессию, открывая её при первом обращении (но не после close_http_session)"""
+    if _http_session_closed:
+        raise RuntimeError("HTTP-сессия закрыта: бот останавливается")
+    return open_http_session()
+
+async def close_http_session():
+    """Закрывает общую сессию (вызывается при остановке бота)"""
+    global _http_session, _http_session_closed
+    _http_session_closed = True
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+# =============================================================================
+# АДАПТИВНЫЙ ПЛАНИРОВЩИК ОПРОСА
+# =============================================================================
+
+# Источник, который опрашивается в текущей задаче (для учёта ответов HTTP и ошибок)
+_current_poll_source = contextvars.ContextVar("current_poll_source", default=None)
+
+def _parse_retry_after(headers) -> float | None:
+    """Задержка из Retry-After (секунды или HTTP-дата) или Ratelimit-Reset (Twitch, unix-время)"""
+    value = headers.get("Retry-After")
+    if value:
+        value = value.strip()
+        if value.isdigit():
+            return float(value)
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+    reset = headers.get("Ratelimit-Reset")
+    if reset and reset.isdigit():
+        return max(0.0, int(reset) - time.time())
+    return None
+
+class PollScheduler:
+    """
+    Центральный планировщик опроса (форум, Twitch, YouTube).
+    Циклы tasks.loop срабатывают часто (POLL_TICK_SECONDS) и спрашивают
+    планировщик, пора ли опрашивать источник. Интервал каждого источника:
+      * сокращается вдвое после новых публикаций (до минимального) и
+        постепенно возвращается к базовому, пока источник молчит;
+      * растёт экспоненциально при ошибках и ответах 429/5xx (до максимального);
+      * не меньше Retry-After, если сервер его прислал;
+      * получает случайный разброс ±POLL_JITTER.
+    Источники сообщают о событиях через note_response/mark_activity/record_error
+    внутри run_if_due — текущий источник берётся из contextvars.
+    """
+
+    def __init__(self, jitter: float = POLL_JITTER):
+        self.jitter = jitter
+        self.sources = {}
+
+    def register(self, name: str, base: float, min_interval: float, max_interval: float):
+        """Добавляет источник; повторный вызов с другими границами обновляет их"""
+        source = self.sources.get(name)
+        if source is not None and (source["base"], source["min"], source["max"]) != (base, min_interval, max_interval):
+            source.update({"base": base, "min": min_interval, "max": max_interval})
+            source["interval"] = min(max(source["interval"] if source["failures"] else base, min_interval), max_interval)
+            # Интервал сократился (например, истекла подписка WebSub) — не ждём запуска, назначенного по старому
+            if source["last_run"] is not None:
+                source["next_run"] = min(source["next_run"], source["last_run"] + source["interval"])
+        if name not in self.sources:
+            self.sources[name] = {
+                "base": base,
+                "min": min_interval,
+                "max": max_interval,
+                "interval": base,
+                "next_run": 0.0,
+                "last_run": None,
+                "last_duration": None,
+                "failures": 0,
+                "last_error": None,
+                "retry_after": None,
+                "runs": 0,
+            }
+        return self.sources[name]
+
+    def forget(self, name: str):
+        self.sources.pop(name, None)
+
+    def is_due(self, name: str, now: float | None = None) -> bool:
+        source = self.sources.get(name)
+        return source is None or (now or time.time()) >= source["next_run"]
+
+    async def run_if_due(self, name: str, func, *args):
+        """Запускает func(*args), если подошло время источника, и планирует следующий запуск"""
+        source = self.sources[name]
+        now = time.time()
+        if now < source["next_run"]:
+            return False
+        outcome = {"activity": False, "error": None, "throttled": None, "retry_after": None}
+        token = _current_poll_source.set(outcome)
+        start = time.perf_counter()
+        try:
+            await func(*args)
+        except Exception as e:
+            outcome["error"] = str(e) or type(e).__name__
+            logger.error(f"❌ Ошибка опроса {name}: {e}")
+        finally:
+            _current_poll_source.reset(token)
+        source["last_duration"] = time.perf_counter() - start
+        source["last_run"] = now
+        source["runs"] += 1
+        self._reschedule(source, outcome)
+        return True
+
+    def _reschedule(self, source: dict, outcome: dict):
+        if outcome["throttled"] or outcome["error"]:
+            source["failures"] += 1
+            source["last_error"] = outcome["throttled"] or outcome["error"]
+            source["interval"] = min(source["max"], source["base"] * 2 ** min(source["failures"], 10))
+        else:
+            source["failures"] = 0
+            source["last_error"] = None
+            if outcome["activity"]:
+                source["interval"] = max(source["min"], source["interval"] / 2)
+            else:
+                source["interval"] = min(source["base"], source["interval"] * 1.5)
+        delay = source["interval"] * random.uniform(1 - self.jitter, 1 + self.jitter)
+        retry_after = outcome["retry_after"]
+        source["retry_after"] = retry_after
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        source["next_run"] = time.time() + delay
+
+    # ---------- сигналы из текущего опроса ----------
+
+    @staticmethod
+    def note_response(resp: aiohttp.ClientResponse):
+        """Учитывает ответ HTTP: 429 и 5xx замедляют источник, Retry-After соблюдается"""
+        outcome = _current_poll_source.get()
+        if outcome is None or (resp.status != 429 and resp.status < 500):
+            return
+        outcome["throttled"] = f"HTTP {resp.status}"
+        retry_after = _parse_retry_after(resp.headers)
+        if retry_after is not None:
+            outcome["retry_after"] = max(outcome["retry_after"] or 0.0, retry_after)
+
+    @staticmethod
+    def mark_activity():
+        """Источник опубликовал что-то новое — следующий опрос будет раньше"""
+        outcome = _current_poll_source.get()
+        if outcome is not None:
+            outcome["activity"] = True
+
+    @staticmethod
+    def record_error(error):
+        """Ошибка (исключение или текст), перехваченная внутри опроса — циклы логируют ошибки сами"""
+        outcome = _current_poll_source.get()
+        if outcome is not None:
+            outcome["error"] = str(error) or type(error).__name__
+
+    def snapshot(self) -> list:
+        """Состояние источников для команды /poll_schedule (по времени следующего запуска)"""
+        rows = []
+        for name, source in self.sources.items():
+            rows.append({
+                "name": name,
+                "interval": round(source["interval"]),
+                "base": round(source["base"]),
+                "next_run": source["next_run"],
+                "last_run": source["last_run"],
+                "last_duration_ms": round(source["last_duration"] * 1000) if source["last_duration"] is not None else None,
+                "failures": source["failures"],
+                "last_error": source["last_error"],
+                "retry_after": source["retry_after"],
+                "runs": source["runs"],
+            })
+        return sorted(rows, key=lambda r: r["next_run"])
+
+# Единый планировщик для всех циклов опроса
+poll_scheduler = PollScheduler()
+
 # --------------------------
 # Reaction roles setup
 # --------------------------
 
-def check_role_conflicts(member: discord.Member, new_role_name: str) -> tuple[bool, str]:
+def _member_role_ids(member: discord.Member) -> set:
+    """Множество ID ролей участника (только публичный member.roles)"""
+    return {r.id for r in member.roles}
+
+class GuildRoleIndex:
+    """
+    Предвычисленный индекс ролей гильдии для проверки конфликтов.
+    Хранит название роли -> Role и название -> множество ID ролей с этим названием,
+    а конфликты из CONFLICTING_ROLES — в виде пар множеств ID. Проверка участника
+    сводится к пересечениям множеств ID вместо поиска ролей по названию.
+    """
+
+    def __init__(self, guild: discord.Guild):
+        self.by_name = {}
+        self.ids_by_name = {}
+        for role in guild.roles:
+            # Как и discord.utils.get, по названию возвращаем первую подходящую роль
+            self.by_name.setdefault(role.name, role)
+            self.ids_by_name.setdefault(role.name, set()).add(role.id)
+        self.ids_by_name = {name: frozenset(ids) for name, ids in self.ids_by_name.items()}
+
+        # Неупорядоченные пары конфликтующих ролей (GOS/Crime учитывается один раз)
+        self.conflict_pairs = []
+        seen = set()
+        # Для каждой роли — названия всех ролей, с которыми она конфликтует (в обе стороны)
+        self.conflicts_of = {}
+        for role_name, conflicts in CONFLICTING_ROLES.items():
+            for conflict_name in conflicts:
+                self.conflicts_of.setdefault(role_name, set()).add(conflict_name)
+                self.conflicts_of.setdefault(conflict_name, set()).add(role_name)
+                key = frozenset((role_name, conflict_name))
+                if key in seen:
+                    continue
+                seen.add(key)
+                ids_a = self.ids_by_name.get(role_name, frozenset())
+                ids_b = self.ids_by_name.get(conflict_name, frozenset())
+                if ids_a and ids_b:
+                    self.conflict_pairs.append((role_name, conflict_name, ids_a, ids_b))
+        # Все ID, участвующие в конфликтах: быстрый отсев участников без таких ролей
+        self.conflict_role_ids = frozenset().union(*(a | b for _, _, a, b in self.conflict_pairs))
+
+    def role(self, name: str) -> discord.Role | None:
+        return self.by_name.get(name)
+
+    def conflict_for(self, new_role_name: str, role_ids: set) -> str | None:
+        """Название уже имеющейся роли, конфликтующей с new_role_name, или None"""
+        for conflict_name in self.conflicts_of.get(new_role_name, ()):
+            ids = self.ids_by_name.get(conflict_name)
+            if ids and not ids.isdisjoint(role_ids):
+                return conflict_name
+        return None
+
+    def violations(self, role_ids: set) -> list[tuple[str, str]]:
+        """Пары конфликтующих ролей, которые одновременно есть в role_ids"""
+        if self.conflict_role_ids.isdisjoint(role_ids):
+            return []
+        return [
+            (name_a, name_b)
+            for name_a, name_b, ids_a, ids_b in self.conflict_pairs
+            if not ids_a.isdisjoint(role_ids) and not ids_b.isdisjoint(role_ids)
+        ]
+
+# Индексы ролей по гильдиям; сбрасываются событиями on_guild_role_create/update/delete
+_role_indexes = {}
+
+def get_role_index(guild: discord.Guild) -> GuildRoleIndex:
+    """Возвращает индекс ролей гильдии, строя его при первом обращении"""
+    index = _role_indexes.get(guild.id)
+    if index is None:
+        index = GuildRoleIndex(guild)
+        _role_indexes[guild.id] = index
+    return index
+
+def invalidate_role_index(guild: discord.Guild):
+    """Сбрасывает индекс ролей гильдии (роль создана, изменена или удалена)"""
+    _role_indexes.pop(guild.id, None)
+    # Набор нарушений мог измениться вместе с ролями — пересчитаем при следующем обращении
+    conflict_tracker.mark_stale(guild)
+
+def check_role_conflicts(member: discord.Member, new_role_name: str, role_ids: set | None = None) -> tuple[bool, str]:
     """
     Проверяет конфликты ролей для пользователя.
+    role_ids — планируемый набор ID ролей (по умолчанию текущие роли участника).
     Возвращает (можно_выдать_роль, сообщение_об_ошибке).
     """
     try:
-        # Обновляем список ролей пользователя (на случай, если они изменились)
-        member_role_names = {r.name for r in member.roles}
-        
-        # Проверяем конфликты для новой роли
-        for conflict_name in CONFLICTING_ROLES.get(new_role_name, []):
-            if conflict_name in member_role_names:
-                return False, f"❌ Нельзя получить роль **{new_role_name}**, так как у вас уже есть роль **{conflict_name}**"
-        
-        # Проверяем конфликты от существующих ролей
-        for existing_role_name in member_role_names:
-            if existing_role_name in CONFLICTING_ROLES:
-                for conflict_name in CONFLICTING_ROLES[existing_role_name]:
-                    if conflict_name == new_role_name:
-                        return False, f"❌ Нельзя получить роль **{new_role_name}**, так как у вас уже есть роль **{existing_role_name}**"
-        
+        if role_ids is None:
+            role_ids = _member_role_ids(member)
+        conflict_name = get_role_index(member.guild).conflict_for(new_role_name, role_ids)
+        if conflict_name:
+            return False, f"❌ Нельзя получить роль **{new_role_name}**, так как у вас уже есть роль **{conflict_name}**"
         return True, ""
         
     except Exception as e:
@@ -174,7 +856,8 @@ def check_role_conflicts(member: discord.Member, new_role_name: str) -> tuple[bo
         return True, ""  # В случае ошибки разрешаем действие
 
 async def ensure_roles_message(guild: discord.Guild, channel_id: int):
-	roles_data = load_reaction_roles()
+	reaction_roles_config.reload()
+	roles_data = reaction_roles_config.roles
 	desired_text = "Выберите роль, нажав на соответствующую реакцию:\n" + "\n".join(
 		f"{emoji} — {role}" for emoji, role in roles_data.items()
 	)
@@ -186,34 +869,32 @@ async def ensure_roles_message(guild: discord.Guild, channel_id: int):
 		except Exception:
 			return
 
-	if os.path.exists(REACTION_MESSAGE_FILE):
+	msg_id = reaction_roles_config.message_id
+	if msg_id:
 		try:
-			with open(REACTION_MESSAGE_FILE, "r", encoding="utf-8") as f:
-				msg_id = json.load(f).get("message_id")
-			if msg_id:
-				msg = await channel.fetch_message(msg_id)
-				if msg and msg.content.strip() == desired_text.strip():
-					return
-				else:
-					await msg.edit(content=desired_text)
+			msg = await channel.fetch_message(msg_id)
+			if msg and msg.content.strip() == desired_text.strip():
+				return
+			else:
+				await msg.edit(content=desired_text)
+				try:
+					await msg.clear_reactions()
+				except Exception:
+					pass
+				for emoji in roles_data:
 					try:
-						await msg.clear_reactions()
+						await msg.add_reaction(emoji)
 					except Exception:
 						pass
-					for emoji in roles_data:
-						try:
-							await msg.add_reaction(emoji)
-						except Exception:
-							pass
-					return
+				return
 		except Exception:
 			pass
 
 	async for m in channel.history(limit=300):
 		try:
 			if m.content.strip() == desired_text.strip() and (guild.me is None or m.author == guild.me):
-				with open(REACTION_MESSAGE_FILE, "w", encoding="utf-8") as f:
-					json.dump({"message_id": m.id}, f, ensure_ascii=False, indent=2)
+				await async_save_json(REACTION_MESSAGE_FILE, {"message_id": m.id})
+				reaction_roles_config.set_message_id(m.id)
 				return
 		except Exception:
 			continue
@@ -224,558 +905,1365 @@ async def ensure_roles_message(guild: discord.Guild, channel_id: int):
 			await new_msg.add_reaction(emoji)
 		except Exception:
 			pass
-	with open(REACTION_MESSAGE_FILE, "w", encoding="utf-8") as f:
-		json.dump({"message_id": new_msg.id}, f, ensure_ascii=False, indent=2)
+	await async_save_json(REACTION_MESSAGE_FILE, {"message_id": new_msg.id})
+	reaction_roles_config.set_message_id(new_msg.id)
 
 # --------------------------
 # Reaction handling
 # --------------------------
 
+class ConflictTracker:
+    """
+    Текущий набор нарушений правил ролей, поддерживаемый по событиям.
+    on_member_update пересчитывает нарушения только у изменившегося участника,
+    а полный обход гильдии (reconcile) выполняется редко, порциями и с уступкой
+    event loop между ними.
+    """
+
+    def __init__(self, chunk_size: int = 500):
+        self.chunk_size = chunk_size
+        # guild_id -> {member_id: [(роль, конфликтующая_роль), ...]}
+        self._violations = {}
+        # guild_id -> время последнего полного обхода
+        self.reconciled_at = {}
+        self._stale = set()
+
+    def is_fresh(self, guild: discord.Guild) -> bool:
+        """Есть ли для гильдии актуальный набор нарушений"""
+        return guild.id in self.reconciled_at and guild.id not in self._stale
+
+    def mark_stale(self, guild: discord.Guild):
+        """Набор нарушений требует полного пересчёта (например, изменились роли гильдии)"""
+        self._stale.add(guild.id)
+
+    def update_member(self, member: discord.Member):
+        """Пересчитывает нарушения одного участника; возвращает найденные пары"""
+        guild_violations = self._violations.setdefault(member.guild.id, {})
+        if member.bot:
+            guild_violations.pop(member.id, None)
+            return []
+        found = get_role_index(member.guild).violations(_member_role_ids(member))
+        if found:
+            if member.id not in guild_violations:
+                for role1, role2 in found:
+                    logger.warning(f"Обнаружены конфликтующие роли у {member}: {role1} и {role2}")
+            guild_violations[member.id] = found
+        else:
+            guild_violations.pop(member.id, None)
+        return found
+
+    def on_member_update(self, before: discord.Member, after: discord.Member):
+        """Обработка изменения участника: пересчёт только при изменении набора ролей"""
+        if _member_role_ids(before) != _member_role_ids(after):
+            self.update_member(after)
+
+    def on_member_remove(self, member: discord.Member):
+        self._violations.get(member.guild.id, {}).pop(member.id, None)
+
+    def violations(self, guild: discord.Guild) -> dict:
+        """Текущие нарушения гильдии: {member_id: [(роль, конфликтующая_роль), ...]}"""
+        return self._violations.get(guild.id, {})
+
+    async def reconcile(self, guild: discord.Guild) -> int:
+        """
+        Полный обход участников гильдии порциями по chunk_size с уступкой event loop.
+        Возвращает количество участников с нарушениями.
+        """
+        index = get_role_index(guild)
+        self._stale.discard(guild.id)
+        members = list(guild.members)
+        fresh = {}
+        for start in range(0, len(members), self.chunk_size):
+            for member in members[start:start + self.chunk_size]:
+                if member.bot:
+                    continue
+                found = index.violations(_member_role_ids(member))
+                if found:
+                    fresh[member.id] = found
+            # Отдаём управление, чтобы не задерживать heartbeat и обработку событий
+            await asyncio.sleep(0)
+        self.replace(guild, fresh)
+        return len(fresh)
+
+    def set_member(self, guild: discord.Guild, member_id: int, pairs: list):
+        """Записывает нарушения участника, найденные внешним обходом"""
+        guild_violations = self._violations.setdefault(guild.id, {})
+        if pairs:
+            guild_violations[member_id] = pairs
+        else:
+            guild_violations.pop(member_id, None)
+
+    def replace(self, guild: discord.Guild, violations: dict):
+        """Заменяет набор нарушений гильдии результатом полного обхода"""
+        self._violations[guild.id] = violations
+        self.reconciled_at[guild.id] = time.time()
+        self._stale.discard(guild.id)
+
+conflict_tracker = ConflictTracker()
+
 async def fix_conflicting_roles(guild: discord.Guild) -> tuple[int, list[str]]:
     """
-    Проверяет всех участников сервера на наличие конфликтующих ролей.
+    Возвращает нарушения правил ролей на сервере из набора ConflictTracker
+    (полный обход выполняется, только если набор ещё не построен или устарел).
     Возвращает (количество_нарушений, список_сообщений).
     """
     violation_count = 0
     messages = []
     
     try:
-        for member in guild.members:
-            if member.bot:
-                continue
-                
-            member_roles = list(member.roles)
-            violations = []
-            
-            # Проверяем каждую роль пользователя на конфликты
-            for role in member_roles:
-                if role.name in CONFLICTING_ROLES:
-                    for conflict_name in CONFLICTING_ROLES[role.name]:
-                        conflict_role = discord.utils.get(guild.roles, name=conflict_name)
-                        if conflict_role and conflict_role in member_roles:
-                            violations.append(f"У пользователя {member.display_name} обнаружены конфликтующие роли: {role.name} и {conflict_name}")
-                            violation_count += 1
-            
-            if violations:
-                messages.extend(violations)
+        if not conflict_tracker.is_fresh(guild):
+            await conflict_tracker.reconcile(guild)
+        for member_id, pairs in conflict_tracker.violations(guild).items():
+            member = guild.get_member(member_id)
+            name = member.display_name if member else str(member_id)
+            for role_name, conflict_name in pairs:
+                messages.append(f"У пользователя {name} обнаружены конфликтующие роли: {role_name} и {conflict_name}")
+                violation_count += 1
                     
     except Exception as e:
         logger.error(f"Ошибка при проверке конфликтующих ролей: {e}")
         messages.append(f"Ошибка при проверке: {e}")
     
     return violation_count, messages
-async def handle_reaction_add(payload, bot):
-	msg_id = load_reaction_message_id()
-	if msg_id is None or payload.message_id != msg_id:
-		return
 
-	roles_data = load_reaction_roles()
-	guild = bot.get_guild(payload.guild_id)
-	if guild is None:
-		return
+class RoleEditPipeline:
+    """
+    Конвейер массовых изменений ролей с учётом rate limit'ов Discord:
+    ограниченное число одновременных запросов, минимальный интервал между
+    запросами и повтор при 429/5xx. Изменения выполняются под блокировкой
+    участника, чтобы не пересекаться с очередью реакций.
+    """
 
-	if payload.member is None or (hasattr(payload.member, "bot") and payload.member.bot):
-		try:
-			member = guild.get_member(payload.user_id) or await guild.fetch_member(payload.user_id)
-		except Exception:
-			return
-	else:
-		member = payload.member
+    def __init__(self, concurrency: int = 2, min_interval: float = 0.25, max_retries: int = 3):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._pace_lock = asyncio.Lock()
+        self._next_at = 0.0
+        self.min_interval = min_interval
+        self.max_retries = max_retries
+
+    async def _pace(self):
+        async with self._pace_lock:
+            delay = self._next_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_at = time.monotonic() + self.min_interval
+
+    async def apply(self, member_id: int, make_plan) -> bool:
+        """Строит план (make_plan) под блокировкой участника и применяет его"""
+        async with self._semaphore:
+            lock = await get_user_reaction_lock(member_id)
+            async with lock:
+                plan = make_plan()
+                if plan is None or not plan.changed():
+                    return True
+                for attempt in range(self.max_retries + 1):
+                    await self._pace()
+                    try:
+                        await plan.apply(reason="Исправление конфликтующих ролей")
+                        return True
+                    except discord.HTTPException as e:
+                        status = getattr(e, "status", 0)
+                        if attempt >= self.max_retries or (status != 429 and status < 500):
+                            logger.error(f"Ошибка при исправлении ролей участника {member_id}: {e}")
+                            return False
+                        retry_after = getattr(e, "retry_after", None) or 2 ** attempt
+                        logger.warning(f"Повтор изменения ролей участника {member_id} через {retry_after}с (HTTP {status})")
+                        await asyncio.sleep(retry_after)
+                    except Exception as e:
+                        logger.error(f"Ошибка при исправлении ролей участника {member_id}: {e}")
+                        return False
+        return False
+
+def _plan_conflict_fix(guild: discord.Guild, member_id: int):
+    """
+    План исправления конфликтов участника: из каждой пары конфликтующих ролей
+    остаётся роль, стоящая выше в иерархии сервера, остальные снимаются.
+    """
+    member = guild.get_member(member_id)
+    if member is None:
+        return None
+    index = get_role_index(guild)
+    plan = RoleMutationPlan(member)
+    for role_name, conflict_name in index.violations(plan.role_ids()):
+        held = [
+            guild.get_role(role_id)
+            for role_id in plan.role_ids() & (index.ids_by_name[role_name] | index.ids_by_name[conflict_name])
+        ]
+        held = sorted((r for r in held if r is not None), key=lambda r: r.position, reverse=True)
+        for role in held[1:]:
+            plan.remove(role)
+    return plan
+
+class RoleSweepJob:
+    """
+    Возобновляемый обход участников гильдии для /fix_roles.
+    Обрабатывает участников порциями по chunk_size, уступая event loop между ними,
+    сообщает прогресс через колбэк, поддерживает отмену и продолжение с места
+    остановки, а при apply_fixes исправляет нарушения через RoleEditPipeline.
+    """
 
-	# Используем глобальную блокировку для всех операций с ролями
-	async with global_roles_lock:
-		# Добавляем небольшую задержку для стабилизации
-		await asyncio.sleep(0.1)
-		
-		# Обновляем информацию о пользователе (на случай, если роли изменились)
+    def __init__(self, guild: discord.Guild, member_ids: list, *, apply_fixes: bool = False,
+                 full_scan: bool = True, chunk_size: int = 250):
+        self.guild = guild
+        self.member_ids = member_ids
+        self.apply_fixes = apply_fixes
+        self.full_scan = full_scan
+        self.chunk_size = chunk_size
+        self.position = 0
+        self.found = {}
+        self.fixed = 0
+        self.fix_failed = 0
+        self.status = "pending"
+        self.started_at = time.monotonic()
+        self._cancel = asyncio.Event()
+        self._pipeline = RoleEditPipeline()
+
+    @property
+    def total(self) -> int:
+        return len(self.member_ids)
+
+    def cancel(self):
+        self._cancel.set()
+
+    async def run(self, on_progress=None):
+        """Выполняет (или продолжает) обход; on_progress(job) вызывается после каждой порции"""
+        self.status = "running"
+        self._cancel.clear()
+        while self.position < self.total:
+            if self._cancel.is_set():
+                self.status = "cancelled"
+                return
+            index = get_role_index(self.guild)
+            chunk = self.member_ids[self.position:self.position + self.chunk_size]
+            to_fix = []
+            for member_id in chunk:
+                member = self.guild.get_member(member_id)
+                if member is None or member.bot:
+                    self.found.pop(member_id, None)
+                    conflict_tracker.set_member(self.guild, member_id, [])
+                    continue
+                pairs = index.violations(_member_role_ids(member))
+                conflict_tracker.set_member(self.guild, member_id, pairs)
+                if pairs:
+                    self.found[member_id] = pairs
+                    if self.apply_fixes:
+                        to_fix.append(member_id)
+                else:
+                    self.found.pop(member_id, None)
+
+            if to_fix:
+                results = await asyncio.gather(*(
+                    self._pipeline.apply(member_id, lambda member_id=member_id: _plan_conflict_fix(self.guild, member_id))
+                    for member_id in to_fix
+                ))
+                self.fixed += sum(1 for ok in results if ok)
+                self.fix_failed += sum(1 for ok in results if not ok)
+
+            self.position += len(chunk)
+            if on_progress is not None:
+                try:
+                    await on_progress(self)
+                except Exception as e:
+                    logger.error(f"Ошибка при отправке прогресса обхода ролей: {e}")
+            # Отдаём управление, чтобы не задерживать heartbeat и обработку событий
+            await asyncio.sleep(0)
+
+        if self.full_scan:
+            # Все участники гильдии пересчитаны через set_member — помечаем набор актуальным
+            conflict_tracker.replace(self.guild, dict(conflict_tracker.violations(self.guild)))
+        self.status = "done"
+
+    def messages(self) -> list[str]:
+        """Сообщения о найденных нарушениях в формате fix_conflicting_roles"""
+        messages = []
+        for member_id, pairs in self.found.items():
+            member = self.guild.get_member(member_id)
+            name = member.display_name if member else str(member_id)
+            for role_name, conflict_name in pairs:
+                messages.append(f"У пользователя {name} обнаружены конфликтующие роли: {role_name} и {conflict_name}")
+        return messages
+
+# Задачи /fix_roles по гильдиям (последняя запущенная, в т.ч. отменённая — для продолжения)
+role_sweep_jobs = {}
+
+def create_role_sweep_job(guild: discord.Guild, *, apply_fixes: bool = False, full_scan: bool = False) -> RoleSweepJob:
+    """
+    Создаёт задачу обхода. Без full_scan и при актуальном наборе ConflictTracker
+    обходятся только участники с известными нарушениями (O(нарушений)).
+    """
+    if full_scan or not conflict_tracker.is_fresh(guild):
+        member_ids = [m.id for m in guild.members]
+        full_scan = True
+    else:
+        member_ids = list(conflict_tracker.violations(guild))
+    job = RoleSweepJob(guild, member_ids, apply_fixes=apply_fixes, full_scan=full_scan)
+    role_sweep_jobs[guild.id] = job
+    return job
+
+class MemberRoleQueue:
+	"""
+	Очереди изменений ролей по участникам.
+	Изменения одного участника выполняются строго последовательно (под его
+	блокировкой из get_user_reaction_lock), разные участники обрабатываются
+	параллельно. Быстрые переключения одной реакции схлопываются: из
+	нескольких ожидающих add/remove одной роли выполняется только последнее.
+	"""
+
+	def __init__(self):
+		# user_id -> {role_name: (action, payload, bot, enqueued_at)}
+		self._pending = {}
+		self._workers = {}
+		self.enqueued = 0
+		self.coalesced = 0
+		self.processed = 0
+		self.failed = 0
+		self.wait_total = 0.0
+		self.wait_max = 0.0
+		self.depth_max = 0
+
+	def depth(self) -> int:
+		"""Текущее количество ожидающих изменений по всем участникам"""
+		return sum(len(items) for items in self._pending.values())
+
+	def enqueue(self, action: str, payload, bot, role_name: str):
+		"""Ставит изменение роли в очередь участника и запускает обработчик при необходимости"""
+		user_id = payload.user_id
+		items = self._pending.setdefault(user_id, {})
+		if role_name in items:
+			# Более раннее действие с этой же ролью ещё не выполнено — заменяем его
+			del items[role_name]
+			self.coalesced += 1
+		items[role_name] = (action, payload, bot, time.monotonic())
+		self.enqueued += 1
+		self.depth_max = max(self.depth_max, self.depth())
+
+		worker = self._workers.get(user_id)
+		if worker is None or worker.done():
+			self._workers[user_id] = asyncio.create_task(self._run(user_id))
+
+	async def _run(self, user_id: int):
+		lock = await get_user_reaction_lock(user_id)
 		try:
-			member = guild.get_member(payload.user_id) or await guild.fetch_member(payload.user_id)
-		except Exception:
-			return
-			
-		await _process_reaction_add(payload, bot, member, roles_data, guild)
-
-async def _process_reaction_add(payload, bot, member, roles_data, guild):
-	"""Внутренняя функция для обработки добавления реакции"""
-	emoji = str(payload.emoji)
-	role_name = roles_data.get(emoji)
-	if not role_name:
+			async with lock:
+				while self._pending.get(user_id):
+					# Забираем все накопившиеся изменения участника и применяем их одним запросом
+					items = self._pending.pop(user_id)
+					now = time.monotonic()
+					for _, _, _, enqueued_at in items.values():
+						wait = now - enqueued_at
+						self.wait_total += wait
+						self.wait_max = max(self.wait_max, wait)
+					try:
+						await _apply_role_changes(user_id, items)
+						self.processed += len(items)
+					except Exception as e:
+						self.failed += len(items)
+						logger.error(f"Ошибка при обработке очереди ролей пользователя {user_id}: {e}")
+		finally:
+			if not self._pending.get(user_id):
+				self._pending.pop(user_id, None)
+			self._workers.pop(user_id, None)
+
+	def stats(self) -> dict:
+		"""Метрики очередей: глубина, ожидание, схлопывания"""
+		started = self.processed + self.failed
+		return {
+			"depth": self.depth(),
+			"depth_max": self.depth_max,
+			"active_members": len(self._workers),
+			"enqueued": self.enqueued,
+			"coalesced": self.coalesced,
+			"processed": self.processed,
+			"failed": self.failed,
+			"wait_avg_ms": round(self.wait_total / started * 1000, 1) if started else 0.0,
+			"wait_max_ms": round(self.wait_max * 1000, 1),
+		}
+
+role_queue = MemberRoleQueue()
+
+async def handle_reaction_add(payload, bot):
+	# Посторонние реакции отсеиваются по кэшу, без чтения файлов
+	role_name = reaction_roles_config.role_for(payload.message_id, str(payload.emoji))
+	if role_name is None:
 		return
-		
-	role = discord.utils.get(guild.roles, name=role_name)
-	if not role:
+	if payload.member is not None and payload.member.bot:
 		return
 
-	# Проверяем конфликты ролей
-	can_add_role, error_message = check_role_conflicts(member, role_name)
-	
-	if not can_add_role:
-		# Удаляем реакцию пользователя, так как роль не может быть выдана
+	role_queue.enqueue("add", payload, bot, role_name)
+
+class RoleMutationPlan:
+	"""
+	План изменения ролей участника: вычисляет итоговый набор ролей
+	(с учётом снятия конфликтующих) и применяет его одним member.edit(roles=...).
+	Участник ни в какой момент не остаётся с обеими конфликтующими ролями или без обеих.
+	"""
+
+	def __init__(self, member: discord.Member):
+		self.member = member
+		self._roles = {r.id: r for r in member.roles if not r.is_default()}
+		self._initial_ids = set(self._roles)
+		self.added = []
+		self.removed = []
+
+	def role_ids(self) -> set:
+		return set(self._roles)
+
+	def has(self, role: discord.Role) -> bool:
+		return role.id in self._roles
+
+	def add(self, role: discord.Role):
+		if role.id not in self._roles:
+			self._roles[role.id] = role
+			self.added.append(role)
+
+	def remove(self, role: discord.Role):
+		if role.id in self._roles:
+			del self._roles[role.id]
+			self.removed.append(role)
+
+	def changed(self) -> bool:
+		return set(self._roles) != self._initial_ids
+
+	async def apply(self, reason: str):
+		"""
+		Применяет итоговый набор ролей одним member.edit(roles=...) по участнику из кэша
+		(intents.members: кэш ролей обновляется событиями гейтвея, лишний GET не нужен).
+		Если запрос отклонён из-за устаревшего кэша (например, роль уже удалена),
+		участник перечитывается через fetch_member и разница накладывается на свежий
+		набор ролей. 403, 429 и 5xx пробрасываются: повтор решает вызывающий код.
+		"""
+		if not self.changed():
+			return
 		try:
-			channel = bot.get_channel(payload.channel_id)
-			if channel is None:
-				try:
-					channel = await bot.fetch_channel(payload.channel_id)  # type: ignore[attr-defined]
-				except Exception:
-					channel = None
-			if channel is None:
-				return
-			message = await channel.fetch_message(payload.message_id)  # type: ignore[union-attr]
-			await message.remove_reaction(payload.emoji, member)
-			logger.info(f"Отклонена попытка получения роли {role_name} пользователем {member}: {error_message}")
-			
-			# Отправляем личное сообщение пользователю
-			try:
-				await member.send(error_message)
-			except discord.Forbidden:
-				# Если личные сообщения закрыты, игнорируем
-				pass
-			except Exception as e:
-				logger.error(f"Ошибка при отправке личного сообщения: {e}")
-		except Exception as e:
-			logger.error(f"Ошибка при удалении реакции: {e}")
+			await self.member.edit(roles=list(self._roles.values()), reason=reason)
+		except discord.HTTPException as e:
+			if e.status in (403, 429) or e.status >= 500:
+				raise
+			fresh = await self.member.guild.fetch_member(self.member.id)
+			await fresh.edit(roles=self._merged_with(fresh), reason=reason)
+
+	def _merged_with(self, member: discord.Member) -> list:
+		"""Роли member с изменениями плана (выданные добавлены, снятые убраны)"""
+		removed = self._initial_ids - set(self._roles)
+		roles = {r.id: r for r in member.roles if not r.is_default() and r.id not in removed}
+		roles.update((role_id, role) for role_id, role in self._roles.items() if role_id not in self._initial_ids)
+		return list(roles.values())
+
+async def _apply_role_changes(user_id: int, items: dict):
+	"""
+	Применяет накопившиеся изменения ролей одного участника.
+	items: {role_name: (action, payload, bot, enqueued_at)} в порядке поступления.
+	"""
+	_, first_payload, bot, _ = next(iter(items.values()))
+	guild = bot.get_guild(first_payload.guild_id)
+	if guild is None:
 		return
-	
+
+	# Берём актуальное состояние участника (роли могли измениться, пока запрос ждал)
 	try:
+		member = guild.get_member(user_id) or await guild.fetch_member(user_id)
+	except Exception:
+		return
+
+	index = get_role_index(guild)
+	plan = RoleMutationPlan(member)
+	rejected = []
+	for role_name, (action, payload, bot, _) in items.items():
+		role = index.role(role_name)
+		if not role:
+			continue
+		if action == "remove":
+			# Снимаем только запрошенную роль, не трогаем другие
+			plan.remove(role)
+			continue
+
+		# Проверяем конфликты ролей с учётом уже запланированных изменений
+		can_add_role, error_message = check_role_conflicts(member, role_name, plan.role_ids())
+		if not can_add_role:
+			rejected.append((payload, bot, role_name, error_message))
+			continue
+
 		# Автоматически снимаем конфликтующие роли перед выдачей новой
-		conflicts_to_remove = []
 		for conflict_name in CONFLICTING_ROLES.get(role_name, []):
-			conflict_role = discord.utils.get(guild.roles, name=conflict_name)
-			if conflict_role and conflict_role in member.roles:
-				conflicts_to_remove.append(conflict_role)
-		
-		if conflicts_to_remove:
-			await member.remove_roles(*conflicts_to_remove)
-			conflict_names = ", ".join([r.name for r in conflicts_to_remove])
-			logger.info(f"Автоматически сняты конфликтующие роли {conflict_names} у пользователя {member} для получения роли {role_name}")
-		
-		# Выдаем роль
-		await member.add_roles(role)
-		logger.info(f"Выдана роль {role_name} пользователю {member}")
-	except Exception as e:
-		logger.error(f"Ошибка при выдаче роли: {e}")
+			conflict_role = index.role(conflict_name)
+			if conflict_role and plan.has(conflict_role):
+				plan.remove(conflict_role)
+		plan.add(role)
 
-async def handle_reaction_remove(payload, bot):
-	msg_id = load_reaction_message_id()
-	if msg_id is None or payload.message_id != msg_id:
-		return
+	try:
+		await plan.apply(reason="Reaction roles")
+		if plan.removed:
+			logger.info(f"Сняты роли {', '.join(r.name for r in plan.removed)} у пользователя {member}")
+		if plan.added:
+			logger.info(f"Выданы роли {', '.join(r.name for r in plan.added)} пользователю {member}")
+	except Exception as e:
+		logger.error(f"Ошибка при изменении ролей: {e}")
 
-	roles_data = load_reaction_roles()
-	guild = bot.get_guild(payload.guild_id)
-	if guild is None:
-		return
+	for payload, bot, role_name, error_message in rejected:
+		await _reject_reaction(payload, bot, member, role_name, error_message)
 
-	# Используем глобальную блокировку для всех операций с ролями
-	async with global_roles_lock:
-		# Добавляем небольшую задержку для стабилизации
-		await asyncio.sleep(0.1)
+async def _reject_reaction(payload, bot, member, role_name, error_message):
+	"""Удаляет реакцию пользователя, так как роль не может быть выдана, и сообщает причину"""
+	try:
+		channel = bot.get_channel(payload.channel_id)
+		if channel is None:
+			try:
+				channel = await bot.fetch_channel(payload.channel_id)  # type: ignore[attr-defined]
+			except Exception:
+				channel = None
+		if channel is None:
+			return
+		message = await channel.fetch_message(payload.message_id)  # type: ignore[union-attr]
+		await message.remove_reaction(payload.emoji, member)
+		logger.info(f"Отклонена попытка получения роли {role_name} пользователем {member}: {error_message}")
 		
-		await _process_reaction_remove(payload, bot, roles_data, guild)
+		# Отправляем личное сообщение пользователю
+		try:
+			await member.send(error_message)
+		except discord.Forbidden:
+			# Если личные сообщения закрыты, игнорируем
+			pass
+		except Exception as e:
+			logger.error(f"Ошибка при отправке личного сообщения: {e}")
+	except Exception as e:
+		logger.error(f"Ошибка при удалении реакции: {e}")
 
-async def _process_reaction_remove(payload, bot, roles_data, guild):
-	"""Внутренняя функция для обработки снятия реакции"""
-	emoji = str(payload.emoji)
-	role_name = roles_data.get(emoji)
-	if not role_name:
-		return
-		
-	role = discord.utils.get(guild.roles, name=role_name)
-	member = guild.get_member(payload.user_id)
-	if not role or not member:
+async def handle_reaction_remove(payload, bot):
+	# Посторонние реакции отсеиваются по кэшу, без чтения файлов
+	role_name = reaction_roles_config.role_for(payload.message_id, str(payload.emoji))
+	if role_name is None:
 		return
-		
-	try:
-		# Снимаем только запрошенную роль, не трогаем другие
-		await member.remove_roles(role)
-		logger.info(f"Снята роль {role_name} у пользователя {member}")
-			
-	except Exception as e:
-		logger.error(f"Ошибка при снятии роли: {e}")
+
+	role_queue.enqueue("remove", payload, bot, role_name)
 
 # --------------------------
 # Forum parsing + notifier (re-send if deleted)
 # --------------------------
-async def parse_forum():
-	timeout = aiohttp.ClientTimeout(total=30)
-	headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"}
-
-	async def fetch_soup(session, url):
-		async with session.get(url) as resp:
-			if resp.status != 200:
-				logger.error(f"Ошибка загрузки форума: {resp.status}")
-				return None
-			html = await resp.text()
-			return BeautifulSoup(html, "html.parser")
-
-	async with aiohttp.ClientSession(timeout=timeout, headers=headers) as session:
-		forum_logger.debug("🔍 Проверяем форум: %s", FORUM_URL)
-		soup = await fetch_soup(session, FORUM_URL)
-		if soup is None:
-			logger.error("❌ Не удалось загрузить страницу форума")
-			return None
+# Кэш HTTP-валидаторов страниц форума: url -> {"etag", "last_modified", "body_hash", "info"}
+_page_cache = {}
+
+# Одноразовые токены XenForo меняются при каждой загрузке и не влияют на содержимое темы
+_VOLATILE_HTML_RE = re.compile(rb'(?:data-csrf|name="_xfToken" value)=["\'][^"\']*["\']|"csrf":\s*"[^"]*"')
+
+def _page_body_hash(body: bytes) -> str:
+	return hashlib.sha256(_VOLATILE_HTML_RE.sub(b"", body)).hexdigest()
+
+# Пул для разбора страниц (создаётся при первом разборе) и статистика разборов
+_parse_executor = None
+_parse_stats = {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0, "wait_total": 0.0, "wait_max": 0.0, "failed": 0}
+
+def _get_parse_executor():
+	global _parse_executor
+	if _parse_executor is None and FORUM_PARSE_EXECUTOR != "inline":
+		if FORUM_PARSE_EXECUTOR == "process":
+			import multiprocessing
+			from concurrent.futures import ProcessPoolExecutor
+
+			# spawn: дочерние процессы не наследуют потоки и сокеты работающего бота
+			_parse_executor = ProcessPoolExecutor(
+				max_workers=FORUM_PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+			)
+		else:
+			from concurrent.futures import ThreadPoolExecutor
 
-		last_page_href = None
-		nav = soup.select_one("nav.pageNav") or soup
-		for a in nav.select("a[href*='page-']"):
-			m = re.search(r"page-(\d+)", a.get("href", ""))
-			if m:
-				last_page_href = a["href"]
-
-		thread_page_url = FORUM_URL
-		if last_page_href:
-			thread_page_url = urljoin(FORUM_BASE, last_page_href)
-			forum_logger.debug("📄 Переходим на последнюю страницу: %s", thread_page_url)
-			soup = await fetch_soup(session, thread_page_url)
-			if soup is None:
-				return None
+			_parse_executor = ThreadPoolExecutor(max_workers=FORUM_PARSE_WORKERS, thread_name_prefix="forum-parse")
+	return _parse_executor
 
-		posts = soup.select("article.message")
-		if not posts:
-			logger.error("❌ Не найдено сообщений на странице")
+async def _parse_page(body: bytes, encoding: str, url: str, log: logging.Logger) -> dict:
+	"""Разбирает страницу вне event loop (FORUM_PARSE_EXECUTOR) и учитывает время разбора"""
+	start = time.perf_counter()
+	executor = _get_parse_executor()
+	try:
+		if executor is None:
+			info, elapsed = timed_parse_forum_page(body, encoding)
+		else:
+			loop = asyncio.get_running_loop()
+			info, elapsed = await loop.run_in_executor(executor, timed_parse_forum_page, body, encoding)
+	except Exception:
+		_parse_stats["failed"] += 1
+		raise
+	wait = max(0.0, time.perf_counter() - start - elapsed)
+	stats = _parse_stats
+	stats["count"] += 1
+	stats["total"] += elapsed
+	stats["max"] = max(stats["max"], elapsed)
+	stats["last"] = elapsed
+	stats["wait_total"] += wait
+	stats["wait_max"] = max(stats["wait_max"], wait)
+	log.debug("⏱️ Разбор %s: %.1f мс (%d KB), ожидание пула %.1f мс", url, elapsed * 1000, len(body) // 1024, wait * 1000)
+	return info
+
+def forum_parse_stats() -> dict:
+	"""Сводка по разбору страниц форума (времена в миллисекундах)"""
+	stats = _parse_stats
+	count = stats["count"]
+	return {
+		"executor": FORUM_PARSE_EXECUTOR,
+		"workers": 0 if FORUM_PARSE_EXECUTOR == "inline" else FORUM_PARSE_WORKERS,
+		"count": count,
+		"failed": stats["failed"],
+		"avg_ms": round(stats["total"] / count * 1000, 1) if count else 0.0,
+		"max_ms": round(stats["max"] * 1000, 1),
+		"last_ms": round(stats["last"] * 1000, 1),
+		"wait_avg_ms": round(stats["wait_total"] / count * 1000, 1) if count else 0.0,
+		"wait_max_ms": round(stats["wait_max"] * 1000, 1),
+	}
+
+def shutdown_parse_executor():
+	"""Останавливает пул разбора страниц (при остановке бота)"""
+	global _parse_executor
+	if _parse_executor is not None:
+		_parse_executor.shutdown(wait=False, cancel_futures=True)
+		_parse_executor = None
+
+async def _fetch_page_info(session: aiohttp.ClientSession, url: str, label: str, log: logging.Logger):
+	"""
+	Загружает страницу темы с условным GET (If-None-Match / If-Modified-Since).
+	При 304 или неизменном содержимом (по хэшу тела) возвращает ранее
+	извлечённые данные, не разбирая HTML заново.
+	"""
+	cached = _page_cache.get(url)
+	headers = dict(FORUM_HEADERS)
+	if cached:
+		if cached.get("etag"):
+			headers["If-None-Match"] = cached["etag"]
+		if cached.get("last_modified"):
+			headers["If-Modified-Since"] = cached["last_modified"]
+
+	async with session.get(url, headers=headers, timeout=FORUM_TIMEOUT) as resp:
+		poll_scheduler.note_response(resp)
+		if resp.status == 304 and cached:
+			log.debug("♻️ Страница не изменилась (304): %s", url)
+			return cached["info"]
+		if resp.status != 200:
+			logger.error(f"Ошибка загрузки {label}: {resp.status}")
 			return None
-
-		last_post = posts[-1]
-		forum_logger.debug("📝 Найдено сообщений: %d", len(posts))
-
-		post_id = None
-		for attr_name in ("id", "data-content"):
-			attr_val = last_post.get(attr_name) or ""
-			m = re.search(r"post-(\d+)", attr_val)
-			if m:
-				post_id = m.group(1)
-				break
-		if not post_id:
-			link = last_post.select_one("a[href*='#post-']")
-			if link and link.has_attr("href"):
-				m = re.search(r"#post-(\d+)", link["href"])
-				if m:
-					post_id = m.group(1)
-
-		url = thread_page_url
-		if post_id:
-			url = f"{thread_page_url}#post-{post_id}"
-
-		body = last_post.select_one(".message-content .bbWrapper") or last_post.select_one(".bbWrapper")
-		if body:
-			text = body.get_text("\n", strip=True)
+		body = await resp.read()
+		encoding = resp.get_encoding()
+		etag = resp.headers.get("ETag")
+		last_modified = resp.headers.get("Last-Modified")
+
+	body_hash = _page_body_hash(body)
+	if cached and cached.get("body_hash") == body_hash:
+		log.debug("♻️ Содержимое страницы не изменилось (хэш): %s", url)
+		info = cached["info"]
+	else:
+		info = await _parse_page(body, encoding, url, log)
+
+	_page_cache[url] = {"etag": etag, "last_modified": last_modified, "body_hash": body_hash, "info": info}
+	return info
+
+def _thread_page_url(thread_url: str, page: int) -> str:
+	"""URL страницы темы (первая страница — сам URL темы)"""
+	if page <= 1:
+		return thread_url
+	return f"{thread_url.rstrip('/')}/page-{page}"
+
+async def _fetch_last_page(session: aiohttp.ClientSession, thread_url: str, label: str, log: logging.Logger):
+	"""
+	Находит последнюю страницу темы, начиная с запомненного номера страницы.
+	Следующая страница запрашивается, только если навигация сообщает о ней или
+	текущая страница заполнена; к первой странице возвращаемся только при ошибке.
+	Возвращает (номер_страницы, данные_страницы) или (None, None).
+	"""
+	last_pages = state_store.get("forum_state").setdefault("last_pages", {})
+	known_page = last_pages.get(thread_url)
+	page, info = None, None
+
+	if known_page and known_page > 1:
+		info = await _fetch_page_info(session, _thread_page_url(thread_url, known_page), label, log)
+		if info is not None and info["post_count"]:
+			page = known_page
+			log.debug("📄 Запомненная страница %d: %s", page, thread_url)
 		else:
-			text = last_post.get_text(" ", strip=True)
-
-		text = re.sub(r"\s+\n", "\n", text)
-		text = re.sub(r"\n{3,}", "\n\n", text)
-
-		overhead = len("Новое постановление:\n") + len(url) + 1
-		max_len = max(0, 2000 - overhead)
-		if len(text) > max_len:
-			text = (text[: max(0, max_len - 3)] + "...") if max_len >= 3 else text[:max_len]
-
-		result = {"text": text, "url": url, "post_id": post_id or url}
-		forum_logger.debug("✅ Получен пост ID: %s, URL: %s", post_id, url)
-		return result
-
-async def parse_orders():
-	timeout = aiohttp.ClientTimeout(total=30)
-	headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"}
+			log.debug("⚠️ Запомненная страница %d недоступна, начинаем с первой", known_page)
+
+	if page is None:
+		info = await _fetch_page_info(session, thread_url, label, log)
+		if info is None:
+			return None, None
+		page = 1
+
+	# Несколько шагов вперёд на случай, если с прошлой проверки появилось много страниц
+	for _ in range(5):
+		if info["last_page"] and info["last_page"] > page:
+			target = info["last_page"]
+		elif info["post_count"] >= FORUM_POSTS_PER_PAGE:
+			target = page + 1
+		else:
+			break
+		log.debug("📄 Переходим на страницу %d: %s", target, thread_url)
+		next_info = await _fetch_page_info(session, _thread_page_url(thread_url, target), label, log)
+		# XenForo перенаправляет несуществующую страницу на последнюю — тот же пост означает, что новых страниц нет
+		if next_info is None or not next_info["post_count"] or next_info["post_id"] == info["post_id"]:
+			break
+		page, info = target, next_info
+
+	if last_pages.get(thread_url) != page:
+		last_pages[thread_url] = page
+		state_store.mark_dirty("forum_state")
+	return page, info
+
+def _format_post(info: dict, thread_page_url: str, prefix: str) -> dict:
+	"""Формирует результат парсинга: ссылку на пост и текст, обрезанный под лимит сообщения Discord"""
+	post_id = info["post_id"]
+	url = thread_page_url
+	if post_id:
+		url = f"{thread_page_url}#post-{post_id}"
+
+	text = info["text"]
+	overhead = len(prefix) + len(url) + 1
+	max_len = max(0, 2000 - overhead)
+	if len(text) > max_len:
+		text = (text[: max(0, max_len - 3)] + "...") if max_len >= 3 else text[:max_len]
+
+	return {"text": text, "url": url, "post_id": post_id or url}
+
+# Встроенные темы (постановления и ордера); канал назначается при запуске бота.
+# Остальные темы добавляются командами и хранятся в секции состояния "forum_threads".
+BUILTIN_FORUM_THREADS = {
+	"forum": {
+		"url": FORUM_URL,
+		"channel_id": None,
+		"prefix": "Новое постановление:",
+		"state_field": "last_post_id",
+		"label": "форума",
+	},
+	"orders": {
+		"url": ORDERS_URL,
+		"channel_id": None,
+		"prefix": "Новый ордер:",
+		"state_field": "last_order_id",
+		"label": "ордеров",
+	},
+}
 
-	async def fetch_soup(session, url):
-		async with session.get(url) as resp:
-			if resp.status != 200:
-				logger.error(f"Ошибка загрузки ордеров: {resp.status}")
-				return None
-			html = await resp.text()
-			return BeautifulSoup(html, "html.parser")
-
-	async with aiohttp.ClientSession(timeout=timeout, headers=headers) as session:
-		orders_logger.debug("🔍 Проверяем ордера: %s", ORDERS_URL)
-		soup = await fetch_soup(session, ORDERS_URL)
-		if soup is None:
-			logger.error("❌ Не удалось загрузить страницу ордеров")
-			return None
+# Ключи notified.json, которые нельзя занимать темами форума
+_RESERVED_THREAD_KEYS = {"twitch", "youtube"}
+
+# Одновременно проверяемых тем (запросы идут через общую HTTP-сессию)
+FORUM_CONCURRENCY = int(os.getenv("FORUM_CONCURRENCY", "4"))
+_forum_semaphore = asyncio.Semaphore(FORUM_CONCURRENCY)
+
+def configure_builtin_forum_threads(forum_channel_id: int, orders_channel_id: int):
+	"""Назначает каналы для встроенных тем"""
+	BUILTIN_FORUM_THREADS["forum"]["channel_id"] = forum_channel_id
+	BUILTIN_FORUM_THREADS["orders"]["channel_id"] = orders_channel_id
+
+def get_forum_threads() -> dict:
+	"""Все отслеживаемые темы: ключ -> конфиг (встроенные первыми)"""
+	threads = {key: dict(cfg, builtin=True) for key, cfg in BUILTIN_FORUM_THREADS.items()}
+	for key, cfg in state_store.get("forum_threads").items():
+		threads[key] = dict(cfg, builtin=False)
+	return threads
+
+def _thread_logger(key: str) -> logging.Logger:
+	"""Логгер темы: встроенные пишут в свои файлы, остальные — в forum.log"""
+	if key == "orders":
+		return orders_logger
+	if key == "forum":
+		return forum_logger
+	return forum_logger.getChild(key)
+
+def _thread_label(key: str, cfg: dict) -> str:
+	return cfg.get("label") or f"темы {key}"
+
+def _posts_after(posts: list, last_post_id) -> list:
+	"""Сообщения новее последнего известного ID (без ID — только последнее сообщение)"""
+	if not last_post_id:
+		return posts[-1:]
+	ids = [p["post_id"] for p in posts]
+	if last_post_id in ids:
+		return posts[ids.index(last_post_id) + 1:]
+	# Известное сообщение удалено или осталось на более ранней странице — сравниваем номера
+	if str(last_post_id).isdigit():
+		return [p for p in posts if str(p["post_id"] or "").isdigit() and int(p["post_id"]) > int(last_post_id)]
+	return posts[-1:]
+
+async def fetch_forum_thread_posts(key: str, cfg: dict | None = None, last_post_id=None):
+	"""
+	Загружает последнюю страницу темы и возвращает её сообщения по порядку.
+	Если все сообщения страницы новее last_post_id, добавляется и предыдущая
+	страница, чтобы не пропустить посты, опубликованные между проверками.
+	"""
+	cfg = cfg or get_forum_threads().get(key)
+	if cfg is None:
+		return None
+	log = _thread_logger(key)
+	label = _thread_label(key, cfg)
+	session = get_http_session()
+	log.debug("🔍 Проверяем %s: %s", label, cfg["url"])
+	page, info = await _fetch_last_page(session, cfg["url"], label, log)
+	if info is None:
+		logger.error(f"❌ Не удалось загрузить страницу {label}")
+		return None
 
-		last_page_href = None
-		nav = soup.select_one("nav.pageNav") or soup
-		for a in nav.select("a[href*='page-']"):
-			m = re.search(r"page-(\d+)", a.get("href", ""))
-			if m:
-				last_page_href = a["href"]
-
-		thread_page_url = ORDERS_URL
-		if last_page_href:
-			thread_page_url = urljoin(FORUM_BASE, last_page_href)
-			orders_logger.debug("📄 Переходим на последнюю страницу: %s", thread_page_url)
-			soup = await fetch_soup(session, thread_page_url)
-			if soup is None:
-				return None
+	if not info["post_count"]:
+		logger.error(f"❌ Не найдено сообщений на странице {label}")
+		return None
+	log.debug("📝 Найдено сообщений: %d", info["post_count"])
+
+	prefix = cfg["prefix"] + "\n"
+	page_url = _thread_page_url(cfg["url"], page)
+	posts = [_format_post(p, page_url, prefix) for p in info["posts"]]
+
+	if last_post_id and page > 1 and len(_posts_after(posts, last_post_id)) == len(posts):
+		prev_url = _thread_page_url(cfg["url"], page - 1)
+		prev_info = await _fetch_page_info(session, prev_url, label, log)
+		if prev_info is not None:
+			log.debug("📄 Добавлена предыдущая страница %d: %d сообщений", page - 1, prev_info["post_count"])
+			posts = [_format_post(p, prev_url, prefix) for p in prev_info["posts"]] + posts
+
+	log.debug("✅ Последний пост ID: %s, URL: %s", posts[-1]["post_id"], posts[-1]["url"])
+	return posts
+
+async def parse_forum_thread(key: str, cfg: dict | None = None):
+	"""Последний пост темы (или None)"""
+	posts = await fetch_forum_thread_posts(key, cfg)
+	return posts[-1] if posts else None
+
+class ForumAnnouncementIndex:
+	"""
+	Индекс собственных объявлений в каналах форума: ID сообщения -> ссылки на посты.
+	Пополняется при отправке и очищается по on_raw_message_delete, поэтому проверка
+	«уже отправлено» не ходит в историю канала. История читается один раз на канал
+	после запуска бота (холодный старт) или после явного сброса.
+	"""
+
+	def __init__(self, history_limit: int = 200, max_messages: int = 1000):
+		self.history_limit = history_limit
+		self.max_messages = max_messages
+		self._messages = {}  # channel_id -> {message_id: [url, ...]} (в порядке отправки)
+		self._urls = {}      # channel_id -> {url: {message_id, ...}}
+		self._locks = {}
+
+	@staticmethod
+	def _extract_urls(content: str) -> list:
+		# Сравниваем целые ссылки: ...#post-12 не должен совпадать с ...#post-123
+		return [token for token in (content or "").split() if token.startswith(("http://", "https://"))]
+
+	def is_indexed(self, channel_id: int) -> bool:
+		return channel_id in self._messages
+
+	async def ensure_indexed(self, channel: discord.TextChannel):
+		"""Однократно строит индекс канала по последним сообщениям бота"""
+		if channel.id in self._messages:
+			return
+		lock = self._locks.setdefault(channel.id, asyncio.Lock())
+		async with lock:
+			if channel.id in self._messages:
+				return
+			messages = []
+			async for m in channel.history(limit=self.history_limit):
+				if m.author.bot:
+					messages.append(m)
+			self._messages[channel.id] = {}
+			self._urls[channel.id] = {}
+			for m in reversed(messages):
+				self.add(m)
+			forum_logger.debug("🗂️ Индекс объявлений канала %s построен: %d сообщений", channel.id, len(messages))
+
+	def add(self, message: discord.Message):
+		"""Учитывает отправленное объявление"""
+		channel_id = message.channel.id
+		if channel_id not in self._messages:
+			# Канал ещё не проиндексирован — запись появится при построении индекса
+			return
+		urls = self._extract_urls(message.content)
+		if not urls:
+			return
+		messages = self._messages[channel_id]
+		messages[message.id] = urls
+		for url in urls:
+			self._urls[channel_id].setdefault(url, set()).add(message.id)
+		while len(messages) > self.max_messages:
+			self.remove(channel_id, next(iter(messages)))
+
+	def remove(self, channel_id: int, message_id: int):
+		urls = self._messages.get(channel_id, {}).pop(message_id, None)
+		if not urls:
+			return False
+		by_url = self._urls[channel_id]
+		for url in urls:
+			ids = by_url.get(url)
+			if ids is not None:
+				ids.discard(message_id)
+				if not ids:
+					del by_url[url]
+		return True
 
-		posts = soup.select("article.message")
-		if not posts:
-			logger.error("❌ Не найдено сообщений на странице ордеров")
-			return None
+	def contains(self, channel_id: int, url: str) -> bool:
+		return url in self._urls.get(channel_id, {})
 
-		last_post = posts[-1]
-		orders_logger.debug("📝 Найдено сообщений: %d", len(posts))
-
-		post_id = None
-		for attr_name in ("id", "data-content"):
-			attr_val = last_post.get(attr_name) or ""
-			m = re.search(r"post-(\d+)", attr_val)
-			if m:
-				post_id = m.group(1)
-				break
-		if not post_id:
-			link = last_post.select_one("a[href*='#post-']")
-			if link and link.has_attr("href"):
-				m = re.search(r"#post-(\d+)", link["href"])
-				if m:
-					post_id = m.group(1)
-
-		url = thread_page_url
-		if post_id:
-			url = f"{thread_page_url}#post-{post_id}"
-
-		body = last_post.select_one(".message-content .bbWrapper") or last_post.select_one(".bbWrapper")
-		if body:
-			text = body.get_text("\n", strip=True)
-		else:
-			text = last_post.get_text(" ", strip=True)
+	def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+		if self.remove(payload.channel_id, payload.message_id):
+			forum_logger.debug("🗑️ Объявление %s удалено из канала %s", payload.message_id, payload.channel_id)
 
-		text = re.sub(r"\s+\n", "\n", text)
-		text = re.sub(r"\n{3,}", "\n\n", text)
+	def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+		for message_id in payload.message_ids:
+			self.remove(payload.channel_id, message_id)
 
-		overhead = len("Новый ордер:\n") + len(url) + 1
-		max_len = max(0, 2000 - overhead)
-		if len(text) > max_len:
-			text = (text[: max(0, max_len - 3)] + "...") if max_len >= 3 else text[:max_len]
+	def invalidate(self, channel_id: int):
+		"""Сбрасывает индекс канала: при следующей проверке он будет построен по истории заново"""
+		self._messages.pop(channel_id, None)
+		self._urls.pop(channel_id, None)
 
-		result = {"text": text, "url": url, "post_id": post_id or url}
-		orders_logger.debug("✅ Получен ордер ID: %s, URL: %s", post_id, url)
-		return result
+# Индекс объявлений о постах форума во всех каналах тем
+forum_announcements = ForumAnnouncementIndex()
 
 async def _forum_message_exists(channel: discord.TextChannel, url: str, text: str) -> bool:
-	async for m in channel.history(limit=200):
-		if m.author.bot and url in (m.content or ""):
-			return True
-	return False
-
-@tasks.loop(minutes=5)
-async def check_forum(bot, forum_channel_id: int):
+	return url in await _existing_forum_urls(channel, [url])
+
+async def _existing_forum_urls(channel: discord.TextChannel, urls: list) -> set:
+	"""Какие из ссылок уже были отправлены ботом в канал (по индексу объявлений)"""
+	await forum_announcements.ensure_indexed(channel)
+	return {url for url in urls if forum_announcements.contains(channel.id, url)}
+
+async def _send_forum_batches(channel: discord.TextChannel, posts: list, prefix: str, on_sent):
+	"""
+	Отправляет посты по порядку, объединяя несколько ссылок в одно сообщение
+	(до лимита Discord в 2000 символов). После каждого сообщения вызывает
+	on_sent(последний_пост), чтобы сдвинуть отметку даже при сбое на середине.
+	"""
+	batch, size = [], len(prefix)
+	for post in posts:
+		if batch and size + len(post["url"]) + 1 > 2000:
+			message = await channel.send(prefix + "\n" + "\n".join(p["url"] for p in batch))
+			forum_announcements.add(message)
+			await on_sent(batch[-1])
+			batch, size = [], len(prefix)
+		batch.append(post)
+		size += len(post["url"]) + 1
+	if batch:
+		message = await channel.send(prefix + "\n" + "\n".join(p["url"] for p in batch))
+		forum_announcements.add(message)
+		await on_sent(batch[-1])
+
+async def check_forum_thread(bot, key: str, cfg: dict):
+	"""Одна проверка темы: отправляет все новые посты с последней отметки и обновляет состояние темы"""
+	log = _thread_logger(key)
+	label = _thread_label(key, cfg)
+	field = cfg["state_field"]
 	try:
-		forum_logger.debug("🔄 Проверка форума (канал: %s)", forum_channel_id)
-		post = await parse_forum()
-		if not post:
-			logger.error("❌ Не удалось получить пост с форума")
-			return
-
-		channel = bot.get_channel(forum_channel_id)
+		log.debug("🔄 Проверка %s (канал: %s)", label, cfg["channel_id"])
+		channel = bot.get_channel(cfg["channel_id"])
 		if channel is None:
-			logger.error(f"❌ Канал {forum_channel_id} не найден")
+			logger.error(f"❌ Канал {cfg['channel_id']} не найден")
 			return
 
-		exists = await _forum_message_exists(channel, post["url"], post["text"])
-
 		notified = await async_load_notified()
-		forum_state = notified.get("forum", {})
-		last_post_id = forum_state.get("last_post_id")
-
-		forum_logger.debug("📊 Текущий ID поста: %s, Последний известный: %s", post['post_id'], last_post_id)
+		thread_state = notified.get(key, {})
+		last_post_id = thread_state.get(field)
 
-		if not exists and last_post_id != post["post_id"]:
-			logger.info(f"📢 Отправляем уведомление о новом посте: {post['post_id']}")
-			await channel.send(f"Новое постановление:\n{post['url']}")
-			forum_state["last_post_id"] = post["post_id"]
-			notified["forum"] = forum_state
-			await async_save_notified(notified)
-			logger.info("✅ Уведомление отправлено и сохранено")
-			return
-		elif exists:
-			forum_logger.debug("ℹ️ Пост уже был отправлен ранее")
-		elif last_post_id == post["post_id"]:
-			forum_logger.debug("ℹ️ Пост не изменился")
-
-		if last_post_id != post["post_id"]:
-			forum_state["last_post_id"] = post["post_id"]
-			notified["forum"] = forum_state
-			await async_save_notified(notified)
-			forum_logger.debug("📝 Обновлен ID последнего поста")
-	except Exception as e:
-		logger.error(f"❌ Ошибка при проверке форума: {e}")
-		traceback.print_exc()
-
-@tasks.loop(minutes=5)
-async def check_orders(bot, orders_channel_id: int):
-	try:
-		orders_logger.debug("🔄 Проверка ордеров (канал: %s)", orders_channel_id)
-		order = await parse_orders()
-		if not order:
-			logger.error("❌ Не удалось получить ордер")
-			return
-
-		channel = bot.get_channel(orders_channel_id)
-		if channel is None:
-			logger.error(f"❌ Канал {orders_channel_id} не найден")
+		posts = await fetch_forum_thread_posts(key, cfg, last_post_id)
+		if not posts:
+			logger.error(f"❌ Не удалось получить пост {label}")
+			poll_scheduler.record_error(f"не удалось получить пост {label}")
 			return
+		latest_id = posts[-1]["post_id"]
 
-		exists = await _forum_message_exists(channel, order["url"], order["text"])
+		log.debug("📊 Текущий ID поста: %s, Последний известный: %s", latest_id, last_post_id)
 
-		notified = await async_load_notified()
-		orders_state = notified.get("orders", {})
-		last_order_id = orders_state.get("last_order_id")
+		async def mark_sent(post):
+			thread_state[field] = post["post_id"]
+			notified[key] = thread_state
+			await async_save_notified(notified)
 
-		orders_logger.debug("📊 Текущий ID ордера: %s, Последний известный: %s", order['post_id'], last_order_id)
+		new_posts = _posts_after(posts, last_post_id)
+		if new_posts:
+			existing = await _existing_forum_urls(channel, [p["url"] for p in new_posts])
+			to_send = [p for p in new_posts if p["url"] not in existing]
+			if len(to_send) < len(new_posts):
+				log.debug("ℹ️ Уже отправлено ранее: %d", len(new_posts) - len(to_send))
+			if to_send:
+				logger.info(f"📢 Отправляем уведомления о новых постах {label}: {[p['post_id'] for p in to_send]}")
+				await _send_forum_batches(channel, to_send, cfg["prefix"], mark_sent)
+				poll_scheduler.mark_activity()
+				logger.info("✅ Уведомления отправлены и сохранены")
+		else:
+			log.debug("ℹ️ Новых постов нет")
 
-		if not exists and last_order_id != order["post_id"]:
-			logger.info(f"📢 Отправляем уведомление о новом ордере: {order['post_id']}")
-			await channel.send(f"Новый ордер:\n{order['url']}")
-			orders_state["last_order_id"] = order["post_id"]
-			notified["orders"] = orders_state
-			await async_save_notified(notified)
-			logger.info("✅ Уведомление об ордере отправлено и сохранено")
-			return
-		elif exists:
-			orders_logger.debug("ℹ️ Ордер уже был отправлен ранее")
-		elif last_order_id == order["post_id"]:
-			orders_logger.debug("ℹ️ Ордер не изменился")
-
-		if last_order_id != order["post_id"]:
-			orders_state["last_order_id"] = order["post_id"]
-			notified["orders"] = orders_state
-			await async_save_notified(notified)
-			orders_logger.debug("📝 Обновлен ID последнего ордера")
+		if thread_state.get(field) != latest_id:
+			await mark_sent(posts[-1])
+			log.debug("📝 Обновлен ID последнего поста")
 	except Exception as e:
-		logger.error(f"❌ Ошибка при проверке ордеров: {e}")
+		logger.error(f"❌ Ошибка при проверке {label}: {e}")
+		poll_scheduler.record_error(e)
 		traceback.print_exc()
 
-async def diagnose_forum(bot, forum_channel_id: int):
-	"""Диагностика состояния форума"""
+async def _check_forum_thread_limited(bot, key: str, cfg: dict):
+	async with _forum_semaphore:
+		await check_forum_thread(bot, key, cfg)
+
+@tasks.loop(seconds=POLL_TICK_SECONDS)
+async def check_forum_threads(bot):
+	"""
+	Проверяет темы, для которых подошло время по планировщику, параллельно
+	(не более FORUM_CONCURRENCY одновременно). У каждой темы свой интервал.
+	"""
+	due = []
+	for key, cfg in get_forum_threads().items():
+		if not cfg.get("channel_id"):
+			continue
+		name = f"forum:{key}"
+		poll_scheduler.register(name, *POLL_INTERVALS["forum"])
+		if poll_scheduler.is_due(name):
+			due.append((name, key, cfg))
+	if not due:
+		return
+	forum_logger.debug("🔄 Проверка тем форума: %s", ", ".join(key for _, key, _ in due))
+	await asyncio.gather(*(
+		poll_scheduler.run_if_due(name, _check_forum_thread_limited, bot, key, cfg) for name, key, cfg in due
+	))
+
+async def diagnose_forum_thread(bot, key: str):
+	"""Диагностика состояния темы"""
 	try:
-		logger.info("🔍 Диагностика форума...")
-		
+		cfg = get_forum_threads().get(key)
+		if cfg is None:
+			return f"❌ Тема {key} не отслеживается"
+		logger.info(f"🔍 Диагностика {_thread_label(key, cfg)}...")
+
 		# Проверяем канал
-		channel = bot.get_channel(forum_channel_id)
+		channel = bot.get_channel(cfg["channel_id"]) if cfg.get("channel_id") else None
 		if channel is None:
-			return "❌ Канал форума не найден"
-		
+			return "❌ Канал темы не найден"
+
 		# Проверяем права бота
-		permissions = channel.permissions_for(bot.user)
+		permissions = channel.permissions_for(channel.guild.me)
 		if not permissions.send_messages:
 			return "❌ Бот не может отправлять сообщения в канал"
-		
+
 		# Получаем текущий пост
-		post = await parse_forum()
+		post = await parse_forum_thread(key, cfg)
 		if not post:
 			return "❌ Не удалось получить данные с форума"
-		
+
 		# Проверяем состояние уведомлений
 		notified = await async_load_notified()
-		forum_state = notified.get("forum", {})
-		last_post_id = forum_state.get("last_post_id")
-		
+		last_post_id = notified.get(key, {}).get(cfg["state_field"])
+
 		# Проверяем, существует ли уже сообщение
 		exists = await _forum_message_exists(channel, post["url"], post["text"])
-		
+
 		result = f"✅ Диагностика завершена:\n"
 		result += f"📝 Текущий пост ID: {post['post_id']}\n"
 		result += f"📝 Последний известный ID: {last_post_id}\n"
 		result += f"📢 Сообщение уже отправлено: {'Да' if exists else 'Нет'}\n"
 		result += f"🔗 URL: {post['url']}\n"
 		result += f"📄 Текст: {post['text'][:100]}..."
-		
+
 		return result
-		
-	except Exception as e:
-		return f"❌ Ошибка диагностики: {e}"
 
-async def diagnose_orders(bot, orders_channel_id: int):
-	"""Диагностика состояния ордеров"""
-	try:
-		# Проверяем канал
-		channel = bot.get_channel(orders_channel_id)
-		if channel is None:
-			return "❌ Канал ордеров не найден"
-		
-		channel_status = "✅ Доступен"
-		
-		# Проверяем последний ордер
-		notified = await async_load_notified()
-		orders_state = notified.get("orders", {})
-		last_order_id = orders_state.get("last_order_id")
-		
-		# Пытаемся получить текущий ордер
-		try:
-			order = await parse_orders()
-			if order:
-				current_id = order.get("post_id", "неизвестен")
-				if last_order_id == current_id:
-					status_msg = "✅ Актуален"
-				else:
-					status_msg = f"⚠️ Обновление доступно (текущий: {current_id})"
-			else:
-				status_msg = "❌ Ошибка получения"
-		except Exception as e:
-			status_msg = f"❌ Ошибка: {e}"
-		
-		return f"Ордера: {status_msg} | Последний ордер: {last_order_id or 'неизвестен'} | Канал: {channel_status}"
 	except Exception as e:
 		return f"❌ Ошибка диагностики: {e}"
 
+def reset_forum_thread_state(key: str):
+	"""Сбрасывает ID последнего поста темы; возвращает (успех, прежний ID или сообщение)"""
+	cfg = get_forum_threads().get(key)
+	if cfg is None:
+		return False, f"Тема {key} не отслеживается."
+	notified = load_notified()
+	thread_state = notified.get(key, {})
+	old_post_id = thread_state.get(cfg["state_field"])
+	thread_state[cfg["state_field"]] = None
+	notified[key] = thread_state
+	save_notified(notified)
+	# Сброс обычно нужен после удаления объявления, пока бот был выключен, — перечитаем историю канала
+	if cfg.get("channel_id"):
+		forum_announcements.invalidate(cfg["channel_id"])
+	return True, old_post_id
+
 # --------------------------
 # Twitch tracking (2 минуты) + token refresh
 # --------------------------
-_twitch_access_token = None
-_twitch_token_expires_at = 0.0
-
-async def _refresh_twitch_token(session: aiohttp.ClientSession) -> bool:
-	global _twitch_access_token, _twitch_token_expires_at
-	client_id = os.getenv("TWITCH_CLIENT_ID")
-	client_secret = os.getenv("TWITCH_CLIENT_SECRET") or os.getenv("TWITCH_TOKEN")
-	if not client_id or not client_secret:
-		logger.warning("Twitch: не задан TWITCH_CLIENT_ID или TWITCH_CLIENT_SECRET")
-		return False
-	data = {"client_id": client_id, "client_secret": client_secret, "grant_type": "client_credentials"}
-	async with session.post("https://id.twitch.tv/oauth2/token", data=data) as resp:
-		js = await resp.json()
-		if resp.status != 200:
-			logger.error(f"Twitch token error {resp.status}: {js}")
+class TwitchTokenManager:
+	"""
+	Токен приложения Twitch (client credentials).
+	* Обновление single-flight: параллельные вызовы ждут один и тот же запрос.
+	* Фоновое продление (maintain_twitch_token) заранее, до истечения срока,
+	  и проверка через /oauth2/validate не реже раза в час.
+	* При TWITCH_TOKEN_PERSIST токен сохраняется в состоянии и переживает перезапуск.
+	"""
+
+	VALIDATE_INTERVAL = 3600
+
+	def __init__(self, persist: bool = False):
+		self.persist = persist
+		self.access_token = None
+		self.expires_at = 0.0
+		self.lifetime = 0.0
+		self.validated_at = 0.0
+		self.refresh_count = 0
+		self._inflight = None
+		self._loaded = False
+
+	@staticmethod
+	def _credentials():
+		client_id = os.getenv("TWITCH_CLIENT_ID")
+		client_secret = os.getenv("TWITCH_CLIENT_SECRET") or os.getenv("TWITCH_TOKEN")
+		return client_id, client_secret
+
+	@property
+	def renew_margin(self) -> float:
+		"""За сколько секунд до истечения продлевать токен (10% срока, от минуты до суток)"""
+		return max(60.0, min(86400.0, self.lifetime * 0.1))
+
+	def needs_renewal(self) -> bool:
+		return not self.access_token or time.time() >= self.expires_at - self.renew_margin
+
+	def _load_persisted(self):
+		if self._loaded:
+			return
+		self._loaded = True
+		if not self.persist:
+			return
+		data = state_store.get("twitch_token")
+		if (
+			data.get("access_token")
+			and data.get("client_id") == self._credentials()[0]
+			and data.get("expires_at", 0) > time.time() + 60
+		):
+			self.access_token = data["access_token"]
+			self.expires_at = data["expires_at"]
+			self.lifetime = data.get("lifetime", 0.0)
+			self.validated_at = data.get("validated_at", 0.0)
+			logger.info("🔑 Twitch: токен приложения загружен из состояния")
+
+	def _save(self):
+		if not self.persist:
+			return
+		state_store.set("twitch_token", {
+			"client_id": self._credentials()[0],
+			"access_token": self.access_token,
+			"expires_at": self.expires_at,
+			"lifetime": self.lifetime,
+			"validated_at": self.validated_at,
+		})
+
+	async def get_token(self, session: aiohttp.ClientSession) -> str | None:
+		"""Действующий токен; обновляет его, только если токена нет или срок истёк"""
+		self._load_persisted()
+		if self.access_token and time.time() < self.expires_at:
+			return self.access_token
+		return await self.refresh(session)
+
+	async def refresh(self, session: aiohttp.ClientSession) -> str | None:
+		"""Запрашивает новый токен; одновременные вызовы ждут один запрос"""
+		if self._inflight is None:
+			self._inflight = asyncio.ensure_future(self._request_token(session))
+			self._inflight.add_done_callback(self._clear_inflight)
+		return await asyncio.shield(self._inflight)
+
+	def _clear_inflight(self, future):
+		if self._inflight is future:
+			self._inflight = None
+
+	async def invalidate(self, session: aiohttp.ClientSession, used_token: str | None) -> str | None:
+		"""Токен отвергнут (401): обновляем, если его ещё не заменил параллельный запрос"""
+		if self._inflight is not None:
+			return await asyncio.shield(self._inflight)
+		if self.access_token and used_token != self.access_token:
+			return self.access_token
+		self.access_token = None
+		return await self.refresh(session)
+
+	async def _request_token(self, session: aiohttp.ClientSession) -> str | None:
+		client_id, client_secret = self._credentials()
+		if not client_id or not client_secret:
+			logger.warning("Twitch: не задан TWITCH_CLIENT_ID или TWITCH_CLIENT_SECRET")
+			return None
+		data = {"client_id": client_id, "client_secret": client_secret, "grant_type": "client_credentials"}
+		async with session.post(f"{TWITCH_ID_BASE}/oauth2/token", data=data) as resp:
+			poll_scheduler.note_response(resp)
+			js = await resp.json(content_type=None)
+			if resp.status != 200:
+				logger.error(f"Twitch token error {resp.status}: {js}")
+				return None
+		now = time.time()
+		self.access_token = js.get("access_token")
+		self.lifetime = float(max(60, int(js.get("expires_in", 3600))))
+		self.expires_at = now + self.lifetime
+		self.validated_at = now
+		self.refresh_count += 1
+		self._save()
+		logger.info(f"🔑 Twitch: получен токен приложения (действует {int(self.lifetime // 3600)} ч)")
+		return self.access_token
+
+	async def validate(self, session: aiohttp.ClientSession) -> bool:
+		"""Проверяет токен через /oauth2/validate и уточняет срок действия"""
+		token = self.access_token
+		if not token:
 			return False
-		_twitch_access_token = js.get("access_token")
-		expires_in = js.get("expires_in", 3600)
-		_twitch_token_expires_at = time.time() + max(60, int(expires_in) - 60)
+		async with session.get(f"{TWITCH_ID_BASE}/oauth2/validate", headers={"Authorization": f"OAuth {token}"}) as resp:
+			if resp.status == 401:
+				logger.warning("Twitch: токен приложения недействителен, будет получен новый")
+				if self.access_token == token:
+					self.access_token = None
+				return False
+			if resp.status != 200:
+				# Проверка недоступна — продолжаем пользоваться токеном до следующей попытки
+				return True
+			js = await resp.json(content_type=None)
+		if self.access_token == token:
+			now = time.time()
+			if "expires_in" in js:
+				self.expires_at = now + int(js["expires_in"])
+			self.validated_at = now
+			self._save()
 		return True
 
+	async def maintain(self, session: aiohttp.ClientSession):
+		"""Фоновая проверка: validate раз в час и продление до истечения срока"""
+		self._load_persisted()
+		if self.access_token and time.time() - self.validated_at >= self.VALIDATE_INTERVAL:
+			await self.validate(session)
+		if self.needs_renewal() and all(self._credentials()):
+			await self.refresh(session)
+
+# Токен приложения Twitch для всех запросов бота
+twitch_tokens = TwitchTokenManager(persist=TWITCH_TOKEN_PERSIST)
+
+@tasks.loop(minutes=5)
+async def maintain_twitch_token():
+	try:
+		await twitch_tokens.maintain(get_http_session())
+	except Exception as e:
+		logger.error(f"Twitch: ошибка обслуживания токена: {e}")
+
 async def _twitch_headers(session: aiohttp.ClientSession):
-	global _twitch_access_token, _twitch_token_expires_at
-	if _twitch_access_token is None or time.time() >= _twitch_token_expires_at:
-		ok = await _refresh_twitch_token(session)
-		if not ok:
-			return None
+	token = await twitch_tokens.get_token(session)
+	if not token:
+		return None
 	client_id = os.getenv("TWITCH_CLIENT_ID")
-	return {"Client-ID": client_id, "Authorization": f"Bearer {_twitch_access_token}"}
+	return {"Client-ID": client_id, "Authorization": f"Bearer {token}"}
+
+class TwitchRateLimiter:
+	"""
+	Token bucket для запросов к Helix. Ёмкость и остаток берутся из заголовков
+	Ratelimit-Limit / Ratelimit-Remaining; если запросы кончились, ждём до
+	Ratelimit-Reset. Ожидающие обслуживаются по очереди.
+	"""
+
+	def __init__(self, capacity: int = 800, period: float = 60.0):
+		self.capacity = capacity
+		self.period = period
+		self.tokens = float(capacity)
+		self.reset_at = 0.0
+		self._updated = time.monotonic()
+		self._lock = asyncio.Lock()
+
+	@property
+	def rate(self) -> float:
+		return self.capacity / self.period
+
+	def _refill(self):
+		now = time.monotonic()
+		if self.reset_at and time.time() >= self.reset_at:
+			# Сервер обещал полный запас к этому моменту
+			self.tokens = float(self.capacity)
+			self.reset_at = 0.0
+		else:
+			self.tokens = min(float(self.capacity), self.tokens + (now - self._updated) * self.rate)
+		self._updated = now
+
+	async def acquire(self):
+		async with self._lock:
+			while True:
+				self._refill()
+				if self.tokens >= 1:
+					self.tokens -= 1
+					return
+				wait = (1 - self.tokens) / self.rate
+				if self.reset_at:
+					wait = min(wait, max(0.0, self.reset_at - time.time()))
+				await asyncio.sleep(max(wait, 0.01))
+
+	def update(self, headers):
+		"""Синхронизирует бакет с заголовками ответа Helix"""
+		limit = headers.get("Ratelimit-Limit")
+		remaining = headers.get("Ratelimit-Remaining")
+		reset = headers.get("Ratelimit-Reset")
+		if limit and limit.isdigit() and int(limit) > 0:
+			self.capacity = int(limit)
+		self._refill()
+		if remaining and remaining.isdigit():
+			# Остаток сервера учитывает запросы других клиентов с тем же client_id
+			self.tokens = min(self.tokens, float(remaining))
+		if reset and reset.isdigit() and self.tokens < 1:
+			self.reset_at = float(reset)
+
+# Общий лимитер Helix для всех запросов бота
+twitch_rate_limiter = TwitchRateLimiter()
+
+async def _renew_twitch_token_after_401(session: aiohttp.ClientSession, used_headers: dict) -> bool:
+	"""Обновляет токен после 401, если его ещё не обновил параллельный запрос"""
+	used_token = used_headers.get("Authorization", "").removeprefix("Bearer ")
+	return bool(await twitch_tokens.invalidate(session, used_token))
+
+async def _fetch_twitch_chunk(session: aiohttp.ClientSession, chunk: list, semaphore: asyncio.Semaphore | None = None,
+							  max_attempts: int = 3):
+	"""
+	Один запрос /streams (до 100 логинов). Повторяет запрос после 401 (с новым
+	токеном), 429 и 5xx (после Retry-After / Ratelimit-Reset). None — если не удалось.
+	semaphore занят только на время самого запроса: ожидание перед повтором
+	идёт после выхода из ответа, соединение и слот свободны для других пачек.
+	"""
+	semaphore = semaphore or asyncio.Semaphore(1)
+	params = [("user_login", login) for login in chunk] + [("first", "100")]
+	for attempt in range(max_attempts):
+		headers = await _twitch_headers(session)
+		if not headers:
+			return None
+		retry_delay = None
+		async with semaphore:
+			await twitch_rate_limiter.acquire()
+			async with session.get(f"{TWITCH_API_BASE}/streams", params=params, headers=headers) as resp:
+				twitch_rate_limiter.update(resp.headers)
+				if resp.status == 200:
+					data = await resp.json()
+					return data.get("data", [])
+				last_attempt = attempt == max_attempts - 1
+				if (resp.status == 429 or resp.status >= 500) and not last_attempt:
+					retry_delay = _parse_retry_after(resp.headers)
+					retry_delay = min(30.0, retry_delay if retry_delay is not None else 2 ** attempt)
+					logger.warning(f"Twitch: ответ {resp.status}, повтор через {retry_delay:.1f} с")
+				elif resp.status != 401 or last_attempt:
+					poll_scheduler.note_response(resp)
+					logger.error(f"Twitch: ошибка запроса стримов {resp.status} ({len(chunk)} логинов)")
+					return None
+		if retry_delay is not None:
+			await asyncio.sleep(retry_delay)
+		elif not await _renew_twitch_token_after_401(session, headers):
+			return None
+	return None
 
 async def _fetch_twitch_streams(session: aiohttp.ClientSession, logins):
-	headers = await _twitch_headers(session)
-	if not headers:
+	"""
+	Запрашивает стримы пачками по 100 логинов параллельно (не более
+	TWITCH_CONCURRENCY запросов) с учётом лимитов Helix. Неудачная пачка не
+	отменяет остальные — возвращаются стримы из успешных пачек.
+	"""
+	if not logins or not await _twitch_headers(session):
 		return []
+	chunks = [logins[i:i+100] for i in range(0, len(logins), 100)]
+	semaphore = asyncio.Semaphore(TWITCH_CONCURRENCY)
+
+	results = await asyncio.gather(*(_fetch_twitch_chunk(session, chunk, semaphore) for chunk in chunks),
+								   return_exceptions=True)
 	streams = []
-	for i in range(0, len(logins), 100):
-		chunk = logins[i:i+100]
-		params = "&".join(f"user_login={login}" for login in chunk)
-		url = f"https://api.twitch.tv/helix/streams?{params}"
-		async def do_request(hdrs):
-			async with session.get(url, headers=hdrs) as resp:
-				if resp.status == 401:
-					return {"unauthorized": True}
-				if resp.status != 200:
-					return None
-				return await resp.json()
-		data = await do_request(headers)
-		if data == {"unauthorized": True}:
-			if await _refresh_twitch_token(session):
-				headers = await _twitch_headers(session)
-				data = await do_request(headers)
-			else:
-				data = None
-		if data and "data" in data:
-			streams.extend(data["data"])
+	failed = 0
+	for result in results:
+		if isinstance(result, BaseException):
+			logger.error(f"Twitch: ошибка запроса стримов: {result!r}")
+			poll_scheduler.record_error(result)
+			failed += 1
+		elif result is None:
+			failed += 1
+		else:
+			streams.extend(result)
+	if failed:
+		logger.warning(f"Twitch: не выполнено {failed} из {len(chunks)} запросов, результаты неполные")
 	return streams
 
 def _missing_send_perms(channel) -> list[str]:
@@ -796,53 +2284,34 @@ def _missing_send_perms(channel) -> list[str]:
 	except Exception:
 		return ["unknown"]
 
-@tasks.loop(minutes=5)  # Проверяем конфликтующие роли каждые 5 минут
+@tasks.loop(hours=ROLE_RECONCILE_HOURS)  # Нарушения отслеживаются по on_member_update, полный обход — редкая сверка
 async def check_conflicting_roles(bot):
-    """Периодическая проверка конфликтующих ролей (только логирование)"""
+    """Периодическая сверка набора конфликтующих ролей (только логирование)"""
     try:
         # Очищаем старые блокировки пользователей
         await cleanup_old_user_locks()
         
         for guild in bot.guilds:
-            violations_count = 0
-            for member in guild.members:
-                if member.bot:
-                    continue
-                    
-                member_roles = list(member.roles)
-                conflicts_found = []
-                
-                # Проверяем каждую роль пользователя на конфликты
-                for role in member_roles:
-                    if role.name in CONFLICTING_ROLES:
-                        for conflict_name in CONFLICTING_ROLES[role.name]:
-                            conflict_role = discord.utils.get(guild.roles, name=conflict_name)
-                            if conflict_role and conflict_role in member_roles:
-                                conflicts_found.append((role.name, conflict_name))
-                
-                # Только логируем нарушения, не исправляем автоматически
-                if conflicts_found:
-                    for role1, role2 in conflicts_found:
-                        logger.warning(f"Обнаружены конфликтующие роли у {member}: {role1} и {role2}")
-                    violations_count += 1
-            
+            violations_count = await conflict_tracker.reconcile(guild)
             if violations_count > 0:
                 logger.info(f"Обнаружено {violations_count} пользователей с конфликтующими ролями в сервере {guild.name}")
                 
     except Exception as e:
         logger.error(f"Ошибка при проверке конфликтующих ролей: {e}")
 
-@tasks.loop(seconds=120)  # Изменено с 10 секунд на 2 минуты
+@tasks.loop(seconds=POLL_TICK_SECONDS)  # Интервал опроса задаёт poll_scheduler (по умолчанию 2 минуты)
 async def poll_twitch(bot, notifications_channel_id: int):
+	poll_scheduler.register("twitch", *_twitch_poll_intervals())
+	await poll_scheduler.run_if_due("twitch", _poll_twitch, bot, notifications_channel_id)
+
+async def _poll_twitch(bot, notifications_channel_id: int):
 	try:
 		tracking = await async_load_tracking()
 		logins = tracking.get("twitch", [])
 		if not logins:
 			return
 
-		timeout = aiohttp.ClientTimeout(total=8)
-		async with aiohttp.ClientSession(timeout=timeout) as session:
-			live_streams = await _fetch_twitch_streams(session, logins)
+		live_streams = await _fetch_twitch_streams(get_http_session(), logins)
 
 		channel = bot.get_channel(notifications_channel_id)
 		if channel is None:
@@ -853,34 +2322,60 @@ async def poll_twitch(bot, notifications_channel_id: int):
 			logger.warning(f"Twitch: нет прав в канале уведомлений ({notifications_channel_id}): {', '.join(missing)}")
 			return
 
+		if await _twitch_announce(channel, live_streams):
+			poll_scheduler.mark_activity()
+	except Exception as e:
+		logger.error(f"Twitch loop error: {e}")
+		poll_scheduler.record_error(e)
+
+def _twitch_poll_intervals() -> tuple:
+	"""Границы интервала опроса Twitch; при работающем EventSub опрос лишь редкая сверка"""
+	base, min_interval, max_interval = POLL_INTERVALS["twitch"]
+	if twitch_eventsub.active:
+		return TWITCH_EVENTSUB_POLL_SECONDS, min_interval, max(max_interval, TWITCH_EVENTSUB_POLL_SECONDS)
+	return base, min_interval, max_interval
+
+# Общая блокировка объявлений: опрос и EventSub не должны объявить один эфир дважды
+_twitch_announce_lock = asyncio.Lock()
+
+async def _twitch_announce(channel, streams: list) -> int:
+	"""
+	Объявляет эфиры ({"user_login", "id", "title"}), о которых ещё не сообщали:
+	общая проверка дублей notified["twitch"] (логин -> ID эфира) для опроса и
+	EventSub. Возвращает число отправленных сообщений.
+	"""
+	async with _twitch_announce_lock:
 		notified = await async_load_notified()
 		notified_twitch = notified.get("twitch", {})
+		changed = False
+		sent = 0
 
-		for stream in live_streams:
+		for stream in streams:
 			login = (stream.get("user_login") or "").lower()
 			stream_id = stream.get("id")
 			title = stream.get("title", "")
 			if not login or not stream_id:
 				continue
-			if notified_twitch.get(login) == stream_id:
+			if notified_twitch.get(login) == stream_id or was_notified_before("twitch", login, stream_id):
 				continue
 			notified_twitch[login] = stream_id
+			changed = True
 			url = f"https://twitch.tv/{login}"
 			try:
 				await channel.send(f"В эфире на Twitch: {url}\n{title[:1900]}")
+				sent += 1
 			except Exception as e:
 				logger.error(f"Ошибка отправки сообщения Twitch: {e}")
 
-		notified["twitch"] = notified_twitch
-		await async_save_notified(notified)
-	except Exception as e:
-		logger.error(f"Twitch loop error: {e}")
+		# Пишем состояние только если что-то изменилось
+		if changed:
+			notified["twitch"] = notified_twitch
+			await async_save_notified(notified)
+		return sent
 
 async def twitch_check_and_notify(bot: discord.Client, notifications_channel_id: int, login: str):
 	login_norm = login.strip().lower()
-	timeout = aiohttp.ClientTimeout(total=8)
-	async with aiohttp.ClientSession(timeout=timeout) as session:
-		streams = await _fetch_twitch_streams(session, [login_norm])
+	streams = await _fetch_twitch_streams(get_http_session(), [login_norm])
 	if not streams:
 		return True, f"{login_norm}: офлайн или не найден."
 
@@ -913,6 +2408,277 @@ async def twitch_check_and_notify(bot: discord.Client, notifications_channel_id:
 		logger.error(f"Ошибка отправки уведомления Twitch: {e}")
 		return False, f"{login_norm}: ошибка отправки уведомления."
 
+# --------------------------
+# Twitch EventSub (webhook, stream.online)
+# --------------------------
+# Логин пользователя Twitch может смениться, поэтому ID перепроверяются раз в неделю
+TWITCH_USER_ID_TTL = 7 * 86400
+
+# Сообщения EventSub старше этого возраста отклоняются (защита от повтора)
+TWITCH_EVENTSUB_MAX_AGE = 600
+
+# Статусы подписок, которые нужно пересоздать
+_EVENTSUB_FAILED_STATUSES = {
+	"webhook_callback_verification_failed",
+	"notification_failures_exceeded",
+	"authorization_revoked",
+	"user_removed",
+	"version_removed",
+}
+
+class TwitchEventSub:
+	"""
+	Подписки EventSub stream.online через webhook для логинов из channels.json.
+
+	Транспорт webhook работает с токеном приложения (client credentials),
+	который бот уже получает; websocket-транспорт требует токен пользователя.
+	Twitch подтверждает подписку запросом webhook_callback_verification на
+	колбэк, уведомления подписаны HMAC-SHA256 (ID сообщения + время + тело)
+	секретом подписки. Подписки сверяются с channels.json периодически
+	(maintain_twitch_eventsub) и сразу после /twitch_add и /twitch_remove.
+	Эфиры проходят ту же проверку дублей, что и опрос (_twitch_announce);
+	опрос Helix /streams остаётся редкой сверкой.
+	"""
+
+	def __init__(self):
+		self.active = False
+		self.bot = None
+		self.notifications_channel_id = None
+		self._seen_messages = {}   # Twitch-Eventsub-Message-Id -> время получения
+		self._tasks = set()
+		self._reconcile_task = None
+		self.subscriptions = 0
+		self.last_reconcile = None
+		self.stats = {"verified": 0, "notifications": 0, "rejected": 0, "duplicates": 0, "revoked": 0, "announced": 0}
+
+	@staticmethod
+	def _state() -> dict:
+		return state_store.get("twitch_state")
+
+	def secret(self) -> str:
+		"""Секрет подписок: TWITCH_EVENTSUB_SECRET или сгенерированный однажды и сохранённый"""
+		if TWITCH_EVENTSUB_SECRET:
+			return TWITCH_EVENTSUB_SECRET
+		eventsub = self._state().setdefault("eventsub", {})
+		if not eventsub.get("secret"):
+			eventsub["secret"] = secrets.token_hex(32)
+			state_store.mark_dirty("twitch_state")
+		return eventsub["secret"]
+
+	async def _helix(self, session: aiohttp.ClientSession, method: str, path: str, **kwargs):
+		"""Запрос к Helix с общим лимитером и обновлением токена после 401: (статус, JSON или None)"""
+		for attempt in range(2):
+			headers = await _twitch_headers(session)
+			if not headers:
+				return None, None
+			await twitch_rate_limiter.acquire()
+			async with session.request(method, f"{TWITCH_API_BASE}{path}", headers=headers, **kwargs) as resp:
+				twitch_rate_limiter.update(resp.headers)
+				if resp.status == 401 and attempt == 0 and await _renew_twitch_token_after_401(session, headers):
+					continue
+				data = await resp.json(content_type=None) if resp.status not in (204, 304) and resp.content_length != 0 else None
+				return resp.status, data
+		return None, None
+
+	async def user_ids(self, session: aiohttp.ClientSession, logins: list) -> dict:
+		"""login -> user_id; неизвестные запрашиваются через /users пачками по 100"""
+		users = self._state().setdefault("users", {})
+		now = time.time()
+
+		def expired(login):
+			entry = users.get(login)
+			# Несуществующие логины перепроверяются раз в сутки
+			ttl = TWITCH_USER_ID_TTL if entry and entry.get("id") else 86400
+			return entry is None or now - entry.get("at", 0) >= ttl
+
+		missing = [login for login in logins if expired(login)]
+		for i in range(0, len(missing), 100):
+			chunk = missing[i:i + 100]
+			status, data = await self._helix(session, "GET", "/users", params=[("login", login) for login in chunk])
+			if status != 200:
+				logger.warning(f"Twitch: не удалось получить ID пользователей ({status})")
+				continue
+			found = {user["login"].lower(): user["id"] for user in (data or {}).get("data", [])}
+			for login in chunk:
+				users[login] = {"id": found.get(login), "at": now}
+			state_store.mark_dirty("twitch_state")
+		return {login: users[login]["id"] for login in logins if users.get(login, {}).get("id")}
+
+	async def list_subscriptions(self, session: aiohttp.ClientSession) -> list | None:
+		"""Подписки stream.online этого бота (с нашим колбэком), все страницы"""
+		subscriptions = []
+		cursor = None
+		while True:
+			params = {"type": "stream.online"}
+			if cursor:
+				params["after"] = cursor
+			status, data = await self._helix(session, "GET", "/eventsub/subscriptions", params=params)
+			if status != 200:
+				logger.warning(f"Twitch EventSub: не удалось получить подписки ({status})")
+				return None
+			subscriptions.extend(
+				sub for sub in data.get("data", [])
+				if (sub.get("transport") or {}).get("callback") == TWITCH_EVENTSUB_CALLBACK
+			)
+			cursor = (data.get("pagination") or {}).get("cursor")
+			if not cursor:
+				return subscriptions
+
+	async def subscribe(self, session: aiohttp.ClientSession, user_id: str) -> bool:
+		body = {
+			"type": "stream.online",
+			"version": "1",
+			"condition": {"broadcaster_user_id": user_id},
+			"transport": {"method": "webhook", "callback": TWITCH_EVENTSUB_CALLBACK, "secret": self.secret()},
+		}
+		status, data = await self._helix(session, "POST", "/eventsub/subscriptions", json=body)
+		if status in (202, 409):  # 409 — такая подписка уже есть
+			return True
+		logger.warning(f"Twitch EventSub: подписка на {user_id} не создана ({status}): {data}")
+		return False
+
+	async def unsubscribe(self, session: aiohttp.ClientSession, subscription_id: str) -> bool:
+		status, _ = await self._helix(session, "DELETE", "/eventsub/subscriptions", params={"id": subscription_id})
+		return status in (204, 404)
+
+	async def reconcile(self, session: aiohttp.ClientSession) -> tuple[int, int]:
+		"""
+		Приводит подписки к списку channels.json: создаёт недостающие,
+		пересоздаёт отключённые Twitch и удаляет подписки на удалённые логины.
+		"""
+		logins = (await async_load_tracking()).get("twitch", [])
+		wanted = set((await self.user_ids(session, logins)).values())
+		existing = await self.list_subscriptions(session)
+		if existing is None:
+			return 0, 0
+		covered = set()
+		stale = []
+		for sub in existing:
+			user_id = (sub.get("condition") or {}).get("broadcaster_user_id")
+			if user_id in wanted and sub.get("status") not in _EVENTSUB_FAILED_STATUSES:
+				covered.add(user_id)
+			else:
+				stale.append(sub["id"])
+		missing = wanted - covered
+		semaphore = asyncio.Semaphore(TWITCH_CONCURRENCY)
+
+		async def limited(coro):
+			async with semaphore:
+				return await coro
+
+		deleted = await asyncio.gather(*(limited(self.unsubscribe(session, sub_id)) for sub_id in stale))
+		created = await asyncio.gather(*(limited(self.subscribe(session, user_id)) for user_id in missing))
+		self.subscriptions = len(covered) + sum(created)
+		self.last_reconcile = time.time()
+		return sum(created), sum(deleted)
+
+	def schedule_reconcile(self, delay: float = 2.0):
+		"""Сверка после /twitch_add и /twitch_remove; несколько изменений подряд дают одну сверку"""
+		if not self.active or (self._reconcile_task is not None and not self._reconcile_task.done()):
+			return
+
+		async def run():
+			await asyncio.sleep(delay)
+			try:
+				created, deleted = await self.reconcile(get_http_session())
+				if created or deleted:
+					logger.info(f"Twitch EventSub: создано подписок {created}, удалено {deleted}")
+			except Exception as e:
+				logger.error(f"Twitch EventSub: ошибка сверки подписок: {e}")
+
+		self._reconcile_task = asyncio.create_task(run())
+
+	def _signature_valid(self, request: web.Request, body: bytes) -> bool:
+		message_id = request.headers.get("Twitch-Eventsub-Message-Id", "")
+		timestamp = request.headers.get("Twitch-Eventsub-Message-Timestamp", "")
+		signature = request.headers.get("Twitch-Eventsub-Message-Signature", "")
+		expected = "sha256=" + hmac.new(self.secret().encode(), message_id.encode() + timestamp.encode() + body, hashlib.sha256).hexdigest()
+		if not message_id or not hmac.compare_digest(expected, signature.lower()):
+			return False
+		try:
+			sent_at = datetime.fromisoformat(re.sub(r"(\.\d{6})\d*", r"\1", timestamp).replace("Z", "+00:00"))
+		except ValueError:
+			return False
+		return abs(time.time() - sent_at.timestamp()) <= TWITCH_EVENTSUB_MAX_AGE
+
+	def _is_duplicate(self, message_id: str) -> bool:
+		now = time.time()
+		if len(self._seen_messages) > 1000:
+			self._seen_messages = {k: t for k, t in self._seen_messages.items() if now - t <= TWITCH_EVENTSUB_MAX_AGE}
+		if message_id in self._seen_messages:
+			return True
+		self._seen_messages[message_id] = now
+		return False
+
+	async def handle_webhook(self, request: web.Request) -> web.Response:
+		"""POST от Twitch: подтверждение подписки, уведомление или отзыв подписки"""
+		body = await request.read()
+		if not self._signature_valid(request, body):
+			self.stats["rejected"] += 1
+			logger.warning("Twitch EventSub: сообщение с неверной подписью или устаревшее отклонено")
+			return web.Response(status=403)
+		try:
+			payload = json.loads(body)
+		except ValueError:
+			return web.Response(status=400)
+		message_type = request.headers.get("Twitch-Eventsub-Message-Type")
+		subscription = payload.get("subscription") or {}
+		if message_type == "webhook_callback_verification":
+			self.stats["verified"] += 1
+			return web.Response(text=payload.get("challenge", ""), content_type="text/plain")
+		if self._is_duplicate(request.headers["Twitch-Eventsub-Message-Id"]):
+			self.stats["duplicates"] += 1
+			return web.Response(status=204)
+		if message_type == "revocation":
+			self.stats["revoked"] += 1
+			logger.warning(f"Twitch EventSub: подписка {subscription.get('id')} отозвана ({subscription.get('status')})")
+			self.schedule_reconcile()
+		elif message_type == "notification" and subscription.get("type") == "stream.online":
+			self.stats["notifications"] += 1
+			task = asyncio.create_task(self._announce(payload.get("event") or {}))
+			self._tasks.add(task)
+			task.add_done_callback(self._tasks.discard)
+		return web.Response(status=204)
+
+	async def _announce(self, event: dict):
+		try:
+			login = (event.get("broadcaster_user_login") or "").lower()
+			if not login or login not in (await async_load_tracking()).get("twitch", []) or self.bot is None:
+				return
+			channel = self.bot.get_channel(self.notifications_channel_id)
+			if channel is None or _missing_send_perms(channel):
+				logger.warning(f"Twitch EventSub: канал уведомлений {self.notifications_channel_id} недоступен")
+				return
+			# Название эфира в событии не передаётся — берём его из /streams, если эфир уже там виден
+			title = ""
+			for stream in await _fetch_twitch_streams(get_http_session(), [login]):
+				if stream.get("id") == event.get("id"):
+					title = stream.get("title", "")
+			sent = await _twitch_announce(channel, [{"user_login": login, "id": event.get("id"), "title": title}])
+			self.stats["announced"] += sent
+		except Exception as e:
+			logger.error(f"Twitch EventSub: ошибка обработки уведомления: {e}")
+
+	def report(self) -> dict:
+		return {
+			"active": self.active,
+			"callback": TWITCH_EVENTSUB_CALLBACK,
+			"subscriptions": self.subscriptions,
+			"last_reconcile": self.last_reconcile,
+			**self.stats,
+		}
+
+twitch_eventsub = TwitchEventSub()
+
+@tasks.loop(minutes=30)
+async def maintain_twitch_eventsub():
+	try:
+		created, deleted = await twitch_eventsub.reconcile(get_http_session())
+		if created or deleted:
+			logger.info(f"Twitch EventSub: создано подписок {created}, удалено {deleted}")
+	except Exception as e:
+		logger.error(f"Twitch EventSub: ошибка сверки подписок: {e}")
+
 # --------------------------
 # YouTube tracking (2 минуты), поддержка @handle/URL/UC
 # --------------------------
@@ -930,41 +2696,366 @@ def _extract_channel_id_from_url(url: str) -> str | None:
 		return None
 	return None
 
-async def _resolve_youtube_channel_id(session: aiohttp.ClientSession, input_str: str) -> str | None:
+def _youtube_resolve_key(input_str: str) -> tuple[str, str]:
+	"""
+	Нормализует ввод пользователя: ("id", "UC...") для channelId и ссылок
+	/channel/UC..., иначе ("handle", "@handle") в нижнем регистре — handle
+	на YouTube не зависит от регистра, поэтому "@Name" и ссылка на него дают один ключ.
+	"""
 	s = input_str.strip()
 	if re.fullmatch(r"UC[0-9A-Za-z_-]{21,}", s):
-		return s
+		return "id", s
 	if s.startswith("http://") or s.startswith("https://"):
 		extracted = _extract_channel_id_from_url(s)
 		if extracted and extracted.startswith("UC"):
-			return extracted
+			return "id", extracted
 		if extracted and extracted.startswith("@"):
 			s = extracted
 	handle = s if s.startswith("@") else "@" + s
-	if not YOUTUBE_API_KEY:
-		return None
-	params = {"part": "id", "forHandle": handle, "key": YOUTUBE_API_KEY}
-	async with session.get("https://www.googleapis.com/youtube/v3/channels", params=params) as resp:
-		data = await resp.json()
-		if resp.status == 200 and data.get("items"):
-			cid = data["items"][0].get("id")
-			if isinstance(cid, str) and cid.startswith("UC"):
-				return cid
-	params = {"part": "snippet", "type": "channel", "q": handle.lstrip("@"), "maxResults": "1", "key": YOUTUBE_API_KEY}
-	async with session.get("https://www.googleapis.com/youtube/v3/search", params=params) as resp:
-		data = await resp.json()
-		items = data.get("items", [])
-		if resp.status == 200 and items:
-			cid = (items[0].get("id") or {}).get("channelId")
-			if cid and cid.startswith("UC"):
-				return cid
-	return None
+	return "handle", handle.lower()
+
+class YouTubeResolver:
+	"""
+	Постоянный кэш handle/ссылка -> channelId (youtube_state["resolved"]).
+
+	Удачные ответы хранятся YOUTUBE_RESOLVE_TTL, «канал не найден» —
+	YOUTUBE_RESOLVE_NEGATIVE_TTL. Кэш дополняется сведениями об отслеживаемых
+	каналах из channels.json (youtube_state["channels"], см.
+	_youtube_prefetch_channels), поэтому /youtube_remove и повторные
+	/youtube_check не обращаются к API. Одновременные запросы одного handle
+	(массовый импорт) ждут один запрос к API.
+	"""
+
+	def __init__(self):
+		self._inflight = {}
+
+	@staticmethod
+	def _state() -> dict:
+		return state_store.get("youtube_state")
+
+	def lookup(self, key: str) -> tuple[bool, str | None]:
+		"""(найдено в кэше, channelId или None для отрицательного ответа)"""
+		now = time.time()
+		entry = self._state().get("resolved", {}).get(key)
+		if entry:
+			ttl = YOUTUBE_RESOLVE_TTL if entry.get("id") else YOUTUBE_RESOLVE_NEGATIVE_TTL
+			if now - entry.get("at", 0) < ttl:
+				return True, entry.get("id")
+		for cid, meta in self._state().get("channels", {}).items():
+			if (meta.get("handle") or "").lower() == key and now - meta.get("at", 0) < YOUTUBE_RESOLVE_TTL:
+				return True, cid
+		return False, None
+
+	def store(self, key: str, channel_id: str | None):
+		self._state().setdefault("resolved", {})[key] = {"id": channel_id, "at": time.time()}
+		state_store.mark_dirty("youtube_state")
+
+	def stats(self) -> dict:
+		now = time.time()
+		resolved = self._state().get("resolved", {})
+		return {
+			"handles": sum(1 for e in resolved.values() if e.get("id") and now - e.get("at", 0) < YOUTUBE_RESOLVE_TTL),
+			"negative": sum(1 for e in resolved.values() if not e.get("id") and now - e.get("at", 0) < YOUTUBE_RESOLVE_NEGATIVE_TTL),
+			"channels": len(self._state().get("channels", {})),
+		}
+
+	async def resolve(self, session: aiohttp.ClientSession, input_str: str, network: bool = True) -> str | None:
+		"""channelId по вводу пользователя; network=False — только локально и из кэша"""
+		kind, key = _youtube_resolve_key(input_str)
+		if kind == "id":
+			return key
+		found, cid = self.lookup(key)
+		if found or not network or not YOUTUBE_API_KEY:
+			return cid
+		future = self._inflight.get(key)
+		if future is None:
+			future = asyncio.ensure_future(self._request(session, key))
+			self._inflight[key] = future
+			future.add_done_callback(lambda f, key=key: self._inflight.pop(key, None) if self._inflight.get(key) is f else None)
+		return await asyncio.shield(future)
+
+	async def _request(self, session: aiohttp.ClientSession, key: str) -> str | None:
+		"""
+		channels.list?forHandle, затем search.list. В кэш попадает только
+		окончательный ответ: ошибки сети и статусы кроме 200 не кэшируются.
+		"""
+		params = {"part": "id", "forHandle": key, "key": YOUTUBE_API_KEY}
+		async with session.get(f"{YOUTUBE_API_BASE}/channels", params=params) as resp:
+			youtube_quota.spend("channels")
+			data = await resp.json(content_type=None)
+			if resp.status != 200:
+				return None
+			if data.get("items"):
+				cid = data["items"][0].get("id")
+				if isinstance(cid, str) and cid.startswith("UC"):
+					self.store(key, cid)
+					return cid
+		params = {"part": "snippet", "type": "channel", "q": key.lstrip("@"), "maxResults": "1", "key": YOUTUBE_API_KEY}
+		async with session.get(f"{YOUTUBE_API_BASE}/search", params=params) as resp:
+			youtube_quota.spend("search")
+			data = await resp.json(content_type=None)
+			if resp.status != 200:
+				return None
+			items = data.get("items", [])
+			cid = (items[0].get("id") or {}).get("channelId") if items else None
+			cid = cid if cid and cid.startswith("UC") else None
+			self.store(key, cid)
+			return cid
 
-async def _youtube_latest_video(session: aiohttp.ClientSession, channel_id: str):
-	if not YOUTUBE_API_KEY:
+youtube_resolver = YouTubeResolver()
+
+async def _resolve_youtube_channel_id(session: aiohttp.ClientSession, input_str: str, network: bool = True) -> str | None:
+	return await youtube_resolver.resolve(session, input_str, network)
+
+# Стоимость вызовов YouTube Data API в единицах квоты
+YOUTUBE_QUOTA_COSTS = {"search": 100, "channels": 1, "playlistItems": 1, "videos": 1, "feed": 0}
+
+# Сколько запросов на один канал за опрос делает каждый бэкенд
+_YOUTUBE_BACKEND_CALLS = {"search": "search", "playlist": "playlistItems", "rss": "feed"}
+
+class YouTubeQuota:
+	"""
+	Учёт расхода квоты YouTube Data API за текущие сутки (квота сбрасывается
+	в полночь по тихоокеанскому времени) и прогноз суточного расхода для
+	текущего списка каналов и бэкенда опроса.
+	"""
+
+	@staticmethod
+	def _today() -> str:
+		try:
+			from zoneinfo import ZoneInfo
+
+			return datetime.now(ZoneInfo("America/Los_Angeles")).date().isoformat()
+		except Exception:
+			return datetime.now(timezone.utc).date().isoformat()
+
+	def _usage(self) -> dict:
+		quota = state_store.get("youtube_state").setdefault("quota", {})
+		today = self._today()
+		if quota.get("day") != today:
+			quota.clear()
+			quota.update({"day": today, "used": {}})
+		return quota
+
+	def spend(self, endpoint: str, calls: int = 1):
+		cost = YOUTUBE_QUOTA_COSTS.get(endpoint, 1) * calls
+		if not cost:
+			return
+		used = self._usage()["used"]
+		used[endpoint] = used.get(endpoint, 0) + cost
+		state_store.mark_dirty("youtube_state")
+
+	def used_today(self) -> int:
+		return sum(self._usage()["used"].values())
+
+	def report(self, channel_count: int, backend: str | None = None, interval: float | None = None) -> dict:
+		backend = backend or YOUTUBE_BACKEND
+		interval = interval or POLL_INTERVALS["youtube"][0]
+		polls_per_day = 86400 / interval
+		per_poll = YOUTUBE_QUOTA_COSTS[_YOUTUBE_BACKEND_CALLS.get(backend, "search")] * channel_count
+		projected = int(per_poll * polls_per_day)
+		return {
+			"backend": backend,
+			"channels": channel_count,
+			"interval": int(interval),
+			"used_today": self.used_today(),
+			"used_by_endpoint": dict(self._usage()["used"]),
+			"projected_daily": projected,
+			"daily_limit": YOUTUBE_DAILY_QUOTA,
+			"fits": projected <= YOUTUBE_DAILY_QUOTA,
+			"projected_by_backend": {
+				name: int(YOUTUBE_QUOTA_COSTS[call] * channel_count * polls_per_day)
+				for name, call in _YOUTUBE_BACKEND_CALLS.items()
+			},
+		}
+
+youtube_quota = YouTubeQuota()
+
+# Кэш условных запросов YouTube: url -> {"etag", "last_modified", "result"}
+_youtube_cache = {}
+
+async def _youtube_conditional_get(session: aiohttp.ClientSession, url: str, params: dict | None, parse):
+	"""
+	GET с If-None-Match / If-Modified-Since. При 304 возвращает ранее
+	разобранный результат; parse(resp) вызывается только для 200.
+	Возвращает (успех, результат).
+	"""
+	cache_key = url + "?" + "&".join(f"{k}={v}" for k, v in sorted((params or {}).items()) if k != "key")
+	cached = _youtube_cache.get(cache_key)
+	headers = {}
+	if cached:
+		if cached.get("etag"):
+			headers["If-None-Match"] = cached["etag"]
+		if cached.get("last_modified"):
+			headers["If-Modified-Since"] = cached["last_modified"]
+	async with session.get(url, params=params, headers=headers) as resp:
+		poll_scheduler.note_response(resp)
+		if resp.status == 304 and cached:
+			return True, cached["result"]
+		if resp.status != 200:
+			return False, None
+		result = await parse(resp)
+		_youtube_cache[cache_key] = {
+			"etag": resp.headers.get("ETag"),
+			"last_modified": resp.headers.get("Last-Modified"),
+			"result": result,
+		}
+		return True, result
+
+async def _youtube_uploads_playlist(session: aiohttp.ClientSession, channel_id: str) -> str | None:
+	"""ID плейлиста загрузок канала (запрашивается один раз и хранится в состоянии)"""
+	uploads = state_store.get("youtube_state").setdefault("uploads", {})
+	if channel_id in uploads:
+		return uploads[channel_id]
+	params = {"part": "contentDetails", "id": channel_id, "key": YOUTUBE_API_KEY}
+	async with session.get(f"{YOUTUBE_API_BASE}/channels", params=params) as resp:
+		youtube_quota.spend("channels")
+		poll_scheduler.note_response(resp)
+		if resp.status != 200:
+			return None
+		data = await resp.json()
+	items = data.get("items") or []
+	if not items:
+		return None
+	playlist_id = ((items[0].get("contentDetails") or {}).get("relatedPlaylists") or {}).get("uploads")
+	if playlist_id:
+		uploads[channel_id] = playlist_id
+		state_store.mark_dirty("youtube_state")
+	return playlist_id
+
+# Сколько ID принимают channels.list и videos.list за один запрос
+YOUTUBE_BATCH_SIZE = 50
+
+async def _youtube_prefetch_channels(session: aiohttp.ClientSession, channel_ids: list):
+	"""
+	Запрашивает сведения о каналах, которых ещё нет в состоянии (или они
+	устарели), пачками по YOUTUBE_BATCH_SIZE через channels.list (1 единица
+	квоты на пачку вместо 1 на канал): плейлист загрузок для бэкенда playlist
+	и handle (customUrl) для кэша YouTubeResolver.
+	"""
+	state = state_store.get("youtube_state")
+	uploads = state.setdefault("uploads", {})
+	channels = state.setdefault("channels", {})
+	now = time.time()
+	missing = [
+		cid for cid in dict.fromkeys(channel_ids)
+		if cid not in uploads or now - channels.get(cid, {}).get("at", 0) >= YOUTUBE_RESOLVE_TTL
+	]
+	for i in range(0, len(missing), YOUTUBE_BATCH_SIZE):
+		batch = missing[i:i + YOUTUBE_BATCH_SIZE]
+		params = {"part": "snippet,contentDetails", "id": ",".join(batch), "maxResults": str(YOUTUBE_BATCH_SIZE), "key": YOUTUBE_API_KEY}
+		try:
+			async with session.get(f"{YOUTUBE_API_BASE}/channels", params=params) as resp:
+				youtube_quota.spend("channels")
+				poll_scheduler.note_response(resp)
+				if resp.status != 200:
+					logger.warning(f"YouTube channels.list: статус {resp.status} для {len(batch)} каналов")
+					continue
+				data = await resp.json()
+		except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+			logger.warning(f"YouTube channels.list: {e}")
+			continue
+		for item in data.get("items") or []:
+			cid = item.get("id")
+			if not cid:
+				continue
+			playlist_id = ((item.get("contentDetails") or {}).get("relatedPlaylists") or {}).get("uploads")
+			if playlist_id:
+				uploads[cid] = playlist_id
+			snippet = item.get("snippet") or {}
+			channels[cid] = {"handle": snippet.get("customUrl", ""), "title": snippet.get("title", ""), "at": now}
+		state_store.mark_dirty("youtube_state")
+
+async def _youtube_video_details(session: aiohttp.ClientSession, video_ids: list) -> dict:
+	"""
+	Сведения о видео пачками по YOUTUBE_BATCH_SIZE через videos.list:
+	{video_id: {"title", "channel_title", "live"}}, где live — liveBroadcastContent
+	("none", "live" или "upcoming"). Пачки запрашиваются одновременно;
+	неудачная пачка просто отсутствует в результате.
+	"""
+	ids = list(dict.fromkeys(video_ids))
+	if not ids or not YOUTUBE_API_KEY:
+		return {}
+
+	async def fetch(batch):
+		params = {"part": "snippet", "id": ",".join(batch), "maxResults": str(YOUTUBE_BATCH_SIZE), "key": YOUTUBE_API_KEY}
+		async with session.get(f"{YOUTUBE_API_BASE}/videos", params=params) as resp:
+			youtube_quota.spend("videos")
+			poll_scheduler.note_response(resp)
+			if resp.status != 200:
+				logger.warning(f"YouTube videos.list: статус {resp.status} для {len(batch)} видео")
+				return []
+			return (await resp.json()).get("items") or []
+
+	batches = [ids[i:i + YOUTUBE_BATCH_SIZE] for i in range(0, len(ids), YOUTUBE_BATCH_SIZE)]
+	details = {}
+	for result in await asyncio.gather(*(fetch(b) for b in batches), return_exceptions=True):
+		if isinstance(result, BaseException):
+			logger.warning(f"YouTube videos.list: {result}")
+			continue
+		for item in result:
+			snippet = item.get("snippet") or {}
+			details[item.get("id")] = {
+				"title": snippet.get("title", ""),
+				"channel_title": snippet.get("channelTitle", ""),
+				"live": snippet.get("liveBroadcastContent", "none"),
+			}
+	return details
+
+async def _youtube_latest_via_playlist(session: aiohttp.ClientSession, channel_id: str):
+	playlist_id = await _youtube_uploads_playlist(session, channel_id)
+	if not playlist_id:
 		return None
+	params = {"part": "snippet,contentDetails", "playlistId": playlist_id, "maxResults": "1", "key": YOUTUBE_API_KEY}
+
+	async def parse(resp):
+		data = await resp.json()
+		items = data.get("items") or []
+		if not items:
+			return None
+		it = items[0]
+		vid = (it.get("contentDetails") or {}).get("videoId") or ((it.get("snippet") or {}).get("resourceId") or {}).get("videoId")
+		if not vid:
+			return None
+		return {"video_id": vid, "title": (it.get("snippet") or {}).get("title", "")}
+
+	youtube_quota.spend("playlistItems")
+	ok, result = await _youtube_conditional_get(session, f"{YOUTUBE_API_BASE}/playlistItems", params, parse)
+	return result if ok else None
+
+_ATOM_NS = {"atom": "http://www.w3.org/2005/Atom", "yt": "http://www.youtube.com/xml/schemas/2015"}
+
+def _parse_youtube_feed(body: bytes) -> list:
+	"""
+	Видео из Atom-ленты YouTube (новые первыми): [{"video_id", "title", "channel_id", "published"}].
+	Тот же формат приходит в push-уведомлениях WebSub.
+	"""
+	root = ElementTree.fromstring(body)
+	videos = []
+	for entry in root.findall("atom:entry", _ATOM_NS):
+		vid = entry.findtext("yt:videoId", default="", namespaces=_ATOM_NS)
+		if vid:
+			videos.append({
+				"video_id": vid,
+				"title": entry.findtext("atom:title", default="", namespaces=_ATOM_NS),
+				"channel_id": entry.findtext("yt:channelId", default="", namespaces=_ATOM_NS),
+				"published": entry.findtext("atom:published", default="", namespaces=_ATOM_NS),
+			})
+	return videos
+
+async def _youtube_latest_via_feed(session: aiohttp.ClientSession, channel_id: str):
+	async def parse(resp):
+		videos = _parse_youtube_feed(await resp.read())
+		return videos[0] if videos else None
+
+	ok, result = await _youtube_conditional_get(session, YOUTUBE_FEED_URL, {"channel_id": channel_id}, parse)
+	return result if ok else None
+
+async def _youtube_latest_via_search(session: aiohttp.ClientSession, channel_id: str):
 	params = {"key": YOUTUBE_API_KEY, "channelId": channel_id, "part": "snippet", "order": "date", "maxResults": "1", "type": "video", "safeSearch": "none"}
-	async with session.get("https://www.googleapis.com/youtube/v3/search", params=params) as resp:
+	async with session.get(f"{YOUTUBE_API_BASE}/search", params=params) as resp:
+		youtube_quota.spend("search")
+		poll_scheduler.note_response(resp)
 		if resp.status != 200:
 			return None
 		data = await resp.json()
@@ -978,56 +3069,186 @@ async def _youtube_latest_video(session: aiohttp.ClientSession, channel_id: str)
 			return None
 		return {"video_id": vid, "title": title}
 
-@tasks.loop(seconds=120)  # Изменено с 10 секунд на 2 минуты
+async def _youtube_latest_video(session: aiohttp.ClientSession, channel_id: str):
+	"""Последнее видео канала через бэкенд YOUTUBE_BACKEND (без API-ключа — только RSS)"""
+	if YOUTUBE_BACKEND == "rss" or not YOUTUBE_API_KEY:
+		return await _youtube_latest_via_feed(session, channel_id)
+	if YOUTUBE_BACKEND == "search":
+		return await _youtube_latest_via_search(session, channel_id)
+	return await _youtube_latest_via_playlist(session, channel_id)
+
+@tasks.loop(seconds=POLL_TICK_SECONDS)  # Интервал опроса задаёт poll_scheduler (по умолчанию 2 минуты)
 async def poll_youtube(bot, notifications_channel_id: int):
+	poll_scheduler.register("youtube", *_youtube_poll_intervals())
+	await poll_scheduler.run_if_due("youtube", _poll_youtube, bot, notifications_channel_id)
+
+# Метрики последнего тика опроса YouTube (см. youtube_poll_stats)
+_youtube_tick_stats = {}
+
+# Анонсированные премьеры/трансляции: video_id -> время последней проверки.
+# Такое видео не объявляется, пока не выйдет, и перепроверяется не чаще раза в 10 минут.
+_youtube_upcoming = {}
+YOUTUBE_UPCOMING_RECHECK = 600
+
+# Сколько последних объявленных видео на канал помнить (youtube_state["seen"])
+YOUTUBE_SEEN_PER_CHANNEL = 15
+
+# Общая блокировка объявлений: опрос и WebSub не должны объявить одно видео дважды
+_youtube_announce_lock = asyncio.Lock()
+
+def youtube_poll_stats() -> dict:
+	"""Метрики последнего опроса YouTube: число каналов, ошибки и время этапов"""
+	return dict(_youtube_tick_stats)
+
+def _youtube_poll_intervals() -> tuple:
+	"""Границы интервала опроса YouTube; пока WebSub покрывает все каналы, опрос лишь редкая сверка"""
+	base, min_interval, max_interval = POLL_INTERVALS["youtube"]
+	if youtube_websub.covers(load_tracking().get("youtube", [])):
+		return YOUTUBE_WEBSUB_POLL_SECONDS, min_interval, max(max_interval, YOUTUBE_WEBSUB_POLL_SECONDS)
+	return base, min_interval, max_interval
+
+async def _youtube_announce(session: aiohttp.ClientSession, channel, candidates: list) -> dict:
+	"""
+	Объявляет новые видео в канале уведомлений; candidates — [(channel_id, {"video_id", "title"})].
+	Общая проверка дублей для опроса и WebSub: видео пропускается, если оно
+	последнее известное для канала (notified["youtube"]) или среди недавно
+	объявленных (youtube_state["seen"]). Премьеры и запланированные трансляции
+	откладываются до выхода. Сведения о видео запрашиваются пачками через videos.list,
+	сообщения отправляются одновременно.
+	"""
+	async with _youtube_announce_lock:
+		started = time.perf_counter()
+		notified = await async_load_notified()
+		notified_youtube = notified.setdefault("youtube", {})
+		seen = state_store.get("youtube_state").setdefault("seen", {})
+		now = time.monotonic()
+		fresh = {}
+		for channel_id, video in candidates:
+			vid = video["video_id"]
+			if vid in fresh or notified_youtube.get(channel_id) == vid or vid in seen.get(channel_id, []):
+				continue
+			if was_notified_before("youtube", channel_id, vid):
+				continue
+			checked = _youtube_upcoming.get(vid)
+			if checked is not None and now - checked < YOUTUBE_UPCOMING_RECHECK:
+				continue
+			fresh[vid] = (channel_id, video)
+
+		details = await _youtube_video_details(session, list(fresh))
+		enriched = time.perf_counter()
+
+		messages = []
+		for vid, (channel_id, video) in fresh.items():
+			info = details.get(vid, {})
+			if info.get("live") == "upcoming":
+				_youtube_upcoming[vid] = now
+				continue
+			_youtube_upcoming.pop(vid, None)
+			notified_youtube[channel_id] = vid
+			seen[channel_id] = (seen.get(channel_id, []) + [vid])[-YOUTUBE_SEEN_PER_CHANNEL:]
+			title = info.get("title") or video.get("title", "")
+			header = "🔴 Прямой эфир на YouTube" if info.get("live") == "live" else "Новое видео на YouTube"
+			messages.append(f"{header}: https://youtu.be/{vid}\n{title[:1900]}")
+
+		sent = 0
+		for result in await asyncio.gather(*(channel.send(text) for text in messages), return_exceptions=True):
+			if isinstance(result, BaseException):
+				logger.error(f"Ошибка отправки сообщения YouTube: {result}")
+			else:
+				sent += 1
+
+		if messages:
+			state_store.mark_dirty("youtube_state")
+			await async_save_notified(notified)
+		return {
+			"new": len(messages),
+			"sent": sent,
+			"enrich_seconds": enriched - started,
+			"send_seconds": time.perf_counter() - enriched,
+		}
+
+async def _poll_youtube(bot, notifications_channel_id: int):
+	"""
+	Один тик опроса YouTube:
+	  1. плейлисты загрузок для новых каналов — пачками через channels.list;
+	  2. последнее видео каждого канала — параллельно, не больше
+	     YOUTUBE_CONCURRENCY запросов одновременно;
+	  3. сведения о новых видео (прямой эфир / премьера) — пачками через videos.list;
+	  4. все сообщения тика отправляются вместе в конце.
+	"""
 	try:
-		if not YOUTUBE_API_KEY:
+		if not YOUTUBE_API_KEY and YOUTUBE_BACKEND != "rss":
 			return
 		tracking = await async_load_tracking()
 		channels = tracking.get("youtube", [])
 		if not channels:
 			return
 
-		timeout = aiohttp.ClientTimeout(total=8)
-		async with aiohttp.ClientSession(timeout=timeout) as session:
-			notified = await async_load_notified()
-			notified_youtube = notified.get("youtube", {})
-			channel = bot.get_channel(notifications_channel_id)
-			if channel is None:
-				return
-
-			missing = _missing_send_perms(channel)
-			if missing:
-				logger.warning(f"YouTube: нет прав в канале уведомлений ({notifications_channel_id}): {', '.join(missing)}")
-				return
+		session = get_http_session()
+		channel = bot.get_channel(notifications_channel_id)
+		if channel is None:
+			return
 
-			for channel_id in channels:
-				latest = await _youtube_latest_video(session, channel_id)
-				if not latest:
-					continue
-				vid = latest["video_id"]
-				title = latest.get("title", "")
-				last_vid = notified_youtube.get(channel_id)
-				if last_vid != vid:
-					notified_youtube[channel_id] = vid
-					url = f"https://youtu.be/{vid}"
-					try:
-						await channel.send(f"Новое видео на YouTube: {url}\n{title[:1900]}")
-					except Exception as e:
-						logger.error(f"Ошибка отправки сообщения YouTube: {e}")
+		missing = _missing_send_perms(channel)
+		if missing:
+			logger.warning(f"YouTube: нет прав в канале уведомлений ({notifications_channel_id}): {', '.join(missing)}")
+			return
 
-			notified["youtube"] = notified_youtube
-			await async_save_notified(notified)
+		started = time.perf_counter()
+		if YOUTUBE_API_KEY:
+			await _youtube_prefetch_channels(session, channels)
+
+		semaphore = asyncio.Semaphore(YOUTUBE_CONCURRENCY)
+
+		async def fetch(channel_id):
+			async with semaphore:
+				return await _youtube_latest_video(session, channel_id)
+
+		results = await asyncio.gather(*(fetch(cid) for cid in channels), return_exceptions=True)
+		fetched = time.perf_counter()
+
+		errors = 0
+		candidates = []
+		for channel_id, latest in zip(channels, results):
+			if isinstance(latest, BaseException):
+				errors += 1
+				logger.warning(f"YouTube: ошибка опроса канала {channel_id}: {latest}")
+			elif latest:
+				candidates.append((channel_id, latest))
+
+		result = await _youtube_announce(session, channel, candidates)
+		if result["sent"]:
+			poll_scheduler.mark_activity()
+
+		finished = time.perf_counter()
+		_youtube_tick_stats.update({
+			"at": time.time(),
+			"channels": len(channels),
+			"errors": errors,
+			"new": result["new"],
+			"sent": result["sent"],
+			"fetch_seconds": round(fetched - started, 3),
+			"enrich_seconds": round(result["enrich_seconds"], 3),
+			"send_seconds": round(result["send_seconds"], 3),
+			"total_seconds": round(finished - started, 3),
+		})
+		logger.log(
+			logging.INFO if result["new"] or errors else logging.DEBUG,
+			f"YouTube: опрошено каналов {len(channels)} за {finished - started:.2f} с "
+			f"(ошибок {errors}, новых видео {result['new']}, отправлено {result['sent']})"
+		)
+		if errors and errors == len(channels):
+			poll_scheduler.record_error(RuntimeError("все каналы YouTube вернули ошибку"))
 	except Exception as e:
 		logger.error(f"YouTube loop error: {e}")
+		poll_scheduler.record_error(e)
 
 async def youtube_check_and_notify(bot: discord.Client, notifications_channel_id: int, channel_input: str):
-	timeout = aiohttp.ClientTimeout(total=8)
-	async with aiohttp.ClientSession(timeout=timeout) as session:
-		cid = await _resolve_youtube_channel_id(session, channel_input)
-		if not cid:
-			return False, "Не удалось определить channelId. Укажите @handle или ссылку вида https://www.youtube.com/@handle"
-		latest = await _youtube_latest_video(session, cid)
+	session = get_http_session()
+	cid = await _resolve_youtube_channel_id(session, channel_input)
+	if not cid:
+		return False, "Не удалось определить channelId. Укажите @handle или ссылку вида https://www.youtube.com/@handle"
+	latest = await _youtube_latest_video(session, cid)
 
 	if not latest:
 		return True, f"{cid}: новых видео не найдено."
@@ -1058,12 +3279,344 @@ async def youtube_check_and_notify(bot: discord.Client, notifications_channel_id
 		logger.error(f"Ошибка отправки уведомления YouTube: {e}")
 		return False, f"{cid}: ошибка отправки уведомления."
 
+# --------------------------
+# YouTube WebSub (push-уведомления о новых видео)
+# --------------------------
+YOUTUBE_TOPIC_URL = "https://www.youtube.com/xml/feeds/videos.xml?channel_id={}"
+
+# Push о видео старше этого возраста не объявляется (хаб присылает и правки старых видео)
+YOUTUBE_PUSH_MAX_AGE = 86400
+
+class YouTubeWebSub:
+	"""
+	Подписки на хаб WebSub YouTube для каналов из channels.json.
+
+	Хаб проверяет подписку GET-запросом на колбэк (hub.challenge) и присылает
+	Atom-ленту POST-запросом при публикации или изменении видео. Подписи
+	X-Hub-Signature проверяются секретом подписки. Сроки подписок хранятся в
+	youtube_state["websub"]["leases"] и продлеваются заранее (maintain), от
+	удалённых каналов бот отписывается. Новые видео проходят ту же проверку
+	дублей, что и опрос (_youtube_announce). Пока у всех каналов есть
+	действующая подписка, опрос остаётся редкой сверкой; если подписка истекла
+	(хаб не подтвердил продление), опрос возвращается к обычному интервалу.
+	"""
+
+	def __init__(self):
+		self.active = False
+		self.bot = None
+		self.notifications_channel_id = None
+		self._pending = {}   # channel_id -> (mode, время запроса) ещё не подтверждённых запросов
+		self._tasks = set()
+		self.stats = {"verified": 0, "denied": 0, "pushes": 0, "rejected": 0, "announced": 0}
+
+	@staticmethod
+	def _state() -> dict:
+		websub = state_store.get("youtube_state").setdefault("websub", {})
+		websub.setdefault("leases", {})
+		return websub
+
+	def secret(self) -> str:
+		"""Секрет подписок: YOUTUBE_WEBSUB_SECRET или сгенерированный однажды и сохранённый"""
+		if YOUTUBE_WEBSUB_SECRET:
+			return YOUTUBE_WEBSUB_SECRET
+		websub = self._state()
+		if not websub.get("secret"):
+			websub["secret"] = secrets.token_hex(20)
+			state_store.mark_dirty("youtube_state")
+		return websub["secret"]
+
+	@staticmethod
+	def _topic_channel(topic: str) -> str | None:
+		return (parse_qs(urlparse(topic or "").query).get("channel_id") or [None])[0]
+
+	@staticmethod
+	def _renew_margin(lease: dict) -> float:
+		# Не позже чем за час (или 10% срока), но для коротких подписок не больше половины срока,
+		# иначе подписка «истекает» сразу после подтверждения и продлевается каждый цикл
+		seconds = lease.get("seconds", YOUTUBE_WEBSUB_LEASE_SECONDS)
+		return min(seconds * 0.5, max(3600.0, seconds * 0.1))
+
+	def covers(self, channels) -> bool:
+		"""WebSub работает и у каждого из channels есть неистёкшая подписка"""
+		if not self.active:
+			return False
+		leases = self._state()["leases"]
+		now = time.time()
+		return all(cid in leases and leases[cid]["expires"] > now for cid in channels)
+
+	def _is_pending(self, channel_id: str, now: float) -> bool:
+		pending = self._pending.get(channel_id)
+		return pending is not None and now - pending[1] < 600
+
+	async def request(self, session: aiohttp.ClientSession, channel_id: str, mode: str = "subscribe") -> bool:
+		"""Запрос подписки или отписки; хаб подтверждает его отдельно через колбэк"""
+		data = {
+			"hub.callback": YOUTUBE_WEBSUB_CALLBACK,
+			"hub.topic": YOUTUBE_TOPIC_URL.format(channel_id),
+			"hub.mode": mode,
+			"hub.verify": "async",
+		}
+		if mode == "subscribe":
+			data["hub.lease_seconds"] = str(YOUTUBE_WEBSUB_LEASE_SECONDS)
+			data["hub.secret"] = self.secret()
+		self._pending[channel_id] = (mode, time.time())
+		try:
+			async with session.post(YOUTUBE_WEBSUB_HUB, data=data) as resp:
+				if resp.status in (202, 204):
+					return True
+				logger.warning(f"WebSub: хаб ответил {resp.status} на {mode} {channel_id}: {(await resp.text())[:200]}")
+		except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+			logger.warning(f"WebSub: ошибка запроса {mode} {channel_id}: {e}")
+		self._pending.pop(channel_id, None)
+		return False
+
+	async def sync_channel(self, channel_id: str, subscribe: bool):
+		"""Подписка сразу после /youtube_add и отписка после /youtube_remove"""
+		if self.active:
+			await self.request(get_http_session(), channel_id, "subscribe" if subscribe else "unsubscribe")
+
+	async def maintain(self, session: aiohttp.ClientSession) -> tuple[int, int]:
+		"""Продлевает подписки, которые скоро истекут, и отписывается от удалённых каналов"""
+		channels = (await async_load_tracking()).get("youtube", [])
+		leases = self._state()["leases"]
+		now = time.time()
+		subscribe = [
+			cid for cid in channels
+			if not self._is_pending(cid, now)
+			and (cid not in leases or leases[cid]["expires"] - now < self._renew_margin(leases[cid]))
+		]
+		tracked = set(channels)
+		unsubscribe = [cid for cid in leases if cid not in tracked and not self._is_pending(cid, now)]
+		semaphore = asyncio.Semaphore(YOUTUBE_CONCURRENCY)
+
+		async def send(cid, mode):
+			async with semaphore:
+				return await self.request(session, cid, mode)
+
+		await asyncio.gather(
+			*(send(cid, "subscribe") for cid in subscribe),
+			*(send(cid, "unsubscribe") for cid in unsubscribe),
+		)
+		return len(subscribe), len(unsubscribe)
+
+	async def handle_verify(self, request: web.Request) -> web.Response:
+		"""GET от хаба: подтверждение подписки/отписки или отказ (hub.mode=denied)"""
+		query = request.query
+		mode = query.get("hub.mode")
+		channel_id = self._topic_channel(query.get("hub.topic"))
+		leases = self._state()["leases"]
+		if mode == "denied":
+			self.stats["denied"] += 1
+			logger.warning(f"WebSub: хаб отклонил подписку на {channel_id}: {query.get('hub.reason', '')}")
+			self._pending.pop(channel_id, None)
+			if leases.pop(channel_id, None) is not None:
+				state_store.mark_dirty("youtube_state")
+			return web.Response(text="")
+		challenge = query.get("hub.challenge")
+		if mode not in ("subscribe", "unsubscribe") or not channel_id or not challenge:
+			return web.Response(status=404)
+		# Подтверждаем только то, что соответствует списку каналов
+		tracked = channel_id in (await async_load_tracking()).get("youtube", [])
+		if (mode == "subscribe") != tracked:
+			return web.Response(status=404)
+		self._pending.pop(channel_id, None)
+		if mode == "subscribe":
+			try:
+				lease_seconds = int(query.get("hub.lease_seconds") or YOUTUBE_WEBSUB_LEASE_SECONDS)
+			except ValueError:
+				lease_seconds = YOUTUBE_WEBSUB_LEASE_SECONDS
+			leases[channel_id] = {"expires": time.time() + lease_seconds, "seconds": lease_seconds}
+		else:
+			leases.pop(channel_id, None)
+		state_store.mark_dirty("youtube_state")
+		self.stats["verified"] += 1
+		return web.Response(text=challenge, content_type="text/plain")
+
+	def _signature_valid(self, body: bytes, header: str) -> bool:
+		algorithm, _, digest = (header or "").partition("=")
+		if algorithm not in ("sha1", "sha256", "sha384", "sha512") or not digest:
+			return False
+		expected = hmac.new(self.secret().encode(), body, algorithm).hexdigest()
+		return hmac.compare_digest(expected, digest.lower())
+
+	async def handle_push(self, request: web.Request) -> web.Response:
+		"""POST от хаба: Atom-лента с новыми или изменёнными видео"""
+		body = await request.read()
+		if not self._signature_valid(body, request.headers.get("X-Hub-Signature")):
+			# По спецификации неподписанное сообщение подтверждается, но игнорируется
+			self.stats["rejected"] += 1
+			logger.warning("WebSub: push с неверной подписью отклонён")
+			return web.Response(status=202)
+		try:
+			videos = _parse_youtube_feed(body)
+		except ElementTree.ParseError as e:
+			logger.warning(f"WebSub: не удалось разобрать push: {e}")
+			return web.Response(status=400)
+		self.stats["pushes"] += 1
+		if videos:
+			task = asyncio.create_task(self._announce(videos))
+			self._tasks.add(task)
+			task.add_done_callback(self._tasks.discard)
+		return web.Response(status=202)
+
+	@staticmethod
+	def _is_recent(published: str) -> bool:
+		try:
+			return time.time() - datetime.fromisoformat(published.replace("Z", "+00:00")).timestamp() < YOUTUBE_PUSH_MAX_AGE
+		except (ValueError, AttributeError):
+			return True
+
+	async def _announce(self, videos: list):
+		try:
+			tracked = set((await async_load_tracking()).get("youtube", []))
+			candidates = [(v["channel_id"], v) for v in videos if v["channel_id"] in tracked and self._is_recent(v.get("published"))]
+			if not candidates or self.bot is None:
+				return
+			channel = self.bot.get_channel(self.notifications_channel_id)
+			if channel is None or _missing_send_perms(channel):
+				logger.warning(f"WebSub: канал уведомлений {self.notifications_channel_id} недоступен")
+				return
+			result = await _youtube_announce(get_http_session(), channel, candidates)
+			self.stats["announced"] += result["sent"]
+			if result["new"]:
+				logger.info(f"WebSub: объявлено новых видео YouTube: {result['sent']}")
+		except Exception as e:
+			logger.error(f"WebSub: ошибка обработки push: {e}")
+
+	def report(self) -> dict:
+		leases = self._state()["leases"]
+		now = time.time()
+		expiring = [lease["expires"] for lease in leases.values()]
+		return {
+			"active": self.active,
+			"callback": YOUTUBE_WEBSUB_CALLBACK,
+			"subscribed": sum(1 for e in expiring if e > now),
+			"next_expiry": min(expiring) if expiring else None,
+			"pending": len(self._pending),
+			**self.stats,
+		}
+
+youtube_websub = YouTubeWebSub()
+
+@tasks.loop(minutes=10)
+async def maintain_youtube_websub():
+	try:
+		subscribed, unsubscribed = await youtube_websub.maintain(get_http_session())
+		if subscribed or unsubscribed:
+			logger.info(f"WebSub: запрошено подписок {subscribed}, отписок {unsubscribed}")
+	except Exception as e:
+		logger.error(f"WebSub: ошибка продления подписок: {e}")
+
+# --------------------------
+# Встроенный веб-сервер push-уведомлений (WebSub YouTube, EventSub Twitch)
+# --------------------------
+_webhook_runner = None
+
+async def _dispatch_webhook_post(request: web.Request) -> web.Response:
+	"""Общий путь колбэков: сообщения Twitch отличаются заголовком Twitch-Eventsub-Message-Type"""
+	if "Twitch-Eventsub-Message-Type" in request.headers:
+		return await twitch_eventsub.handle_webhook(request)
+	return await youtube_websub.handle_push(request)
+
+def _build_webhook_app() -> web.Application:
+	"""
+	Маршруты колбэков WebSub и EventSub. Если оба адреса указывают на один путь
+	(например, оба оставлены на "/"), POST на нём разбирается _dispatch_webhook_post,
+	а не регистрируется дважды (aiohttp не допускает повторный маршрут).
+	"""
+	app = web.Application(client_max_size=1024 * 1024)
+	youtube_path = (urlparse(YOUTUBE_WEBSUB_CALLBACK).path or "/") if YOUTUBE_WEBSUB_CALLBACK else None
+	twitch_path = (urlparse(TWITCH_EVENTSUB_CALLBACK).path or "/") if TWITCH_EVENTSUB_CALLBACK else None
+	if youtube_path is not None and youtube_path == twitch_path:
+		logger.warning(f"Колбэки WebSub и EventSub используют один путь {youtube_path}: запросы разделяются по заголовкам Twitch")
+		app.router.add_get(youtube_path, youtube_websub.handle_verify)
+		app.router.add_post(youtube_path, _dispatch_webhook_post)
+		return app
+	if youtube_path is not None:
+		app.router.add_get(youtube_path, youtube_websub.handle_verify)
+		app.router.add_post(youtube_path, youtube_websub.handle_push)
+	if twitch_path is not None:
+		app.router.add_post(twitch_path, twitch_eventsub.handle_webhook)
+	return app
+
+async def start_webhook_server(bot: discord.Client, notifications_channel_id: int) -> bool:
+	"""
+	Запускает встроенный веб-сервер (WEBHOOK_HOST:WEBHOOK_PORT) с колбэками
+	WebSub YouTube и EventSub Twitch по путям из YOUTUBE_WEBSUB_CALLBACK и
+	TWITCH_EVENTSUB_CALLBACK и циклы обслуживания подписок. Повторный вызов
+	(переподключение бота) ничего не делает.
+	"""
+	global _webhook_runner
+	if _webhook_runner is not None or not (YOUTUBE_WEBSUB_CALLBACK or TWITCH_EVENTSUB_CALLBACK):
+		return False
+	if YOUTUBE_WEBSUB_CALLBACK:
+		youtube_websub.bot = bot
+		youtube_websub.notifications_channel_id = notifications_channel_id
+	if TWITCH_EVENTSUB_CALLBACK:
+		twitch_eventsub.bot = bot
+		twitch_eventsub.notifications_channel_id = notifications_channel_id
+	app = _build_webhook_app()
+	runner = web.AppRunner(app, access_log=None)
+	await runner.setup()
+	try:
+		await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+	except Exception:
+		await runner.cleanup()
+		raise
+	_webhook_runner = runner
+	if YOUTUBE_WEBSUB_CALLBACK:
+		youtube_websub.active = True
+		if not maintain_youtube_websub.is_running():
+			maintain_youtube_websub.start()
+	if TWITCH_EVENTSUB_CALLBACK:
+		twitch_eventsub.active = True
+		if not maintain_twitch_eventsub.is_running():
+			maintain_twitch_eventsub.start()
+	return True
+
+async def stop_webhook_server():
+	"""Останавливает приём push-уведомлений и дожидается уже начатых объявлений"""
+	global _webhook_runner
+	youtube_websub.active = False
+	twitch_eventsub.active = False
+	if _webhook_runner is not None:
+		await _webhook_runner.cleanup()
+		_webhook_runner = None
+	pending = [*youtube_websub._tasks, *twitch_eventsub._tasks]
+	if twitch_eventsub._reconcile_task is not None and not twitch_eventsub._reconcile_task.done():
+		twitch_eventsub._reconcile_task.cancel()
+		pending.append(twitch_eventsub._reconcile_task)
+	if pending:
+		await asyncio.gather(*pending, return_exceptions=True)
+
 def start_tracking_tasks(bot: discord.Client, notifications_channel_id: int):
+	if not maintain_twitch_token.is_running():
+		maintain_twitch_token.start()
 	if not poll_twitch.is_running():
 		poll_twitch.start(bot, notifications_channel_id)
 	if not poll_youtube.is_running():
 		poll_youtube.start(bot, notifications_channel_id)
 
+async def stop_background_tasks():
+	"""
+	Останавливает все циклы tasks.loop и дожидается их завершения. Вызывается
+	при остановке бота до закрытия HTTP-сессии и хранилища состояния, чтобы
+	тик опроса не изменил уже закрытое хранилище.
+	"""
+	loops = (
+		check_forum_threads, check_conflicting_roles, maintain_twitch_token, poll_twitch, poll_youtube,
+		maintain_youtube_websub, maintain_twitch_eventsub,
+	)
+	running = []
+	for loop in loops:
+		task = loop.get_task()
+		if loop.is_running():
+			loop.cancel()
+		if task is not None and not task.done():
+			running.append(task)
+	if running:
+		await asyncio.gather(*running, return_exceptions=True)
+
 # --------------------------
 # Manage tracking lists
 # --------------------------
@@ -1076,6 +3629,7 @@ def add_twitch_channel(login: str):
         return False, "Такой Twitch-канал уже добавлен."
     data["twitch"].append(login_norm)
     save_tracking(data)
+    twitch_eventsub.schedule_reconcile()
     return True, f"Twitch-канал добавлен: {login_norm}"
 
 def remove_twitch_channel(login: str):
@@ -1088,15 +3642,14 @@ def remove_twitch_channel(login: str):
     notified = load_notified()
     notified.get("twitch", {}).pop(login_norm, None)
     save_notified(notified)
+    twitch_eventsub.schedule_reconcile()
     return True, f"Twitch-канал удалён: {login_norm}"
 
 def list_twitch_channels():
 	return load_tracking().get("twitch", [])
 
 async def add_youtube_channel(channel: str):
-	timeout = aiohttp.ClientTimeout(total=8)
-	async with aiohttp.ClientSession(timeout=timeout) as session:
-		cid = await _resolve_youtube_channel_id(session, channel)
+	cid = await _resolve_youtube_channel_id(get_http_session(), channel)
 	if not cid:
 		return False, "Укажите @handle или ссылку вида https://www.youtube.com/@handle"
 	data = await async_load_tracking()
@@ -1104,16 +3657,12 @@ async def add_youtube_channel(channel: str):
 		return False, "Канал уже добавлен."
 	data["youtube"].append(cid)
 	await async_save_tracking(data)
+	await youtube_websub.sync_channel(cid, subscribe=True)
 	return True, f"YouTube-канал добавлен: {cid}"
 
 async def remove_youtube_channel(channel: str):
-	timeout = aiohttp.ClientTimeout(total=8)
-	cid = None
-	try:
-		async with aiohttp.ClientSession(timeout=timeout) as session:
-			cid = await _resolve_youtube_channel_id(session, channel)
-	except Exception:
-		cid = None
+	# Только локально: channelId, ссылка /channel/UC... или handle из кэша
+	cid = await _resolve_youtube_channel_id(get_http_session(), channel, network=False)
 	data = await async_load_tracking()
 	target = cid or channel.strip()
 	if target in data["youtube"]:
@@ -1122,8 +3671,60 @@ async def remove_youtube_channel(channel: str):
 		notified = await async_load_notified()
 		notified.get("youtube", {}).pop(target, None)
 		await async_save_notified(notified)
+		await youtube_websub.sync_channel(target, subscribe=False)
 		return True, f"YouTube-канал удалён: {target}"
 	return False, "Такого YouTube-канала нет в списке."
 
 def list_youtube_channels():
-	return load_tracking().get("youtube", [])
\ No newline at end of file
+	return load_tracking().get("youtube", [])
+
+
+def _normalize_thread_url(url: str) -> str | None:
+	"""Приводит ссылку на тему к виду .../threads/<slug>.<id> (без страницы и якоря)"""
+	url = url.strip().split("#", 1)[0].split("?", 1)[0].rstrip("/")
+	url = re.sub(r"/page-\d+$", "", url)
+	if not re.fullmatch(r"https?://[^/\s]+/(?:[^\s]*/)?threads/[^/\s]+", url):
+		return None
+	return url
+
+def add_forum_thread(key: str, url: str, channel_id: int, prefix: str):
+	key_norm = key.strip().lower()
+	if not re.fullmatch(r"[a-z0-9_-]{2,32}", key_norm):
+		return False, "Некорректный ключ темы (латиница, цифры, _ и -, от 2 до 32 символов)."
+	threads = get_forum_threads()
+	if key_norm in threads or key_norm in _RESERVED_THREAD_KEYS:
+		return False, "Тема с таким ключом уже есть."
+	url_norm = _normalize_thread_url(url)
+	if not url_norm:
+		return False, "Укажите ссылку на тему вида https://forum.example.com/threads/name.123"
+	if any(cfg["url"] == url_norm for cfg in threads.values()):
+		return False, "Эта тема уже отслеживается."
+	prefix = prefix.strip() or "Новое сообщение:"
+	data = state_store.get("forum_threads")
+	data[key_norm] = {"url": url_norm, "channel_id": channel_id, "prefix": prefix, "state_field": "last_post_id"}
+	state_store.mark_dirty("forum_threads")
+	return True, f"Тема добавлена: {key_norm} → {url_norm}"
+
+def remove_forum_thread(key: str):
+	key_norm = key.strip().lower()
+	if key_norm in BUILTIN_FORUM_THREADS:
+		return False, "Встроенную тему удалить нельзя."
+	data = state_store.get("forum_threads")
+	cfg = data.pop(key_norm, None)
+	if cfg is None:
+		return False, "Такой темы нет в списке."
+	state_store.mark_dirty("forum_threads")
+	poll_scheduler.forget(f"forum:{key_norm}")
+	notified = load_notified()
+	if notified.pop(key_norm, None) is not None:
+		save_notified(notified)
+	if state_store.get("forum_state").get("last_pages", {}).pop(cfg["url"], None) is not None:
+		state_store.mark_dirty("forum_state")
+	# Только страницы этой темы: ".../threads/x.12" не должен задевать ".../threads/x.123"
+	base = cfg["url"].rstrip("/")
+	for page_url in [u for u in _page_cache if u.rstrip("/") == base or u.startswith(base + "/page-")]:
+		_page_cache.pop(page_url, None)
+	return True, f"Тема удалена: {key_norm}"
+
+def list_forum_threads():
+	return get_forum_threads()
@@ -0,0 +1,292 @@
+"""
+SQLite-хранилище состояния бота Genesis (опциональный бэкенд для StateStore)
+Включается переменной окружения STATE_BACKEND=sqlite.
+
+Вместо полной перезаписи channels.json / notified.json изменения пишутся
+построчными upsert'ами в режиме WAL, а каждое новое уведомление
+дополнительно попадает в таблицу истории — по ней handlers.was_notified_before
+не даёт повторно объявить стрим или видео, о котором уже сообщали.
+
+Перенос из JSON выполняется по секциям: перенесённая секция отмечается в meta,
+поэтому секции, добавленные позже (или пропущенные ручной миграцией), переносятся
+при следующем запуске, а уже перенесённые не перезаписываются старыми файлами.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger("genesis_bot")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS tracking (
+    platform TEXT NOT NULL,
+    channel  TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (platform, channel)
+);
+CREATE TABLE IF NOT EXISTS notified (
+    kind       TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    value      TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (kind, key)
+);
+CREATE TABLE IF NOT EXISTS notified_history (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind        TEXT NOT NULL,
+    key         TEXT NOT NULL,
+    value       TEXT,
+    notified_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_notified_history_kind_key ON notified_history (kind, key, notified_at);
+CREATE TABLE IF NOT EXISTS kv (
+    section TEXT NOT NULL,
+    key     TEXT NOT NULL,
+    value   TEXT,
+    PRIMARY KEY (section, key)
+);
+"""
+
+
+class SqliteStateBackend:
+    """
+    Бэкенд StateStore поверх SQLite.
+    Секция "tracking" хранится в таблице tracking, "notified" — в notified
+    (+ notified_history), любые другие секции — в kv по ключам верхнего уровня.
+    save() сравнивает данные с последним сохранённым снимком и пишет только разницу.
+    Объекты из load() и save() бэкенд хранит как снимок без копирования: StateStore
+    копирует результат load() и передаёт в save() собственный снимок данных.
+    История уведомлений держится в памяти (множество), чтобы was_notified не ходил
+    в базу из event loop.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        # Соединение используется из пула потоков, доступ сериализуется self._lock
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        # Последнее сохранённое состояние по секциям — основа для вычисления разницы
+        self._persisted = {}
+        # (kind, key, value в JSON) из notified_history; заполняется при load("notified")
+        self._history = set()
+
+    # ---------- чтение ----------
+
+    def load(self, section: str, default_data):
+        with self._lock:
+            if section == "tracking":
+                data = self._load_tracking()
+            elif section == "notified":
+                data = self._load_notified()
+                self._history = set(self._conn.execute("SELECT kind, key, value FROM notified_history"))
+            else:
+                data = self._load_kv(section)
+        if not data:
+            data = default_data
+        else:
+            for key, value in default_data.items():
+                data.setdefault(key, value)
+        self._persisted[section] = data
+        return data
+
+    def _load_tracking(self):
+        data = {}
+        rows = self._conn.execute("SELECT platform, channel FROM tracking ORDER BY platform, position")
+        for platform, channel in rows:
+            data.setdefault(platform, []).append(channel)
+        return data
+
+    def _load_notified(self):
+        data = {}
+        for kind, key, value in self._conn.execute("SELECT kind, key, value FROM notified"):
+            data.setdefault(kind, {})[key] = json.loads(value) if value is not None else None
+        return data
+
+    def _load_kv(self, section: str):
+        rows = self._conn.execute("SELECT key, value FROM kv WHERE section = ?", (section,))
+        return {key: json.loads(value) for key, value in rows}
+
+    # ---------- запись ----------
+
+    def save(self, section: str, data):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                history = self._save_section(section, data)
+        self._persisted[section] = data
+        self._history.update(history)
+
+    def _save_section(self, section: str, data) -> list:
+        """Пишет разницу секции в текущей транзакции; возвращает новые записи истории"""
+        previous = self._persisted.get(section, {})
+        if section == "tracking":
+            self._save_tracking(previous, data)
+        elif section == "notified":
+            return self._save_notified(previous, data)
+        else:
+            self._save_kv(section, previous, data)
+        return []
+
+    def _save_tracking(self, previous, data):
+        for platform in set(previous) - set(data):
+            self._conn.execute("DELETE FROM tracking WHERE platform = ?", (platform,))
+        for platform, channels in data.items():
+            old = previous.get(platform, [])
+            if old == channels:
+                continue
+            removed = set(old) - set(channels)
+            self._conn.executemany(
+                "DELETE FROM tracking WHERE platform = ? AND channel = ?",
+                [(platform, c) for c in removed],
+            )
+            old_positions = {c: i for i, c in enumerate(old)}
+            self._conn.executemany(
+                "INSERT INTO tracking (platform, channel, position) VALUES (?, ?, ?) "
+                "ON CONFLICT (platform, channel) DO UPDATE SET position = excluded.position",
+                [(platform, c, i) for i, c in enumerate(channels) if old_positions.get(c) != i],
+            )
+
+    def _save_notified(self, previous, data) -> list:
+        now = time.time()
+        history = []
+        for kind in set(previous) - set(data):
+            self._conn.execute("DELETE FROM notified WHERE kind = ?", (kind,))
+        for kind, values in data.items():
+            if not isinstance(values, dict):
+                continue
+            old = previous.get(kind, {})
+            removed = set(old) - set(values)
+            self._conn.executemany(
+                "DELETE FROM notified WHERE kind = ? AND key = ?",
+                [(kind, k) for k in removed],
+            )
+            changed = [(k, v) for k, v in values.items() if k not in old or old[k] != v]
+            self._conn.executemany(
+                "INSERT INTO notified (kind, key, value, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (kind, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                [(kind, k, json.dumps(v, ensure_ascii=False), now) for k, v in changed],
+            )
+            added = [(kind, k, json.dumps(v, ensure_ascii=False)) for k, v in changed if v is not None]
+            self._conn.executemany(
+                "INSERT INTO notified_history (kind, key, value, notified_at) VALUES (?, ?, ?, ?)",
+                [(*row, now) for row in added],
+            )
+            history.extend(added)
+        return history
+
+    def _save_kv(self, section: str, previous, data):
+        for key in set(previous) - set(data):
+            self._conn.execute("DELETE FROM kv WHERE section = ? AND key = ?", (section, key))
+        self._conn.executemany(
+            "INSERT INTO kv (section, key, value) VALUES (?, ?, ?) "
+            "ON CONFLICT (section, key) DO UPDATE SET value = excluded.value",
+            [
+                (section, k, json.dumps(v, ensure_ascii=False))
+                for k, v in data.items()
+                if k not in previous or previous[k] != v
+            ],
+        )
+
+    # ---------- история ----------
+
+    def was_notified(self, kind: str, key: str, value) -> bool:
+        """
+        Проверяет, уведомляли ли когда-либо об этом значении (ID стрима/видео/поста).
+        Вызывается из event loop, поэтому смотрит только в память, без запроса к базе и блокировки.
+        """
+        return (kind, key, json.dumps(value, ensure_ascii=False)) in self._history
+
+    # ---------- миграция ----------
+
+    def migrated_sections(self) -> set:
+        """Секции, уже перенесённые из JSON"""
+        with self._lock:
+            rows = self._conn.execute("SELECT key FROM meta WHERE key LIKE 'json_migrated:%'").fetchall()
+            done = {key.split(":", 1)[1] for (key,) in rows}
+            # Базы прежних версий отмечали перенос одним ключом json_migrated_at, даже если
+            # переносились не все секции: перенесёнными считаются только секции с данными
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated_at'").fetchone():
+                if self._conn.execute("SELECT 1 FROM tracking LIMIT 1").fetchone():
+                    done.add("tracking")
+                if self._conn.execute("SELECT 1 FROM notified LIMIT 1").fetchone():
+                    done.add("notified")
+                done.update(section for (section,) in self._conn.execute("SELECT DISTINCT section FROM kv"))
+        return done
+
+    def migrate_from_json(self, files: dict) -> dict:
+        """
+        Переносит данные из JSON-файлов (секция -> путь) в базу; уже перенесённые секции
+        пропускаются. Секция и отметка о её переносе пишутся одной транзакцией, так что
+        повторный запуск после сбоя не дублирует историю уведомлений.
+        Повреждённый файл откладывается в <файл>.corrupt (как в handlers.load_json),
+        секция остаётся пустой и получает значения по умолчанию.
+        Исходные файлы не удаляются и остаются резервной копией.
+        Возвращает количество перенесённых ключей по секциям.
+        """
+        counts = {}
+        done = self.migrated_sections()
+        for section, path in files.items():
+            if section in done:
+                continue
+            data = _read_json(path)
+            with self._lock:
+                with self._conn:
+                    self._conn.execute("BEGIN")
+                    if data:
+                        self._persisted[section] = {}
+                        history = self._save_section(section, data)
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                        (f"json_migrated:{section}", str(time.time())),
+                    )
+            if data:
+                self._persisted[section] = data
+                self._history.update(history)
+                counts[section] = sum(len(v) if isinstance(v, (dict, list)) else 1 for v in data.values())
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _read_json(path: str):
+    """Данные JSON-файла для переноса; None — файла нет или он повреждён (отложен в .corrupt)"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        corrupt_path = f"{path}.corrupt"
+        logger.error(f"❌ Повреждён JSON {path}: {e}. Копия сохранена в {corrupt_path}, секция не перенесена")
+        try:
+            os.replace(path, corrupt_path)
+        except OSError:
+            pass
+        return None
+    return data if isinstance(data, dict) else None
+
+
+if __name__ == "__main__":
+    # Ручная миграция: python state_sqlite.py [state.db]
+    import sys
+
+    from handlers import STATE_JSON_FILES
+
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.getenv("STATE_DB_FILE", "state.db")
+    backend = SqliteStateBackend(db_path)
+    result = backend.migrate_from_json(STATE_JSON_FILES)
+    backend.close()
+    print(f"Миграция в {db_path} завершена: {result}")
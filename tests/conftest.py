@@ -0,0 +1,36 @@
+"""
+Общие фикстуры: handlers импортируется из корня репозитория, состояние
+каждого теста хранится во временном каталоге.
+"""
+
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import handlers  # noqa: E402
+
+
+@pytest.fixture
+def state(tmp_path, monkeypatch):
+    """Свежий StateStore с JSON-файлами в tmp_path вместо общего handlers.state_store"""
+    files = {section: str(tmp_path / f"{section}.json") for section in handlers.state_store._defaults}
+    store = handlers.StateStore(handlers.state_store._defaults, lambda: handlers.JsonStateBackend(files))
+    monkeypatch.setattr(handlers, "state_store", store)
+    return store
+
+
+@pytest.fixture
+def notify_bot():
+    """Бот с одним каналом уведомлений, у которого есть все права; отправленное — в bot.sent"""
+    sent = []
+
+    async def send(*args, **kwargs):
+        sent.append((args, kwargs))
+
+    perms = types.SimpleNamespace(view_channel=True, send_messages=True, embed_links=True)
+    channel = types.SimpleNamespace(guild=types.SimpleNamespace(me=object()), send=send, permissions_for=lambda member: perms)
+    return types.SimpleNamespace(get_channel=lambda channel_id: channel, channel=channel, sent=sent)
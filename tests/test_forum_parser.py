@@ -0,0 +1,60 @@
+"""
+Разбор сохранённых страниц форума: все доступные бэкенды должны давать
+тот же результат, что и BeautifulSoup.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import forum_parser  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "forum")
+FIXTURES = sorted(name for name in os.listdir(FIXTURES_DIR) if name.endswith(".html"))
+BACKENDS = [name for name in forum_parser.PARSERS if name != "bs4" and forum_parser.is_available(name)]
+
+
+def load_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("fixture", FIXTURES)
+def test_backend_matches_bs4(backend, fixture):
+    html = load_fixture(fixture)
+    assert forum_parser.PARSERS[backend](html) == forum_parser.parse_page_bs4(html)
+
+
+@pytest.mark.parametrize("backend", BACKENDS + ["bs4"])
+def test_unclosed_tags_do_not_leak_signature(backend):
+    info = forum_parser.PARSERS[backend](load_fixture("unclosed_tags.html"))
+    assert [p["post_id"] for p in info["posts"]] == ["2001", "2002", "2003"]
+    assert info["posts"][0]["text"] == "one\ntwo\nx"
+    assert info["posts"][1]["text"] == "вложенный блок\nпункт без списка\nпосле блока"
+    assert info["posts"][2]["text"] == "a\nb\nc"
+
+
+@pytest.mark.parametrize("backend", BACKENDS + ["bs4"])
+def test_thread_page(backend):
+    info = forum_parser.PARSERS[backend](load_fixture("thread_page.html"))
+    assert info["last_page"] == 5
+    assert info["last_page_href"] == "/threads/postanovleniya.12/page-5"
+    assert info["post_count"] == 2
+    assert info["posts"][0]["post_id"] == "1001"
+    assert "Подпись user1" not in info["posts"][0]["text"]
+    assert "Текст постановления & пояснения." in info["posts"][0]["text"]
+    # Содержимое <script> внутри сообщения в текст не попадает
+    assert info["text"] == "Короткий ответ\nвторая строка"
+
+
+@pytest.mark.parametrize("backend", BACKENDS + ["bs4"])
+def test_post_without_message_content(backend):
+    info = forum_parser.PARSERS[backend](load_fixture("no_message_content.html"))
+    assert info["posts"] == [
+        {"post_id": "3001", "text": "Сообщение без .message-content\nи без id в атрибутах"},
+        {"post_id": "3002", "text": "Сообщение без .bbWrapper"},
+    ]
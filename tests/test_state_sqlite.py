@@ -0,0 +1,116 @@
+"""
+SQLite-бэкенд состояния: перенос из JSON по секциям, повреждённые файлы и
+история уведомлений.
+"""
+
+import json
+import sqlite3
+
+import handlers
+from state_sqlite import SqliteStateBackend
+
+
+def write_json(path, data):
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+
+
+def json_files(tmp_path) -> dict:
+    return {section: str(tmp_path / name) for section, name in handlers.STATE_JSON_FILES.items()}
+
+
+def history_rows(db_path) -> int:
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM notified_history").fetchone()[0]
+
+
+def test_all_sections_migrated(tmp_path):
+    files = json_files(tmp_path)
+    write_json(tmp_path / "channels.json", {"twitch": ["a"], "youtube": []})
+    write_json(tmp_path / "forum_threads.json", {"laws": {"url": "https://f/threads/x.1"}})
+    write_json(tmp_path / "twitch_state.json", {"eventsub": {"secret": "s"}})
+    backend = SqliteStateBackend(str(tmp_path / "state.db"))
+    counts = backend.migrate_from_json(files)
+    assert set(counts) == {"tracking", "forum_threads", "twitch_state"}
+    assert backend.migrated_sections() == set(files)
+    assert backend.load("forum_threads", {}) == {"laws": {"url": "https://f/threads/x.1"}}
+    assert backend.load("twitch_state", {})["eventsub"] == {"secret": "s"}
+    backend.close()
+
+
+def test_partial_migration_leaves_other_sections_pending(tmp_path):
+    files = json_files(tmp_path)
+    write_json(tmp_path / "channels.json", {"twitch": ["a"], "youtube": []})
+    write_json(tmp_path / "forum_state.json", {"last_pages": {"u": 3}})
+    db_path = str(tmp_path / "state.db")
+    backend = SqliteStateBackend(db_path)
+    backend.migrate_from_json({"tracking": files["tracking"]})
+    assert backend.migrated_sections() == {"tracking"}
+
+    # Следующий запуск переносит остальные секции, не трогая уже перенесённую
+    backend.save("tracking", {"twitch": ["a", "b"], "youtube": []})
+    backend.migrate_from_json(files)
+    assert backend.load("forum_state", {}) == {"last_pages": {"u": 3}}
+    assert backend.load("tracking", {})["twitch"] == ["a", "b"]
+    backend.close()
+
+
+def test_legacy_migration_marker_counts_only_sections_with_data(tmp_path):
+    files = json_files(tmp_path)
+    db_path = str(tmp_path / "state.db")
+    backend = SqliteStateBackend(db_path)
+    backend.save("tracking", {"twitch": ["a"], "youtube": []})
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated_at', '1')")
+    assert backend.migrated_sections() == {"tracking"}
+
+    write_json(tmp_path / "channels.json", {"twitch": ["stale"], "youtube": []})
+    write_json(tmp_path / "youtube_state.json", {"websub": {"secret": "w"}})
+    backend.migrate_from_json(files)
+    assert backend.load("tracking", {})["twitch"] == ["a"]
+    assert backend.load("youtube_state", {})["websub"] == {"secret": "w"}
+    backend.close()
+
+
+def test_corrupt_file_is_moved_aside(tmp_path):
+    files = json_files(tmp_path)
+    write_json(tmp_path / "notified.json", {"twitch": {"a": "s1"}})
+    (tmp_path / "channels.json").write_text('{"twitch": ["a"', encoding="utf-8")
+    db_path = str(tmp_path / "state.db")
+    backend = SqliteStateBackend(db_path)
+    counts = backend.migrate_from_json(files)
+    assert "tracking" not in counts and counts["notified"] == 1
+    assert (tmp_path / "channels.json.corrupt").exists()
+    assert not (tmp_path / "channels.json").exists()
+    assert backend.load("tracking", {"twitch": [], "youtube": []}) == {"twitch": [], "youtube": []}
+
+    # Повторный перенос ничего не переписывает и не дублирует историю
+    assert backend.migrate_from_json(files) == {}
+    assert history_rows(db_path) == 1
+    backend.close()
+
+
+def test_was_notified_uses_history(tmp_path):
+    db_path = str(tmp_path / "state.db")
+    backend = SqliteStateBackend(db_path)
+    backend.load("notified", {"twitch": {}})
+    backend.save("notified", {"twitch": {"a": "s1"}})
+    backend.save("notified", {"twitch": {"a": "s2"}})
+    assert backend.was_notified("twitch", "a", "s1")
+    assert backend.was_notified("twitch", "a", "s2")
+    assert not backend.was_notified("twitch", "a", "s3")
+    backend.close()
+
+    # После перезапуска история читается из базы при загрузке notified
+    backend = SqliteStateBackend(db_path)
+    backend.load("notified", {})
+    assert backend.was_notified("twitch", "a", "s1")
+    backend.close()
+
+
+def test_state_store_copies_loaded_data(tmp_path):
+    backend = SqliteStateBackend(str(tmp_path / "state.db"))
+    store = handlers.StateStore({"tracking": handlers._default_tracking}, lambda: backend)
+    store.get("tracking")["twitch"].append("a")
+    store.mark_dirty("tracking")
+    assert backend.load("tracking", {})["twitch"] == ["a"]
+    backend.close()
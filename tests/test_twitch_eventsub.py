@@ -0,0 +1,307 @@
+"""
+EventSub Twitch против мок-сервера Helix: подтверждение подписки (challenge),
+проверка подписи и возраста сообщений, отбрасывание повторов, отзыв подписки
+и сверка подписок (reconcile) со списком channels.json.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+import handlers
+
+CALLBACK_PATH = "/eventsub/twitch"
+USERS = {"user0": "1000", "user1": "1001", "user2": "1002"}
+
+
+def timestamp(delta: float = 0) -> str:
+    """Время в формате Twitch: RFC 3339 с наносекундами"""
+    moment = datetime.now(timezone.utc) + timedelta(seconds=delta)
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.%f") + "123Z"
+
+
+def signed_headers(secret: str, body: bytes, message_type: str, message_id: str | None = None, delta: float = 0) -> dict:
+    message_id = message_id or str(uuid.uuid4())
+    sent_at = timestamp(delta)
+    digest = hmac.new(secret.encode(), message_id.encode() + sent_at.encode() + body, hashlib.sha256).hexdigest()
+    return {
+        "Twitch-Eventsub-Message-Id": message_id,
+        "Twitch-Eventsub-Message-Timestamp": sent_at,
+        "Twitch-Eventsub-Message-Signature": f"sha256={digest}",
+        "Twitch-Eventsub-Message-Type": message_type,
+        "Content-Type": "application/json",
+    }
+
+
+class MockEventSub:
+    """Helix /users, /streams и /eventsub/subscriptions; новые подписки подтверждаются через колбэк"""
+
+    def __init__(self):
+        self.subscriptions = {}
+        self.live = {}
+        self.created = []
+        self.deleted = []
+        self._verifications = set()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/helix/users", self.users)
+        app.router.add_get("/helix/streams", self.streams)
+        app.router.add_get("/helix/eventsub/subscriptions", self.list)
+        app.router.add_post("/helix/eventsub/subscriptions", self.create)
+        app.router.add_delete("/helix/eventsub/subscriptions", self.delete)
+        return app
+
+    def add(self, user_id: str, callback: str, status: str = "enabled", secret: str = "secret") -> dict:
+        sub = {
+            "id": str(uuid.uuid4()),
+            "type": "stream.online",
+            "status": status,
+            "condition": {"broadcaster_user_id": user_id},
+            "transport": {"method": "webhook", "callback": callback, "secret": secret},
+        }
+        self.subscriptions[sub["id"]] = sub
+        return sub
+
+    def user_ids(self, status: str = "enabled") -> list:
+        return sorted(s["condition"]["broadcaster_user_id"] for s in self.subscriptions.values() if s["status"] == status)
+
+    async def users(self, request):
+        logins = request.query.getall("login", [])
+        return web.json_response({"data": [{"id": USERS[login], "login": login} for login in logins if login in USERS]})
+
+    async def streams(self, request):
+        logins = request.query.getall("user_login", [])
+        data = [{"id": self.live[login], "user_login": login, "title": f"Эфир {login}"} for login in logins if login in self.live]
+        return web.json_response({"data": data})
+
+    async def list(self, request):
+        # Постраничная выдача по одной подписке — проверяется обход pagination.cursor
+        subs = [s for s in self.subscriptions.values() if s["type"] == request.query.get("type")]
+        start = int(request.query.get("after", 0))
+        # Секрет транспорта Twitch в списке не возвращает
+        page = [dict(s, transport={"method": "webhook", "callback": s["transport"]["callback"]}) for s in subs[start:start + 1]]
+        pagination = {"cursor": str(start + 1)} if start + 1 < len(subs) else {}
+        return web.json_response({"data": page, "pagination": pagination})
+
+    async def create(self, request):
+        body = await request.json()
+        sub = self.add(body["condition"]["broadcaster_user_id"], body["transport"]["callback"],
+                       "webhook_callback_verification_pending", body["transport"]["secret"])
+        self.created.append(sub)
+        task = asyncio.create_task(self._verify(sub))
+        self._verifications.add(task)
+        task.add_done_callback(self._verifications.discard)
+        return web.json_response({"data": [sub]}, status=202)
+
+    async def delete(self, request):
+        self.deleted.append(request.query["id"])
+        return web.Response(status=204 if self.subscriptions.pop(request.query["id"], None) else 404)
+
+    async def _verify(self, sub: dict):
+        challenge = f"challenge-{sub['id']}"
+        body = json.dumps({"subscription": {"id": sub["id"], "type": sub["type"]}, "challenge": challenge}).encode()
+        headers = signed_headers(sub["transport"]["secret"], body, "webhook_callback_verification")
+        async with aiohttp.ClientSession() as session:
+            async with session.post(sub["transport"]["callback"], data=body, headers=headers) as resp:
+                ok = resp.status == 200 and await resp.text() == challenge
+        sub["status"] = "enabled" if ok else "webhook_callback_verification_failed"
+
+    async def settle(self):
+        while self._verifications:
+            await asyncio.gather(*self._verifications)
+
+
+@pytest.fixture
+def eventsub(state, notify_bot, monkeypatch):
+    sub = handlers.TwitchEventSub()
+    sub.active = True
+    sub.bot = notify_bot
+    sub.notifications_channel_id = 1
+    monkeypatch.setattr(handlers, "twitch_eventsub", sub)
+    monkeypatch.setattr(handlers, "TWITCH_EVENTSUB_SECRET", "")
+    monkeypatch.setattr(handlers, "twitch_rate_limiter", handlers.TwitchRateLimiter())
+
+    async def headers(session):
+        return {"Client-ID": "test", "Authorization": "Bearer test"}
+
+    monkeypatch.setattr(handlers, "_twitch_headers", headers)
+    state.set("tracking", {"twitch": ["user0", "user1", "nosuchuser"], "youtube": []})
+    return sub
+
+
+def run_with_mock(eventsub, monkeypatch, scenario):
+    """Поднимает колбэк бота и мок Helix, выполняет scenario(client, mock, session)"""
+
+    async def main():
+        mock = MockEventSub()
+        bot_app = web.Application()
+        bot_app.router.add_post(CALLBACK_PATH, eventsub.handle_webhook)
+        async with TestServer(mock.app()) as helix, TestClient(TestServer(bot_app)) as client:
+            monkeypatch.setattr(handlers, "TWITCH_API_BASE", str(helix.make_url("/helix")))
+            monkeypatch.setattr(handlers, "TWITCH_EVENTSUB_CALLBACK", str(client.make_url(CALLBACK_PATH)))
+            async with aiohttp.ClientSession() as session:
+                monkeypatch.setattr(handlers, "get_http_session", lambda: session)
+                await scenario(client, mock, session)
+                await mock.settle()
+                pending = [*eventsub._tasks, *([eventsub._reconcile_task] if eventsub._reconcile_task else [])]
+                await asyncio.gather(*pending)
+
+    asyncio.run(main())
+
+
+async def post(client, eventsub, payload: dict, message_type: str = "notification", **kwargs):
+    body = json.dumps(payload).encode()
+    headers = signed_headers(eventsub.secret(), body, message_type, **kwargs)
+    return await client.post(CALLBACK_PATH, data=body, headers=headers)
+
+
+def online(login: str, stream_id: str) -> dict:
+    return {
+        "subscription": {"id": "sub", "type": "stream.online", "status": "enabled"},
+        "event": {"id": stream_id, "broadcaster_user_id": USERS.get(login), "broadcaster_user_login": login, "type": "live"},
+    }
+
+
+def test_reconcile_creates_missing_subscriptions(eventsub, monkeypatch):
+    async def scenario(client, mock, session):
+        assert await eventsub.reconcile(session) == (2, 0)
+        await mock.settle()
+        assert mock.user_ids() == ["1000", "1001"]
+        assert {sub["transport"]["secret"] for sub in mock.created} == {eventsub.secret()}
+        assert eventsub.stats["verified"] == 2
+        # Повторная сверка ничего не меняет
+        assert await eventsub.reconcile(session) == (0, 0)
+        assert eventsub.subscriptions == 2
+
+    run_with_mock(eventsub, monkeypatch, scenario)
+
+
+def test_reconcile_deletes_stale_and_recreates_failed(eventsub, monkeypatch, state):
+    async def scenario(client, mock, session):
+        callback = handlers.TWITCH_EVENTSUB_CALLBACK
+        kept = mock.add("1000", callback)
+        failed = mock.add("1001", callback, status="authorization_revoked")
+        removed = mock.add("1002", callback)
+        foreign = mock.add("1002", "https://other.example.com/callback")
+        state.set("tracking", {"twitch": ["user0", "user1"], "youtube": []})
+
+        assert await eventsub.reconcile(session) == (1, 2)
+        await mock.settle()
+        assert sorted(mock.deleted) == sorted([failed["id"], removed["id"]])
+        assert kept["id"] in mock.subscriptions and foreign["id"] in mock.subscriptions
+        assert [sub["condition"]["broadcaster_user_id"] for sub in mock.created] == ["1001"]
+        assert mock.user_ids() == ["1000", "1001", "1002"]
+
+    run_with_mock(eventsub, monkeypatch, scenario)
+
+
+def test_challenge_reply(eventsub, monkeypatch):
+    async def scenario(client, mock, session):
+        payload = {"subscription": {"id": "sub", "type": "stream.online"}, "challenge": "pogchamp-kappa-360noscope"}
+        resp = await post(client, eventsub, payload, "webhook_callback_verification")
+        assert resp.status == 200
+        assert resp.content_type == "text/plain"
+        assert await resp.text() == "pogchamp-kappa-360noscope"
+
+    run_with_mock(eventsub, monkeypatch, scenario)
+
+
+@pytest.mark.parametrize("tamper", ["signature", "secret", "body", "missing"])
+def test_invalid_signature_is_rejected(eventsub, monkeypatch, notify_bot, tamper):
+    async def scenario(client, mock, session):
+        body = json.dumps(online("user0", "s1")).encode()
+        headers = signed_headers("other-secret" if tamper == "secret" else eventsub.secret(), body, "notification")
+        if tamper == "signature":
+            headers["Twitch-Eventsub-Message-Signature"] = "sha256=" + "0" * 64
+        elif tamper == "body":
+            body = body.replace(b"s1", b"s2")
+        elif tamper == "missing":
+            del headers["Twitch-Eventsub-Message-Signature"]
+        resp = await client.post(CALLBACK_PATH, data=body, headers=headers)
+        assert resp.status == 403
+
+    run_with_mock(eventsub, monkeypatch, scenario)
+    assert eventsub.stats["rejected"] == 1
+    assert eventsub.stats["notifications"] == 0
+    assert notify_bot.sent == []
+
+
+@pytest.mark.parametrize("delta, status", [
+    (-handlers.TWITCH_EVENTSUB_MAX_AGE - 60, 403),
+    (handlers.TWITCH_EVENTSUB_MAX_AGE + 60, 403),
+    (-handlers.TWITCH_EVENTSUB_MAX_AGE + 60, 204),
+])
+def test_message_age(eventsub, monkeypatch, delta, status):
+    async def scenario(client, mock, session):
+        resp = await post(client, eventsub, online("user2", "s1"), delta=delta)
+        assert resp.status == status
+
+    run_with_mock(eventsub, monkeypatch, scenario)
+
+
+def test_notification_announced_once_for_duplicate_message_ids(eventsub, monkeypatch, notify_bot):
+    async def scenario(client, mock, session):
+        mock.live["user0"] = "s1"
+        message_id = str(uuid.uuid4())
+        assert (await post(client, eventsub, online("user0", "s1"), message_id=message_id)).status == 204
+        assert (await post(client, eventsub, online("user0", "s1"), message_id=message_id)).status == 204
+        assert eventsub.stats["duplicates"] == 1
+        # Новый ID сообщения о том же эфире отсекает общая проверка дублей (_twitch_announce)
+        assert (await post(client, eventsub, online("user0", "s1"))).status == 204
+        # Логин не из channels.json не объявляется
+        assert (await post(client, eventsub, online("user2", "s9"))).status == 204
+
+    run_with_mock(eventsub, monkeypatch, scenario)
+    assert eventsub.stats["notifications"] == 3
+    assert len(notify_bot.sent) == 1
+    text = notify_bot.sent[0][0][0]
+    assert "https://twitch.tv/user0" in text and "Эфир user0" in text
+    assert handlers.state_store.get("notified")["twitch"]["user0"] == "s1"
+
+
+def test_revocation_schedules_reconcile(eventsub, monkeypatch):
+    calls = []
+    monkeypatch.setattr(eventsub, "schedule_reconcile", lambda *args, **kwargs: calls.append(args))
+
+    async def scenario(client, mock, session):
+        payload = {"subscription": {"id": "sub", "type": "stream.online", "status": "authorization_revoked"}}
+        message_id = str(uuid.uuid4())
+        assert (await post(client, eventsub, payload, "revocation", message_id=message_id)).status == 204
+        assert (await post(client, eventsub, payload, "revocation", message_id=message_id)).status == 204
+
+    run_with_mock(eventsub, monkeypatch, scenario)
+    assert eventsub.stats["revoked"] == 1
+    assert len(calls) == 1
+
+
+def test_scheduled_reconcile_restores_revoked_subscription(eventsub, monkeypatch):
+    async def scenario(client, mock, session):
+        callback = handlers.TWITCH_EVENTSUB_CALLBACK
+        mock.add("1000", callback)
+        revoked = mock.add("1001", callback, status="authorization_revoked")
+        eventsub.schedule_reconcile(delay=0)
+        # Повторный вызов, пока сверка ждёт, не создаёт вторую
+        first = eventsub._reconcile_task
+        eventsub.schedule_reconcile(delay=0)
+        assert eventsub._reconcile_task is first
+        await first
+        await mock.settle()
+        assert mock.deleted == [revoked["id"]]
+        assert mock.user_ids() == ["1000", "1001"]
+
+    run_with_mock(eventsub, monkeypatch, scenario)
+
+
+def test_schedule_reconcile_ignored_when_inactive(eventsub):
+    eventsub.active = False
+    eventsub.schedule_reconcile(delay=0)
+    assert eventsub._reconcile_task is None
@@ -0,0 +1,311 @@
+"""
+WebSub YouTube против фейкового хаба: подписка и подтверждение (hub.challenge),
+подписи X-Hub-Signature, разбор push и возврат к обычному опросу после
+истечения подписки.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import time
+from datetime import datetime, timezone
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+import handlers
+
+CHANNEL = "UC" + "0" * 21 + "1"
+OTHER = "UC" + "0" * 21 + "2"
+CALLBACK_PATH = "/websub/youtube"
+
+
+class FakeHub:
+    """Хаб WebSub: принимает запросы подписки и подтверждает их GET-запросом на колбэк"""
+
+    def __init__(self, lease_seconds: int = 3600):
+        self.lease_seconds = lease_seconds
+        self.requests = []
+        self.verifications = []
+
+    async def subscribe(self, request: web.Request) -> web.Response:
+        self.requests.append(dict(await request.post()))
+        return web.Response(status=202)
+
+    async def verify_all(self, challenge: str = "challenge-123"):
+        """Отправляет на колбэк подтверждение каждого принятого запроса"""
+        async with aiohttp.ClientSession() as session:
+            for data in self.requests:
+                params = {
+                    "hub.mode": data["hub.mode"],
+                    "hub.topic": data["hub.topic"],
+                    "hub.challenge": challenge,
+                    "hub.lease_seconds": str(self.lease_seconds),
+                }
+                async with session.get(data["hub.callback"], params=params) as resp:
+                    self.verifications.append((data["hub.mode"], resp.status, await resp.text()))
+        self.requests.clear()
+
+
+def atom(channel_id: str, video_id: str, published: str | None = None) -> bytes:
+    published = published or datetime.now(timezone.utc).isoformat()
+    return (
+        "<feed xmlns:yt='http://www.youtube.com/xml/schemas/2015' xmlns='http://www.w3.org/2005/Atom'>"
+        f"<entry><yt:videoId>{video_id}</yt:videoId><yt:channelId>{channel_id}</yt:channelId>"
+        f"<title>Видео {video_id}</title><published>{published}</published></entry></feed>"
+    ).encode()
+
+
+def sign(body: bytes, algorithm: str = "sha1", secret: str | None = None) -> str:
+    key = (secret or handlers.youtube_websub.secret()).encode()
+    return f"{algorithm}={hmac.new(key, body, getattr(hashlib, algorithm)).hexdigest()}"
+
+
+@pytest.fixture
+def websub(state, notify_bot, monkeypatch):
+    """Активный YouTubeWebSub с отслеживаемым CHANNEL; объявления записываются в announced"""
+    sub = handlers.YouTubeWebSub()
+    sub.active = True
+    sub.bot = notify_bot
+    sub.notifications_channel_id = 1
+    monkeypatch.setattr(handlers, "youtube_websub", sub)
+    monkeypatch.setattr(handlers, "YOUTUBE_WEBSUB_SECRET", "")
+    state.set("tracking", {"twitch": [], "youtube": [CHANNEL]})
+
+    announced = []
+
+    async def fake_announce(session, channel, candidates):
+        announced.extend(candidates)
+        return {"new": len(candidates), "sent": len(candidates)}
+
+    monkeypatch.setattr(handlers, "_youtube_announce", fake_announce)
+    monkeypatch.setattr(handlers, "get_http_session", lambda: None)
+    sub.announced = announced
+    return sub
+
+
+def run_with_servers(websub, monkeypatch, scenario):
+    """Поднимает колбэк бота и фейковый хаб, выполняет scenario(client, hub, session)"""
+
+    async def main():
+        hub = FakeHub()
+        hub_app = web.Application()
+        hub_app.router.add_post("/subscribe", hub.subscribe)
+        bot_app = web.Application()
+        bot_app.router.add_get(CALLBACK_PATH, websub.handle_verify)
+        bot_app.router.add_post(CALLBACK_PATH, websub.handle_push)
+        async with TestServer(hub_app) as hub_server, TestClient(TestServer(bot_app)) as client:
+            monkeypatch.setattr(handlers, "YOUTUBE_WEBSUB_HUB", str(hub_server.make_url("/subscribe")))
+            monkeypatch.setattr(handlers, "YOUTUBE_WEBSUB_CALLBACK", str(client.make_url(CALLBACK_PATH)))
+            async with aiohttp.ClientSession() as session:
+                await scenario(client, hub, session)
+                if websub._tasks:
+                    await asyncio.gather(*websub._tasks)
+
+    asyncio.run(main())
+
+
+def test_subscribe_and_verify_echoes_challenge(websub, monkeypatch):
+    async def scenario(client, hub, session):
+        assert await websub.maintain(session) == (1, 0)
+        request = hub.requests[0]
+        assert request["hub.mode"] == "subscribe"
+        assert request["hub.topic"].endswith(f"channel_id={CHANNEL}")
+        assert request["hub.secret"] == websub.secret()
+        assert request["hub.callback"] == handlers.YOUTUBE_WEBSUB_CALLBACK
+        # Пока хаб не подтвердил подписку, повторный запрос не отправляется
+        assert await websub.maintain(session) == (0, 0)
+
+        await hub.verify_all()
+        assert hub.verifications == [("subscribe", 200, "challenge-123")]
+        lease = websub._state()["leases"][CHANNEL]
+        assert lease["seconds"] == hub.lease_seconds
+        assert lease["expires"] > time.time()
+        assert await websub.maintain(session) == (0, 0)
+
+    run_with_servers(websub, monkeypatch, scenario)
+
+
+def test_verify_rejects_untracked_channel_and_missing_challenge(websub, monkeypatch):
+    async def scenario(client, hub, session):
+        topic = handlers.YOUTUBE_TOPIC_URL.format(OTHER)
+        resp = await client.get(CALLBACK_PATH, params={"hub.mode": "subscribe", "hub.topic": topic, "hub.challenge": "x"})
+        assert resp.status == 404
+        topic = handlers.YOUTUBE_TOPIC_URL.format(CHANNEL)
+        resp = await client.get(CALLBACK_PATH, params={"hub.mode": "subscribe", "hub.topic": topic})
+        assert resp.status == 404
+        assert websub._state()["leases"] == {}
+
+    run_with_servers(websub, monkeypatch, scenario)
+
+
+def test_unsubscribe_removed_channel_and_denied(websub, monkeypatch, state):
+    async def scenario(client, hub, session):
+        await websub.maintain(session)
+        await hub.verify_all()
+        state.set("tracking", {"twitch": [], "youtube": []})
+        assert await websub.maintain(session) == (0, 1)
+        assert hub.requests[0]["hub.mode"] == "unsubscribe"
+        assert "hub.secret" not in hub.requests[0]
+        await hub.verify_all()
+        assert hub.verifications[-1] == ("unsubscribe", 200, "challenge-123")
+        assert websub._state()["leases"] == {}
+
+        state.set("tracking", {"twitch": [], "youtube": [CHANNEL]})
+        websub._state()["leases"][CHANNEL] = {"expires": time.time() + 3600, "seconds": 3600}
+        topic = handlers.YOUTUBE_TOPIC_URL.format(CHANNEL)
+        resp = await client.get(CALLBACK_PATH, params={"hub.mode": "denied", "hub.topic": topic, "hub.reason": "nope"})
+        assert resp.status == 200
+        assert websub._state()["leases"] == {}
+
+    run_with_servers(websub, monkeypatch, scenario)
+
+
+@pytest.mark.parametrize("algorithm", ["sha1", "sha256"])
+def test_signed_push_is_announced(websub, monkeypatch, algorithm):
+    async def scenario(client, hub, session):
+        body = atom(CHANNEL, "vid1")
+        resp = await client.post(CALLBACK_PATH, data=body, headers={"X-Hub-Signature": sign(body, algorithm)})
+        assert resp.status == 202
+
+    run_with_servers(websub, monkeypatch, scenario)
+    assert [(cid, video["video_id"]) for cid, video in websub.announced] == [(CHANNEL, "vid1")]
+    assert websub.stats["pushes"] == 1
+
+
+@pytest.mark.parametrize("headers", [
+    {"X-Hub-Signature": "sha1=" + "0" * 40},
+    {},
+    {"X-Hub-Signature": "md5=abc"},
+    {"X-Hub-Signature": "sha1="},
+], ids=["bad", "missing", "unknown-algorithm", "empty-digest"])
+def test_push_with_invalid_signature_is_ignored(websub, monkeypatch, headers):
+    async def scenario(client, hub, session):
+        resp = await client.post(CALLBACK_PATH, data=atom(CHANNEL, "vid1"), headers=headers)
+        # По спецификации хаб получает 2xx, но содержимое не используется
+        assert resp.status == 202
+
+    run_with_servers(websub, monkeypatch, scenario)
+    assert websub.announced == []
+    assert websub.stats["rejected"] == 1
+
+
+def test_push_signed_with_other_secret_is_ignored(websub, monkeypatch):
+    async def scenario(client, hub, session):
+        body = atom(CHANNEL, "vid1")
+        resp = await client.post(CALLBACK_PATH, data=body, headers={"X-Hub-Signature": sign(body, secret="other")})
+        assert resp.status == 202
+
+    run_with_servers(websub, monkeypatch, scenario)
+    assert websub.announced == []
+
+
+@pytest.mark.parametrize("body", [
+    b"<feed xmlns='http://www.w3.org/2005/Atom'><entry>",
+    b"not xml at all",
+    b"",
+], ids=["truncated", "text", "empty"])
+def test_malformed_push_is_rejected(websub, monkeypatch, body):
+    async def scenario(client, hub, session):
+        resp = await client.post(CALLBACK_PATH, data=body, headers={"X-Hub-Signature": sign(body)})
+        assert resp.status == 400
+
+    run_with_servers(websub, monkeypatch, scenario)
+    assert websub.announced == []
+    assert websub.stats["pushes"] == 0
+
+
+def test_push_filters_untracked_old_and_incomplete_entries(websub, monkeypatch):
+    old = "2020-01-01T00:00:00+00:00"
+    body = (
+        "<feed xmlns:yt='http://www.youtube.com/xml/schemas/2015' xmlns='http://www.w3.org/2005/Atom'>"
+        f"<entry><yt:videoId>old</yt:videoId><yt:channelId>{CHANNEL}</yt:channelId><published>{old}</published></entry>"
+        f"<entry><yt:videoId>foreign</yt:videoId><yt:channelId>{OTHER}</yt:channelId></entry>"
+        f"<entry><yt:channelId>{CHANNEL}</yt:channelId><title>без videoId</title></entry>"
+        "<at:deleted-entry xmlns:at='http://purl.org/atompub/tombstones/1.0' ref='yt:video:gone'/>"
+        "</feed>"
+    ).encode()
+
+    async def scenario(client, hub, session):
+        resp = await client.post(CALLBACK_PATH, data=body, headers={"X-Hub-Signature": sign(body, "sha256")})
+        assert resp.status == 202
+
+    run_with_servers(websub, monkeypatch, scenario)
+    assert websub.announced == []
+    assert websub.stats["pushes"] == 1
+
+
+def test_polling_falls_back_after_lease_expires(websub, monkeypatch):
+    base = handlers.POLL_INTERVALS["youtube"][0]
+    leases = websub._state()["leases"]
+    assert handlers._youtube_poll_intervals()[0] == base
+
+    leases[CHANNEL] = {"expires": time.time() + 3600, "seconds": 3600}
+    assert handlers._youtube_poll_intervals()[0] == handlers.YOUTUBE_WEBSUB_POLL_SECONDS
+
+    scheduler = handlers.PollScheduler(jitter=0)
+    source = scheduler.register("youtube", *handlers._youtube_poll_intervals())
+    source["last_run"] = time.time()
+    source["next_run"] = source["last_run"] + handlers.YOUTUBE_WEBSUB_POLL_SECONDS
+
+    # Хаб не продлил подписку — опрос сразу возвращается к обычному интервалу
+    leases[CHANNEL]["expires"] = time.time() - 1
+    assert handlers._youtube_poll_intervals()[0] == base
+    scheduler.register("youtube", *handlers._youtube_poll_intervals())
+    assert source["interval"] == base
+    assert source["next_run"] == pytest.approx(source["last_run"] + base)
+
+    async def scenario(client, hub, session):
+        # Истёкшая подписка запрашивается заново
+        assert await websub.maintain(session) == (1, 0)
+        await hub.verify_all()
+        assert handlers._youtube_poll_intervals()[0] == handlers.YOUTUBE_WEBSUB_POLL_SECONDS
+
+    run_with_servers(websub, monkeypatch, scenario)
+
+
+def test_polling_not_relaxed_when_a_channel_has_no_lease(websub, state):
+    websub._state()["leases"][CHANNEL] = {"expires": time.time() + 3600, "seconds": 3600}
+    state.set("tracking", {"twitch": [], "youtube": [CHANNEL, OTHER]})
+    assert handlers._youtube_poll_intervals()[0] == handlers.POLL_INTERVALS["youtube"][0]
+    websub.active = False
+    state.set("tracking", {"twitch": [], "youtube": [CHANNEL]})
+    assert handlers._youtube_poll_intervals()[0] == handlers.POLL_INTERVALS["youtube"][0]
+
+
+@pytest.mark.parametrize("twitch_callback", ["https://bot.example.com", "https://bot.example.com/websub/youtube"])
+def test_shared_callback_path_dispatches_by_headers(websub, monkeypatch, twitch_callback):
+    youtube_callback = twitch_callback if twitch_callback.endswith(CALLBACK_PATH) else "https://bot.example.com/"
+    monkeypatch.setattr(handlers, "YOUTUBE_WEBSUB_CALLBACK", youtube_callback)
+    monkeypatch.setattr(handlers, "TWITCH_EVENTSUB_CALLBACK", twitch_callback)
+    twitch_calls = []
+
+    async def twitch_webhook(request):
+        twitch_calls.append(request.headers["Twitch-Eventsub-Message-Type"])
+        return web.Response(status=204)
+
+    monkeypatch.setattr(handlers.twitch_eventsub, "handle_webhook", twitch_webhook)
+    path = handlers.urlparse(twitch_callback).path or "/"
+
+    async def main():
+        async with TestClient(TestServer(handlers._build_webhook_app())) as client:
+            body = atom(CHANNEL, "vid1")
+            resp = await client.post(path, data=body, headers={"X-Hub-Signature": sign(body)})
+            assert resp.status == 202
+            resp = await client.post(path, data=b"{}", headers={"Twitch-Eventsub-Message-Type": "notification"})
+            assert resp.status == 204
+            if websub._tasks:
+                await asyncio.gather(*websub._tasks)
+
+    asyncio.run(main())
+    assert twitch_calls == ["notification"]
+    assert [video["video_id"] for _, video in websub.announced] == ["vid1"]
+
+
+def test_separate_callback_paths(websub, monkeypatch):
+    monkeypatch.setattr(handlers, "YOUTUBE_WEBSUB_CALLBACK", "https://bot.example.com/websub/youtube")
+    monkeypatch.setattr(handlers, "TWITCH_EVENTSUB_CALLBACK", "https://bot.example.com/eventsub/twitch")
+    routes = {(r.method, r.resource.canonical) for r in handlers._build_webhook_app().router.routes()}
+    assert {("GET", "/websub/youtube"), ("POST", "/websub/youtube"), ("POST", "/eventsub/twitch")} <= routes